@@ -0,0 +1,158 @@
+"""DynamoDB call budgets per endpoint, checked against the in-memory stand-ins.
+
+Usage: python -m benchmarks.call_budgets [--show]
+
+Each endpoint is called once, with the caller's user already cached but
+the issuer and badge caches empty, and its trace checked with
+core.tracing.expect_calls. Exits non-zero when any endpoint makes more
+calls, scans or repeated reads than its budget. The budgets pin today's
+counts: lower one when a change removes calls, so the calls don't come
+back. --show prints every endpoint's trace.
+"""
+# Standard library
+import argparse
+import asyncio
+import json
+import os
+import sys
+from typing import NamedTuple
+
+# Package
+import benchmarks.env  # noqa: F401
+
+os.environ.setdefault("EMAIL_SINK", "memory")
+os.environ.setdefault("JOB_STORE", "dynamodb")
+
+from benchmarks.standins import install  # noqa: E402
+
+
+class Budget(NamedTuple):
+    calls: int
+    scans: int = 0
+    repeats: int = 0
+
+
+# endpoint -> budget. The comments say where the calls go.
+BUDGETS = {
+    # owner_id-index query
+    "GET /issuers/": Budget(1),
+    # get_item
+    "GET /issuers/{issuer_id}": Budget(1),
+    # get_item, name-index query, update_item
+    "PUT /issuers/{issuer_id}": Budget(3),
+    # issuer get_item, issuer_id-index query
+    "GET /issuers/{issuer_id}/badges": Budget(2),
+    # issuer and badge batch gets, made concurrently
+    "GET /issuers/{issuer_id}/badges/{badge_id}": Budget(2),
+    # issuer get_item, badge name-index query, put_item, get_item
+    "POST /issuers/{issuer_id}/badges": Budget(4),
+    # issuer get_item, badge name-index query, update_item
+    "PUT /issuers/{issuer_id}/badges/{badge_id}": Budget(3),
+    # issuer get_item, issuer_id-index query
+    "GET /issuers/{issuer_id}/certs": Budget(2),
+    # issuer and badge batch gets, job payload batch write, job put_item
+    "POST /issuers/{issuer_id}/badges/{badge_id}/issue": Budget(4),
+    # issuer get_item (then served from the profile cache)
+    "GET /issuers/{issuer_id}/profile": Budget(1),
+    # issuer get_item and revocations query, made concurrently (then
+    # served from the revocation index)
+    "GET /issuers/{issuer_id}/revocations": Budget(2),
+    # invite scan by nonce, address update, issuer and badges batch gets,
+    # then per badge a cert put_item and cert count update, invite delete
+    "POST /issuers/{issuer_id}/intro": Budget(9, scans=1),
+    # scan page
+    "GET /recipients/": Budget(1, scans=1),
+    # get_item
+    "GET /recipients/{recipient_id}": Budget(1),
+    # recipient get_item, certs query
+    "GET /recipients/{recipient_id}/certs": Budget(2),
+}
+
+
+async def main(args):
+    install()
+    from benchmarks.datasets import Scale, seed
+    from benchmarks.load import AppClient, bearer
+    from core.tracing import expect_calls
+    from db.badges import badge_cache
+    from db.issuers import issuer_cache
+    from db.invites import InvitesDB
+    from main import app
+    from models.invites import InviteInCreate
+
+    dataset = await seed(Scale(issuers=2, badges_per_issuer=2, recipients=20, revocations_per_issuer=5, managers=1))
+    issuer, badge = dataset.issuers[0], dataset.badges[dataset.issuers[0].id][0]
+    recipient = dataset.recipients[0]
+    invite = await InvitesDB().create(InviteInCreate(issuer_id=issuer.id, recipient_id=recipient.id, badge_id=badge.id))
+    await InvitesDB().add_badge(invite.id, dataset.badges[issuer.id][1].id)
+
+    headers = {**bearer(dataset.owners[0]), "Content-Type": "application/json"}
+    issuer_in = {
+        "name": issuer.name, "email": issuer.email, "url": issuer.url, "image": issuer.image,
+        "owner_id": issuer.owner_id, "key": {"public_key": "mpublic", "private_key": "private"}
+    }
+    badge_in = {
+        "issuer_id": issuer.id, "name": "New Badge", "description": "New.", "criteria": {"narrative": "Do it."},
+        "image": "https://example.edu/new.png", "signatureLines": [], "template": 1
+    }
+    calls = [
+        ("GET /issuers/", "GET", "/issuers/", None),
+        ("GET /issuers/{issuer_id}", "GET", f"/issuers/{issuer.id}", None),
+        ("PUT /issuers/{issuer_id}", "PUT", f"/issuers/{issuer.id}", issuer_in),
+        ("GET /issuers/{issuer_id}/badges", "GET", f"/issuers/{issuer.id}/badges", None),
+        ("GET /issuers/{issuer_id}/badges/{badge_id}", "GET", f"/issuers/{issuer.id}/badges/{badge.id}", None),
+        ("POST /issuers/{issuer_id}/badges", "POST", f"/issuers/{issuer.id}/badges", badge_in),
+        (
+            "PUT /issuers/{issuer_id}/badges/{badge_id}", "PUT",
+            f"/issuers/{issuer.id}/badges/{badge.id}", {**badge_in, "name": "Renamed Badge"}
+        ),
+        ("GET /issuers/{issuer_id}/certs", "GET", f"/issuers/{issuer.id}/certs", None),
+        (
+            "POST /issuers/{issuer_id}/badges/{badge_id}/issue", "POST",
+            f"/issuers/{issuer.id}/badges/{badge.id}/issue",
+            [{"name": recipient.name, "email": recipient.email}]
+        ),
+        ("GET /issuers/{issuer_id}/profile", "GET", f"/issuers/{issuer.id}/profile", None),
+        ("GET /issuers/{issuer_id}/revocations", "GET", f"/issuers/{issuer.id}/revocations", None),
+        (
+            "POST /issuers/{issuer_id}/intro", "POST", f"/issuers/{issuer.id}/intro",
+            {"nonce": invite.nonce, "bitcoinAddress": "mnewaddress"}
+        ),
+        ("GET /recipients/", "GET", "/recipients/", None),
+        ("GET /recipients/{recipient_id}", "GET", f"/recipients/{recipient.id}", None),
+        ("GET /recipients/{recipient_id}/certs", "GET", f"/recipients/{recipient.id}/certs", None),
+    ]
+
+    client = AppClient(app)
+    # The job workers start here, outside any trace, so the jobs' own calls
+    # aren't counted against the endpoint that submitted them.
+    await client.startup()
+    failures = 0
+    try:
+        # Puts the owner in the user cache.
+        await client.request("GET", "/issuers/", headers=headers)
+        for name, method, url, body in calls:
+            budget = BUDGETS[name]
+            body = json.dumps(body).encode() if body is not None else b""
+            issuer_cache.cache.clear()
+            badge_cache.cache.clear()
+            try:
+                with expect_calls(budget.calls, scans=budget.scans, repeats=budget.repeats) as trace:
+                    response = await client.request(method, url, headers=headers, body=body)
+            except AssertionError as error:
+                failures += 1
+                print(f"OVER BUDGET {name}: {error}")
+                continue
+            status = "ok" if response.status < 400 else f"HTTP {response.status}"
+            print(f"{name:<52} {trace.count('dynamodb'):>3}/{budget.calls} calls  {status}")
+            if args.show:
+                print(trace.format())
+    finally:
+        await client.shutdown()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--show", action="store_true")
+    sys.exit(asyncio.get_event_loop().run_until_complete(main(parser.parse_args())))
@@ -0,0 +1,84 @@
+"""Cert canonicalization throughput, inline vs. on the hashing pool.
+
+Usage: python -m benchmarks.canonicalize [--certs 2000] [--workers 4]
+
+Uses the contexts committed under services/contexts/.
+"""
+# Standard library
+import argparse
+import asyncio
+import time
+import uuid
+
+# Package
+import benchmarks.env  # noqa: F401
+from services.canonical import CertHasher, hash_certs
+
+
+def sample_cert(number: int):
+    issuer_id = "4b0d2a4e-0bd0-4d5c-9c5e-3a51c5a7a2f0"
+    return {
+        "@context": ["https://w3id.org/openbadges/v2", "https://w3id.org/blockcerts/v2"],
+        "type": "Assertion",
+        "id": f"urn:uuid:{uuid.uuid4()}",
+        "issuedOn": "2020-02-01T09:30:00-08:00",
+        "recipient": {"identity": f"recipient{number}@example.edu", "type": "email", "hashed": False},
+        "recipientProfile": {
+            "type": ["RecipientProfile", "Extension"],
+            "name": f"Recipient {number}",
+            "publicKey": "ecdsa-koblitz-pubkey:mtr98kany9G1XYNU74pRnfBQmaCg2FZLmc"
+        },
+        "verification": {
+            "type": ["MerkleProofVerification2017", "Extension"],
+            "publicKey": "ecdsa-koblitz-pubkey:msBCHdwaQ7N2ypBYupkp6uNxtr9Pg76imj"
+        },
+        "badge": {
+            "type": "BadgeClass",
+            "id": "urn:uuid:82a4c9f2-3588-457b-80ea-da695571b8fc",
+            "name": "Data Science Fundamentals",
+            "description": "Completed the data science fundamentals course.",
+            "image": "https://example.edu/badge.png",
+            "criteria": {"narrative": "Pass every module."},
+            "issuer": {
+                "type": "Profile",
+                "id": f"https://example.edu/issuers/{issuer_id}/profile",
+                "name": "Example University",
+                "url": "https://example.edu",
+                "email": "badges@example.edu",
+                "image": "https://example.edu/issuer.png",
+                "revocationList": f"https://example.edu/issuers/{issuer_id}/revocations"
+            },
+            "signatureLines": [{
+                "type": ["SignatureLine", "Extension"],
+                "jobTitle": "Registrar",
+                "image": "https://example.edu/signature.png",
+                "name": "A. Registrar"
+            }]
+        }
+    }
+
+
+async def main(args):
+    certs = [sample_cert(number) for number in range(args.certs)]
+
+    started = time.perf_counter()
+    hash_certs(certs)
+    inline = time.perf_counter() - started
+
+    hasher = CertHasher(workers=args.workers)
+    # Warm the pool so process start-up and context loading aren't counted.
+    await hasher.hash_many(certs[:args.workers])
+    started = time.perf_counter()
+    await hasher.hash_many(certs)
+    pooled = time.perf_counter() - started
+    hasher.shutdown()
+
+    print(f"{'inline':>12}: {args.certs / inline:8.1f} certs/s")
+    print(f"{f'process x{args.workers}':>12}: {args.certs / pooled:8.1f} certs/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--certs", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=4)
+    asyncio.get_event_loop().run_until_complete(main(parser.parse_args()))
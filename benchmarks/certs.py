@@ -0,0 +1,92 @@
+"""Unsigned cert generation for one badge issued to a batch of recipients.
+
+Usage: python -m benchmarks.certs [--recipients 10000]
+
+"per cert" builds and json-encodes the whole assertion for every
+recipient, the way issue_cert used to. "template" serializes the issuer
+and badge once and splices in each recipient's fields.
+"""
+# Standard library
+import argparse
+import datetime
+import json
+import time
+
+# Package
+import benchmarks.env  # noqa: F401
+from models.badges import BadgeInDB
+from models.issuers import IssuerInDB
+from models.recipients import RecipientInDB
+from services.cert import CertTemplate, generate_unsigned_cert
+
+
+ISSUER_ID = "4b0d2a4e-0bd0-4d5c-9c5e-3a51c5a7a2f0"
+
+
+def sample_issuer():
+    return IssuerInDB(
+        id=ISSUER_ID,
+        name="Example University",
+        email="badges@example.edu",
+        url="https://example.edu",
+        image="https://example.edu/issuer.png",
+        owner_id="owner",
+        revocations=[],
+        keys=[{
+            "public_key": "msBCHdwaQ7N2ypBYupkp6uNxtr9Pg76imj",
+            "private_key": "not-a-real-key",
+            "date_created": datetime.datetime(2020, 1, 1)
+        }]
+    )
+
+
+def sample_badge():
+    return BadgeInDB(
+        id="82a4c9f2-3588-457b-80ea-da695571b8fc",
+        issuer_id=ISSUER_ID,
+        name="Data Science Fundamentals",
+        description="Completed the data science fundamentals course.",
+        criteria={"narrative": "Pass every module."},
+        image="https://example.edu/badge.png",
+        signatureLines=[{"name": "A. Registrar", "image": "https://example.edu/signature.png", "jobTitle": "Registrar"}],
+        template=1
+    )
+
+
+def sample_recipients(count: int):
+    return [
+        RecipientInDB(
+            id=str(number),
+            name=f"Recipient {number}",
+            email=f"recipient{number}@example.edu",
+            addresses={ISSUER_ID: "mtr98kany9G1XYNU74pRnfBQmaCg2FZLmc"}
+        )
+        for number in range(count)
+    ]
+
+
+def main(args):
+    issuer, badge = sample_issuer(), sample_badge()
+    recipients = sample_recipients(args.recipients)
+
+    def per_cert():
+        for recipient in recipients:
+            _, cert = generate_unsigned_cert(issuer, recipient, badge)
+            json.dumps(cert).encode()
+
+    def template():
+        cert_template = CertTemplate(issuer, badge)
+        for recipient in recipients:
+            cert_template.render(recipient)
+
+    for name, generate in (("per cert", per_cert), ("template", template)):
+        started = time.perf_counter()
+        generate()
+        elapsed = time.perf_counter() - started
+        print(f"{name:>9}: {args.recipients / elapsed:10.1f} certs/s ({elapsed:.2f}s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--recipients", type=int, default=10000)
+    main(parser.parse_args())
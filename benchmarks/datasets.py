@@ -0,0 +1,150 @@
+"""Seeded datasets for the load scenarios.
+
+Imports the db layer, so import this only after benchmarks.standins.install().
+Items are written through the db classes' own tables, in the shapes their
+create methods use, and the same seed always gives the same data.
+"""
+# Standard library
+import random
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, NamedTuple
+
+# Package
+from db.badges import BadgesDB
+from db.certs import CertsDB
+from db.issuers import IssuersDB
+from db.recipients import RecipientsDB
+from db.revocations import RevocationsDB
+from db.users import UsersDB
+from models.badges import BadgeInDB
+from models.certs import CertInDB
+from models.issuers import IssuerInDB
+from models.recipients import RecipientInDB
+from models.revocations import RevocationIn
+from models.users import UserInDB, UserRole
+from services.cert import cert_url
+from services.security import get_password_hash
+
+
+PASSWORD = "correct horse battery staple"
+
+
+class Scale(NamedTuple):
+    issuers: int = 10
+    badges_per_issuer: int = 5
+    recipients: int = 10000
+    certs_per_recipient: int = 2
+    revocations_per_issuer: int = 50
+    managers: int = 100
+
+
+class Dataset(NamedTuple):
+    admin: UserInDB
+    # owners[n] owns issuers[n].
+    owners: List[UserInDB]
+    managers: List[UserInDB]
+    issuers: List[IssuerInDB]
+    badges: Dict[str, List[BadgeInDB]]
+    # Every recipient has an address for issuers[0], so issuing its badges
+    # issues certs rather than sending invites.
+    recipients: List[RecipientInDB]
+
+
+async def seed(scale: Scale = Scale(), seed: int = 0) -> Dataset:
+    rng = random.Random(seed)
+
+    def new_id():
+        return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+    def address():
+        return "m" + "".join(rng.choice("123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz") for _ in range(33))
+
+    now = datetime(2020, 2, 1, 12)
+    # One hash for everyone: hashing thousands of passwords would dominate seeding.
+    hashed_password = get_password_hash(PASSWORD)
+
+    def user(email, role):
+        return UserInDB(id=new_id(), email=email, role=role, hashed_password=hashed_password)
+
+    admin = user("admin@example.edu", UserRole.ADMIN)
+    owners = [user(f"owner{number}@example.edu", UserRole.OWNER) for number in range(scale.issuers)]
+    managers = [user(f"manager{number}@example.edu", UserRole.MANAGER) for number in range(scale.managers)]
+    await UsersDB.table.batch_put([member.dict() for member in [admin, *owners, *managers]])
+
+    issuer_items = [
+        {
+            "id": new_id(),
+            "owner_id": owner.id,
+            "name": f"Example College {number}",
+            "url": f"https://college{number}.example.edu",
+            "email": f"badges@college{number}.example.edu",
+            "image": f"https://college{number}.example.edu/issuer.png",
+            "keys": [{
+                "public_key": address(),
+                "private_key": "not-a-real-key",
+                "date_created": str(now - timedelta(days=365))
+            }],
+            "revocations": []
+        }
+        for number, owner in enumerate(owners)
+    ]
+    await IssuersDB.table.batch_put(issuer_items)
+    issuers = [IssuerInDB(**item) for item in issuer_items]
+
+    badges = {
+        issuer.id: [
+            BadgeInDB(
+                id=new_id(),
+                issuer_id=issuer.id,
+                name=f"{issuer.name} Badge {number}",
+                description="Completed every module of the course.",
+                criteria={"narrative": "Pass every module."},
+                image=f"{issuer.url}/badge{number}.png",
+                signatureLines=[{"name": "A. Registrar", "image": f"{issuer.url}/signature.png", "jobTitle": "Registrar"}],
+                template=1
+            )
+            for number in range(scale.badges_per_issuer)
+        ]
+        for issuer in issuers
+    }
+    await BadgesDB.table.batch_put([badge.dict() for issued in badges.values() for badge in issued])
+
+    recipients = []
+    for number in range(scale.recipients):
+        home = issuers[number % len(issuers)]
+        recipients.append(RecipientInDB(
+            id=new_id(),
+            name=f"Recipient {number}",
+            email=f"recipient{number}@example.edu",
+            addresses={issuers[0].id: address(), home.id: address()},
+            cert_count=scale.certs_per_recipient
+        ))
+    await RecipientsDB.table.batch_put([recipient.dict() for recipient in recipients])
+
+    certs = []
+    for number, recipient in enumerate(recipients):
+        home = issuers[number % len(issuers)]
+        for _ in range(scale.certs_per_recipient):
+            badge = rng.choice(badges[home.id])
+            cert_id = new_id()
+            issued_at = now - timedelta(minutes=rng.randrange(365 * 24 * 60))
+            certs.append(CertInDB(
+                recipient_id=recipient.id,
+                cert_id=cert_id,
+                url=cert_url(home.id, issued_at.strftime("%Y%m%d"), cert_id),
+                issuer_id=home.id,
+                badge_id=badge.id,
+                issued_at=issued_at
+            ))
+    await CertsDB().create_certs(certs)
+
+    for issuer in issuers:
+        issued = [cert for cert in certs if cert.issuer_id == issuer.id]
+        revoked = rng.sample(issued, min(scale.revocations_per_issuer, len(issued)))
+        await RevocationsDB().create_revocations(
+            issuer.id,
+            [RevocationIn(cert_id=cert.cert_id, reason="Issued in error") for cert in revoked]
+        )
+
+    return Dataset(admin, owners, managers, issuers, badges, recipients)
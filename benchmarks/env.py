@@ -0,0 +1,12 @@
+# Standard library
+import os
+
+
+# core.config requires these; benchmarks run without a .env file.
+os.environ.setdefault("SECRET_KEY", "benchmark-secret")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
+os.environ.setdefault("API_URL", "http://localhost:8000")
+os.environ.setdefault("STORAGE_BACKEND", "local")
+# boto3 needs a region to build its clients, even when nothing reaches AWS.
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-west-2")
@@ -0,0 +1,69 @@
+"""Model hydration from DynamoDB items, pydantic validation vs. db.hydrate.
+
+Usage: python -m benchmarks.hydration [--items 100000]
+
+Items are shaped the way boto3 returns them: numbers as Decimal and
+datetimes as strings.
+"""
+# Standard library
+import argparse
+import time
+from decimal import Decimal
+
+# Package
+import benchmarks.env  # noqa: F401
+from db.hydrate import hydrate_all
+from models.certs import CertInDB
+from models.recipients import RecipientInDB
+
+
+def recipient_items(count: int):
+    return [
+        {
+            "id": f"recipient-{number}",
+            "name": f"Recipient {number}",
+            "email": f"recipient{number}@example.edu",
+            "addresses": {"issuer-1": "mtr98kany9G1XYNU74pRnfBQmaCg2FZLmc"},
+            "cert_count": Decimal(number % 7)
+        }
+        for number in range(count)
+    ]
+
+
+def cert_items(count: int):
+    return [
+        {
+            "recipient_id": f"recipient-{number}",
+            "cert_id": f"cert-{number}",
+            "url": f"http://localhost:8000/issuers/issuer-1/batches/20200201/certs/cert-{number}",
+            "issuer_id": "issuer-1",
+            "badge_id": "badge-1",
+            "issued_at": "2020-02-01T17:30:00.123456"
+        }
+        for number in range(count)
+    ]
+
+
+def main(args):
+    for name, items, model in (
+        ("recipients", recipient_items(args.items), RecipientInDB),
+        ("certs", cert_items(args.items), CertInDB),
+    ):
+        started = time.perf_counter()
+        [model(**item) for item in items]
+        validated = time.perf_counter() - started
+
+        started = time.perf_counter()
+        hydrate_all(model, items)
+        hydrated = time.perf_counter() - started
+
+        print(
+            f"{name:>10} x{args.items}: validate {validated:6.2f}s, "
+            f"hydrate {hydrated:6.2f}s ({validated / hydrated:4.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=100000)
+    main(parser.parse_args())
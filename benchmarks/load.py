@@ -0,0 +1,363 @@
+"""Load scenarios against the real app, with AWS replaced by in-memory stand-ins.
+
+Usage: python -m benchmarks.load [SCENARIO ...] [--requests 2000] [--concurrency 50]
+           [--db-latency 0.004] [--s3-latency 0.015] [--ses-latency 0.03]
+           [--recipients 10000] [--job-timeout 600] [--save results.json] [--baseline results.json]
+
+Scenarios (all by default):
+  login      POST /auth/token for many managers at once (bcrypt bound)
+  dashboard  the listing calls behind an issuer owner's dashboard
+  issue-1k   one bulk issuance of a badge to 1,000 enrolled recipients
+  issue-10k  the same with 10,000
+  verify     verifiers fetching issuer profiles and revocation lists
+
+Requests go through the whole ASGI stack in-process (routing, auth,
+validation, serialization) without sockets, so the numbers are the
+service's own cost plus the simulated AWS round trips. Every route called
+is reported with its throughput and p50/p95/p99 latency; the issuance
+scenarios also report the job's wall time and certs issued per second.
+
+--save writes the results as JSON. --baseline compares against a saved
+run and exits non-zero if any route has more errors, or its p95 grew or
+throughput fell by more than --tolerance (a fraction), so the harness can
+gate changes.
+"""
+# Standard library
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from typing import NamedTuple
+from urllib.parse import urlencode
+
+# Package
+import benchmarks.env  # noqa: F401
+
+os.environ.setdefault("EMAIL_SINK", "memory")
+os.environ.setdefault("JOB_STORE", "dynamodb")
+
+from benchmarks.standins import Latency, install  # noqa: E402
+
+
+SCENARIOS = ("login", "dashboard", "issue-1k", "issue-10k", "verify")
+
+
+class Response(NamedTuple):
+    status: int
+    headers: dict
+    body: bytes
+
+    def json(self):
+        return json.loads(self.body)
+
+
+class AppClient:
+    """Calls an ASGI app in-process, the way a server would."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def request(self, method: str, url: str, headers: dict = None, body: bytes = b""):
+        path, _, query = url.partition("?")
+        scope = {
+            "type": "http",
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": query.encode(),
+            "root_path": "",
+            "headers": [
+                (name.lower().encode(), value.encode())
+                for name, value in (headers or {}).items()
+            ],
+            "client": ("127.0.0.1", 50000),
+            "server": ("testserver", 80),
+        }
+        request = [{"type": "http.request", "body": body, "more_body": False}]
+        done = asyncio.Event()
+        start = {}
+        chunks = []
+
+        async def receive():
+            if request:
+                return request.pop()
+            await done.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                start.update(message)
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+                if not message.get("more_body"):
+                    done.set()
+
+        await self.app(scope, receive, send)
+        headers = {name.decode(): value.decode() for name, value in start.get("headers", [])}
+        return Response(start["status"], headers, b"".join(chunks))
+
+    async def startup(self):
+        self.lifespan_in, self.lifespan_out = asyncio.Queue(), asyncio.Queue()
+        self.lifespan = asyncio.ensure_future(
+            self.app({"type": "lifespan"}, self.lifespan_in.get, self.lifespan_out.put)
+        )
+        await self.lifespan_in.put({"type": "lifespan.startup"})
+        message = await self.lifespan_out.get()
+        if message["type"] != "lifespan.startup.complete":
+            raise RuntimeError(f"app failed to start: {message}")
+
+    async def shutdown(self):
+        await self.lifespan_in.put({"type": "lifespan.shutdown"})
+        await self.lifespan_out.get()
+        await self.lifespan
+
+
+def percentile(ordered, percent):
+    """Nearest-rank percentile of an already sorted list."""
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+class Recorder:
+    """Latency samples per route, plus the scenario's wall time."""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.elapsed = 0.0
+
+    async def call(self, client, route: str, method: str, url: str, expect=(200,), **kwargs):
+        started = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        self.samples[route].append(time.perf_counter() - started)
+        if response.status not in expect:
+            self.errors[route] += 1
+        return response
+
+    def results(self):
+        results = {}
+        for route, samples in self.samples.items():
+            ordered = sorted(samples)
+            results[route] = {
+                "requests": len(ordered),
+                "errors": self.errors[route],
+                "throughput": len(ordered) / self.elapsed if self.elapsed else 0.0,
+                "p50": percentile(ordered, 50),
+                "p95": percentile(ordered, 95),
+                "p99": percentile(ordered, 99),
+            }
+        return results
+
+
+async def drive(requests: int, concurrency: int, call):
+    """Make `requests` calls from `concurrency` clients, each waiting for its last response."""
+    numbers = iter(range(requests))
+
+    async def client():
+        for number in numbers:
+            await call(number)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return time.perf_counter() - started
+
+
+def bearer(user):
+    from models.jwt import JWTPayload
+    from services.jwt import create_access_token
+
+    token = create_access_token(payload=JWTPayload(sub=user.email))
+    if isinstance(token, bytes):
+        token = token.decode()
+    return {"Authorization": f"Bearer {token}"}
+
+
+async def login(client, dataset, recorder, args):
+    from benchmarks.datasets import PASSWORD
+
+    async def call(number):
+        manager = dataset.managers[number % len(dataset.managers)]
+        await recorder.call(
+            client, "POST /auth/token", "POST", "/auth/token",
+            headers={"Content-Type": "application/x-www-form-urlencoded"},
+            body=urlencode({"username": manager.email, "password": PASSWORD}).encode()
+        )
+
+    recorder.elapsed = await drive(args.requests, args.concurrency, call)
+
+
+async def dashboard(client, dataset, recorder, args):
+    # Every owner loads their own issuer's pages; the admin sees everything.
+    sessions = [(bearer(owner), issuer) for owner, issuer in zip(dataset.owners, dataset.issuers)]
+    sessions.append((bearer(dataset.admin), dataset.issuers[0]))
+    pages = (
+        ("GET /issuers", lambda issuer: "/issuers/"),
+        ("GET /issuers/{id}/badges", lambda issuer: f"/issuers/{issuer.id}/badges"),
+        ("GET /issuers/{id}/certs", lambda issuer: f"/issuers/{issuer.id}/certs?limit=100"),
+        ("GET /recipients", lambda issuer: "/recipients/?limit=100"),
+    )
+
+    async def call(number):
+        headers, issuer = sessions[number % len(sessions)]
+        route, url = pages[number % len(pages)]
+        await recorder.call(client, route, "GET", url(issuer), headers=headers)
+
+    recorder.elapsed = await drive(args.requests, args.concurrency, call)
+
+
+def issuance(count: int):
+    async def scenario(client, dataset, recorder, args):
+        if count > len(dataset.recipients):
+            sys.exit(f"issuing to {count} recipients needs --recipients {count} or more")
+        issuer = dataset.issuers[0]
+        badge = dataset.badges[issuer.id][0]
+        headers = {**bearer(dataset.owners[0]), "Content-Type": "application/json"}
+        body = json.dumps([
+            {"name": recipient.name, "email": recipient.email}
+            for recipient in dataset.recipients[:count]
+        ]).encode()
+
+        started = time.perf_counter()
+        response = await recorder.call(
+            client, "POST /issuers/{id}/badges/{id}/issue", "POST",
+            f"/issuers/{issuer.id}/badges/{badge.id}/issue",
+            expect=(202,), headers=headers, body=body
+        )
+        job = response.json()
+        deadline = started + args.job_timeout
+        while job.get("status") in ("queued", "running") and time.perf_counter() < deadline:
+            await asyncio.sleep(0.05)
+            job = (await recorder.call(client, "GET /jobs/{id}", "GET", f"/jobs/{job['id']}", headers=headers)).json()
+        recorder.elapsed = time.perf_counter() - started
+
+        recorder.samples["issuance job"].append(recorder.elapsed)
+        if job.get("status") != "completed" or job.get("failed"):
+            recorder.errors["issuance job"] += 1
+        print(
+            f"  job {job.get('status')}: {job.get('issued', 0)} issued, {job.get('failed', 0)} failed "
+            f"in {recorder.elapsed:.2f}s ({job.get('issued', 0) / recorder.elapsed:.1f} certs/s)"
+        )
+    return scenario
+
+
+async def verify(client, dataset, recorder, args):
+    # A few issuers get most of the traffic, as with real verifiers.
+    weights = [1 / (rank + 1) for rank in range(len(dataset.issuers))]
+    rng = random.Random(0)
+    picks = rng.choices(dataset.issuers, weights, k=args.requests)
+
+    async def call(number):
+        issuer = picks[number]
+        if number % 5:
+            await recorder.call(client, "GET /issuers/{id}/profile", "GET", f"/issuers/{issuer.id}/profile")
+        else:
+            await recorder.call(client, "GET /issuers/{id}/revocations", "GET", f"/issuers/{issuer.id}/revocations")
+
+    recorder.elapsed = await drive(args.requests, args.concurrency, call)
+
+
+RUNNERS = {
+    "login": login,
+    "dashboard": dashboard,
+    "issue-1k": issuance(1000),
+    "issue-10k": issuance(10000),
+    "verify": verify,
+}
+
+
+def report(scenario: str, results: dict):
+    print(f"{scenario}:")
+    for route, result in results.items():
+        print(
+            f"  {route:<38} {result['requests']:>6} req {result['errors']:>4} err "
+            f"{result['throughput']:9.1f} req/s  p50 {result['p50'] * 1000:8.1f} ms  "
+            f"p95 {result['p95'] * 1000:8.1f} ms  p99 {result['p99'] * 1000:8.1f} ms"
+        )
+
+
+def regressions(results: dict, baseline: dict, tolerance: float):
+    found = []
+    for scenario, routes in results.items():
+        for route, result in routes.items():
+            before = baseline.get(scenario, {}).get(route)
+            if before is None:
+                continue
+            if result["errors"] > before["errors"]:
+                found.append(f"{scenario} {route}: {before['errors']} -> {result['errors']} errors")
+            if result["p95"] > before["p95"] * (1 + tolerance):
+                found.append(f"{scenario} {route}: p95 {before['p95'] * 1000:.1f} -> {result['p95'] * 1000:.1f} ms")
+            if result["throughput"] < before["throughput"] * (1 - tolerance):
+                found.append(f"{scenario} {route}: {before['throughput']:.1f} -> {result['throughput']:.1f} req/s")
+    return found
+
+
+async def main(args):
+    install(
+        dynamodb=Latency(args.db_latency),
+        storage=Latency(args.s3_latency),
+        email=Latency(args.ses_latency)
+    )
+    from benchmarks.datasets import Scale, seed
+    from db.dynamodb import calls as db_calls, dynamodb
+    from main import app
+
+    # Seed without latency; it isn't part of any scenario.
+    dynamodb.set_latency(Latency())
+    started = time.perf_counter()
+    dataset = await seed(Scale(recipients=args.recipients))
+    dynamodb.set_latency(Latency(args.db_latency))
+    print(f"seeded {args.recipients} recipients in {time.perf_counter() - started:.1f}s")
+
+    client = AppClient(app)
+    await client.startup()
+    results = {}
+    try:
+        for scenario in args.scenarios:
+            recorder = Recorder()
+            calls_before = sum(db_calls.calls.series.values())
+            await RUNNERS[scenario](client, dataset, recorder, args)
+            results[scenario] = recorder.results()
+            report(scenario, results[scenario])
+            requests = sum(len(samples) for samples in recorder.samples.values())
+            db_requests = sum(db_calls.calls.series.values()) - calls_before
+            print(f"  {db_requests} DynamoDB calls, {db_requests / max(1, requests):.1f} per request")
+    finally:
+        await client.shutdown()
+
+    if args.save:
+        with open(args.save, "w") as saved:
+            json.dump(results, saved, indent=2)
+    if args.baseline:
+        with open(args.baseline) as saved:
+            found = regressions(results, json.load(saved), args.tolerance)
+        for regression in found:
+            print(f"REGRESSION {regression}")
+        return 1 if found else 0
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("scenarios", nargs="*", metavar="SCENARIO", help=", ".join(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--db-latency", type=float, default=0.004)
+    parser.add_argument("--s3-latency", type=float, default=0.015)
+    parser.add_argument("--ses-latency", type=float, default=0.03)
+    parser.add_argument("--recipients", type=int, default=10000)
+    parser.add_argument("--job-timeout", type=float, default=600)
+    parser.add_argument("--save")
+    parser.add_argument("--baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+    args.scenarios = args.scenarios or list(SCENARIOS)
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario: {', '.join(sorted(unknown))}")
+    sys.exit(asyncio.get_event_loop().run_until_complete(main(args)))
@@ -0,0 +1,71 @@
+"""Login throughput with bcrypt on the event loop vs. on the password pool.
+
+Usage: python -m benchmarks.login [--logins 40] [--pool process] [--workers 2]
+
+Reports logins per second and the worst event-loop stall seen while the
+logins were running. The stall is how long every other request would
+have waited.
+"""
+# Standard library
+import argparse
+import asyncio
+import time
+
+# Package
+import benchmarks.env  # noqa: F401
+from services.security import PasswordHasher, get_password_hash, verify_password
+
+
+PASSWORD = "correct horse battery staple"
+
+
+async def watch_loop(stop: asyncio.Event, interval: float = 0.005):
+    worst = 0.0
+    loop = asyncio.get_event_loop()
+    while not stop.is_set():
+        started = loop.time()
+        await asyncio.sleep(interval)
+        worst = max(worst, loop.time() - started - interval)
+    return worst
+
+
+async def measure(logins):
+    stop = asyncio.Event()
+    watcher = asyncio.ensure_future(watch_loop(stop))
+    started = time.perf_counter()
+    await logins()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    return elapsed, await watcher
+
+
+async def main(args):
+    hashed = get_password_hash(PASSWORD)
+    hasher = PasswordHasher(pool=args.pool, workers=args.workers)
+
+    async def inline():
+        async def login():
+            verify_password(PASSWORD, hashed)
+        await asyncio.gather(*(login() for _ in range(args.logins)))
+
+    async def pooled():
+        await asyncio.gather(*(hasher.verify(PASSWORD, hashed) for _ in range(args.logins)))
+
+    # Warm the pool so process start-up isn't counted.
+    await hasher.verify(PASSWORD, hashed)
+
+    for name, logins in (("inline", inline), (f"{args.pool} x{args.workers}", pooled)):
+        elapsed, stall = await measure(logins)
+        print(
+            f"{name:>12}: {args.logins / elapsed:7.1f} logins/s, "
+            f"worst loop stall {stall * 1000:8.1f} ms"
+        )
+    hasher.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=40)
+    parser.add_argument("--pool", choices=("process", "thread"), default="process")
+    parser.add_argument("--workers", type=int, default=2)
+    asyncio.get_event_loop().run_until_complete(main(parser.parse_args()))
@@ -0,0 +1,64 @@
+"""List endpoint serialization, response_model path vs. model_response.
+
+Usage: python -m benchmarks.serialization [--sizes 1000 10000]
+
+"response_model" is what FastAPI does with a returned list: validate every
+item against the response model, run jsonable_encoder, then json.dumps.
+"model_response" projects the already validated db models onto the output
+model and encodes them once with orjson.
+"""
+# Standard library
+import argparse
+import json
+import time
+
+# Third party libraries
+from fastapi.encoders import jsonable_encoder
+
+# Package
+import benchmarks.env  # noqa: F401
+from benchmarks.certs import sample_badge, sample_issuer, sample_recipients
+from core.responses import model_response
+from models.badges import BadgeInDB
+from models.issuers import IssuerOut
+from models.recipients import RecipientInDB
+
+
+def response_model_path(content, model):
+    validated = [model.validate(item) for item in content]
+    return json.dumps(jsonable_encoder(validated)).encode()
+
+
+def fast_path(content, model):
+    return model_response(content, model).body
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - started
+
+
+def main(args):
+    endpoints = (
+        # get_issuers returned dicts, the others models.
+        ("GET /issuers", lambda size: [sample_issuer() for _ in range(size)], IssuerOut, True),
+        ("GET /issuers/{id}/badges", lambda size: [sample_badge() for _ in range(size)], BadgeInDB, False),
+        ("GET /recipients", sample_recipients, RecipientInDB, False),
+    )
+    for name, make, model, as_dicts in endpoints:
+        for size in args.sizes:
+            items = make(size)
+            legacy = [item.dict() for item in items] if as_dicts else items
+            slow = timed(response_model_path, legacy, model)
+            fast = timed(fast_path, items, model)
+            print(
+                f"{name:<26} {size:>6} items: response_model {slow * 1000:8.1f} ms, "
+                f"model_response {fast * 1000:7.1f} ms ({slow / fast:4.1f}x)"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    main(parser.parse_args())
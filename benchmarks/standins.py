@@ -0,0 +1,649 @@
+"""In-memory stand-ins for DynamoDB, S3 and SES, with injectable latency.
+
+install() must run before anything imports the db layer or main: the db
+classes build their tables, and services.cert and services.uploader bind
+the storage backend, at import time.
+
+MemoryTable implements the slice of the boto3 Table API the db layer uses:
+get/put/update/delete_item, query (on the table or a db.schema index) and
+scan, with Limit/ExclusiveStartKey paging, boto3 condition objects, and
+SET/ADD/REMOVE update expressions. Items go in and come out the way boto3
+hands them over (numbers as Decimal, floats and datetimes rejected), so
+hydration and serialization do the same work they do against AWS. Pages
+stop at Limit only, not at 1 MB.
+
+Latency is slept on the caller's thread for DynamoDB, which like boto3
+holds a worker of the db executor, and awaited for S3 and SES.
+"""
+# Standard library
+import asyncio
+import bisect
+import itertools
+import math
+import random
+import sys
+import threading
+import time
+from decimal import Decimal
+from typing import NamedTuple
+
+# Third party libraries
+from boto3.dynamodb.conditions import AttributeBase, ConditionBase
+from botocore.exceptions import ClientError
+
+# Package
+import benchmarks.env  # noqa: F401
+from db.schema import INDEXES, KEYS
+from services.storage import measured
+
+
+class Latency(NamedTuple):
+    """A simulated round trip: `mean` seconds, uniformly +/- `jitter` of it."""
+    mean: float = 0.0
+    jitter: float = 0.25
+
+    def sample(self):
+        if not self.mean:
+            return 0.0
+        return max(0.0, self.mean * (1 + random.uniform(-self.jitter, self.jitter)))
+
+
+def store(value):
+    """Copy a value the way a round trip through boto3 would return it."""
+    if value is None or isinstance(value, (bool, Decimal, bytes)):
+        return value
+    if isinstance(value, str):
+        # str enums (UserRole, JobStatus) are stored as their value.
+        return str.__str__(value)
+    if isinstance(value, int):
+        return Decimal(value)
+    if isinstance(value, float):
+        raise TypeError("Float types are not supported. Use Decimal types instead.")
+    if isinstance(value, dict):
+        return {str(key): store(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [store(item) for item in value]
+    if isinstance(value, (set, frozenset)):
+        return {store(item) for item in value}
+    raise TypeError(f'Unsupported type "{type(value)}" for value "{value}"')
+
+
+def copy(value):
+    if isinstance(value, dict):
+        return {key: copy(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [copy(item) for item in value]
+    if isinstance(value, set):
+        return set(value)
+    return value
+
+
+def item_size(item):
+    # Roughly DynamoDB's item size, close enough for capacity estimates.
+    return len(str(item).encode()) if item else 0
+
+
+def read_units(size: int):
+    # Eventually consistent reads: half a unit per 4 KB.
+    return max(1, math.ceil(size / 4096)) * 0.5
+
+
+def write_units(size: int):
+    return max(1, math.ceil(size / 1024)) * 1.0
+
+
+def condition_failed(operation: str):
+    return ClientError(
+        {"Error": {"Code": "ConditionalCheckFailedException", "Message": "The conditional request failed"}},
+        operation
+    )
+
+
+MISSING = object()
+SCAN = "scan"
+
+
+def lookup(item: dict, path):
+    value = item
+    for name in path:
+        if not isinstance(value, dict) or name not in value:
+            return MISSING
+        value = value[name]
+    return value
+
+
+def evaluate(condition: ConditionBase, item: dict):
+    """Evaluate a boto3 condition object (Key or Attr) against an item."""
+    kind = type(condition).__name__
+    values = condition.get_expression()["values"]
+    if kind == "And":
+        return all(evaluate(value, item) for value in values)
+    if kind == "Or":
+        return any(evaluate(value, item) for value in values)
+    if kind == "Not":
+        return not evaluate(values[0], item)
+
+    def resolve(value):
+        if isinstance(value, AttributeBase):
+            return lookup(item, value.name.split("."))
+        return store(value)
+
+    operands = [resolve(value) for value in values]
+    first = operands[0]
+    if kind == "AttributeExists":
+        return first is not MISSING
+    if kind == "AttributeNotExists":
+        return first is MISSING
+    if first is MISSING:
+        return False
+    if kind == "Equals":
+        return first == operands[1]
+    if kind == "NotEquals":
+        return first != operands[1]
+    if kind == "BeginsWith":
+        return first.startswith(operands[1])
+    if kind == "Contains":
+        return operands[1] in first
+    if kind == "In":
+        return first in operands[1]
+    if kind == "Between":
+        return operands[1] <= first <= operands[2]
+    comparisons = {
+        "LessThan": lambda a, b: a < b,
+        "LessThanEquals": lambda a, b: a <= b,
+        "GreaterThan": lambda a, b: a > b,
+        "GreaterThanEquals": lambda a, b: a >= b,
+    }
+    if kind in comparisons:
+        return comparisons[kind](first, operands[1])
+    raise NotImplementedError(f"{kind} conditions aren't supported by MemoryTable")
+
+
+def split_top_level(text: str):
+    """Split on commas that aren't inside parentheses."""
+    parts, depth, start = [], 0, 0
+    for position, char in enumerate(text):
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "," and depth == 0:
+            parts.append(text[start:position].strip())
+            start = position + 1
+    parts.append(text[start:].strip())
+    return [part for part in parts if part]
+
+
+UPDATE_CLAUSES = ("SET", "REMOVE", "ADD", "DELETE")
+
+
+def parse_update(expression: str):
+    """Split an UpdateExpression into (clause, [actions]) pairs."""
+    clauses, clause, words = [], None, []
+    for word in expression.split():
+        if word.upper() in UPDATE_CLAUSES:
+            if clause:
+                clauses.append((clause, split_top_level(" ".join(words))))
+            clause, words = word.upper(), []
+        else:
+            words.append(word)
+    if clause:
+        clauses.append((clause, split_top_level(" ".join(words))))
+    return clauses
+
+
+class Update:
+    """Applies a parsed UpdateExpression to an item in place."""
+
+    def __init__(self, expression: str, names: dict = None, values: dict = None):
+        self.clauses = parse_update(expression)
+        self.names = names or {}
+        self.values = {key: store(value) for key, value in (values or {}).items()}
+
+    def path(self, text: str):
+        return [self.names.get(part, part) for part in text.strip().split(".")]
+
+    def operand(self, text: str, item: dict):
+        text = text.strip()
+        if text.startswith(":"):
+            return self.values[text]
+        for function in ("list_append", "if_not_exists"):
+            if text.startswith(function + "("):
+                first, second = split_top_level(text[len(function) + 1:-1])
+                if function == "list_append":
+                    return self.operand(first, item) + self.operand(second, item)
+                current = lookup(item, self.path(first))
+                return self.operand(second, item) if current is MISSING else current
+        value = lookup(item, self.path(text))
+        if value is MISSING:
+            raise ClientError(
+                {"Error": {"Code": "ValidationException", "Message": f"{text} is not in the item"}},
+                "UpdateItem"
+            )
+        return value
+
+    def value(self, text: str, item: dict):
+        depth = 0
+        for position, char in enumerate(text):
+            if char == "(":
+                depth += 1
+            elif char == ")":
+                depth -= 1
+            elif char in "+-" and depth == 0:
+                left = self.operand(text[:position], item)
+                right = self.operand(text[position + 1:], item)
+                return left + right if char == "+" else left - right
+        return self.operand(text, item)
+
+    def assign(self, item: dict, path, value):
+        parent = lookup(item, path[:-1])
+        if not isinstance(parent, dict):
+            raise ClientError(
+                {"Error": {"Code": "ValidationException", "Message": "The document path provided in the update expression is invalid for update"}},
+                "UpdateItem"
+            )
+        parent[path[-1]] = value
+
+    def apply(self, item: dict):
+        for clause, actions in self.clauses:
+            for action in actions:
+                if clause == "SET":
+                    target, expression = action.split("=", 1)
+                    self.assign(item, self.path(target), self.value(expression.strip(), item))
+                elif clause == "REMOVE":
+                    path = self.path(action)
+                    parent = lookup(item, path[:-1])
+                    if isinstance(parent, dict):
+                        parent.pop(path[-1], None)
+                else:
+                    target, name = action.split()
+                    path, operand = self.path(target), self.values[name]
+                    current = lookup(item, path)
+                    if clause == "ADD":
+                        if current is MISSING:
+                            current = set() if isinstance(operand, set) else Decimal(0)
+                        self.assign(item, path, current | operand if isinstance(operand, set) else current + operand)
+                    elif current is not MISSING:
+                        self.assign(item, path, current - operand)
+
+
+class MemoryTable:
+    """A thread-safe, in-memory DynamoDB table with the db.schema indexes."""
+
+    def __init__(self, name: str, latency: Latency = Latency()):
+        self.name = name
+        self.latency = latency
+        self.partition_key, self.sort_key = KEYS[name]
+        self.indexes = {index.name: index for index in INDEXES.get(name, [])}
+        self.lock = threading.Lock()
+        self.items = {}
+        # index name (None for the table) -> partition value -> {key: item}
+        self.partitions = {None: {}, **{name: {} for name in self.indexes}}
+        # (index name, partition value) or SCAN -> (items, sort orders),
+        # dropped whenever an item in it changes.
+        self.ordered = {}
+
+    def wait(self):
+        delay = self.latency.sample()
+        if delay:
+            time.sleep(delay)
+
+    def key_of(self, item: dict):
+        if self.sort_key:
+            return item[self.partition_key], item[self.sort_key]
+        return item[self.partition_key]
+
+    def index_keys(self, index_name):
+        if index_name is None:
+            return self.partition_key, self.sort_key
+        index = self.indexes[index_name]
+        return index.partition_key, index.sort_key
+
+    def _link(self, key, item):
+        for index_name, partitions in self.partitions.items():
+            partition_key, sort_key = self.index_keys(index_name)
+            # Indexes are sparse: items without the index keys aren't in it.
+            if partition_key in item and (index_name is None or sort_key is None or sort_key in item):
+                partitions.setdefault(item[partition_key], {})[key] = item
+                self.ordered.pop((index_name, item[partition_key]), None)
+        self.ordered.pop(SCAN, None)
+
+    def _unlink(self, key, item):
+        for index_name, partitions in self.partitions.items():
+            partition_key, _ = self.index_keys(index_name)
+            if partition_key in item:
+                partitions.get(item[partition_key], {}).pop(key, None)
+                self.ordered.pop((index_name, item[partition_key]), None)
+        self.ordered.pop(SCAN, None)
+
+    def _write(self, item: dict):
+        key = self.key_of(item)
+        old = self.items.get(key)
+        if old is not None:
+            self._unlink(key, old)
+        self.items[key] = item
+        self._link(key, item)
+        return old
+
+    def load(self, items):
+        """Write items straight into the table, without latency."""
+        with self.lock:
+            for item in items:
+                self._write(store(item))
+
+    def _consumed(self, result: dict, kwargs: dict, units: float):
+        if kwargs.get("ReturnConsumedCapacity", "NONE") != "NONE":
+            result["ConsumedCapacity"] = {"TableName": self.name, "CapacityUnits": units}
+        return result
+
+    def _check(self, kwargs, item, operation):
+        condition = kwargs.get("ConditionExpression")
+        if condition is None:
+            return
+        if isinstance(condition, str):
+            raise NotImplementedError("MemoryTable only evaluates boto3 condition objects")
+        if not evaluate(condition, item or {}):
+            raise condition_failed(operation)
+
+    def _key(self, key: dict):
+        key = store(key)
+        if self.sort_key:
+            return key[self.partition_key], key[self.sort_key]
+        return key[self.partition_key]
+
+    def get_item(self, Key: dict, **kwargs):
+        self.wait()
+        with self.lock:
+            item = self.items.get(self._key(Key))
+            result = {"Item": copy(item)} if item is not None else {}
+        return self._consumed(result, kwargs, read_units(item_size(item)))
+
+    def put_item(self, Item: dict, **kwargs):
+        item = store(Item)
+        self.wait()
+        with self.lock:
+            self._check(kwargs, self.items.get(self.key_of(item)), "PutItem")
+            old = self._write(item)
+        result = {"Attributes": copy(old)} if kwargs.get("ReturnValues") == "ALL_OLD" and old is not None else {}
+        return self._consumed(result, kwargs, write_units(item_size(item)))
+
+    def update_item(self, Key: dict, UpdateExpression: str, **kwargs):
+        update = Update(
+            UpdateExpression,
+            kwargs.get("ExpressionAttributeNames"),
+            kwargs.get("ExpressionAttributeValues")
+        )
+        key = self._key(Key)
+        self.wait()
+        with self.lock:
+            old = self.items.get(key)
+            self._check(kwargs, old, "UpdateItem")
+            item = copy(old) if old is not None else store(Key)
+            update.apply(item)
+            self._write(item)
+        returns = kwargs.get("ReturnValues", "NONE")
+        result = {}
+        if returns == "ALL_NEW":
+            result = {"Attributes": copy(item)}
+        elif returns == "ALL_OLD" and old is not None:
+            result = {"Attributes": copy(old)}
+        return self._consumed(result, kwargs, write_units(max(item_size(old), item_size(item))))
+
+    def delete_item(self, Key: dict, **kwargs):
+        key = self._key(Key)
+        self.wait()
+        with self.lock:
+            old = self.items.get(key)
+            self._check(kwargs, old, "DeleteItem")
+            if old is not None:
+                del self.items[key]
+                self._unlink(key, old)
+        return self._consumed({}, kwargs, write_units(item_size(old)))
+
+    def query(self, KeyConditionExpression: ConditionBase, IndexName: str = None, **kwargs):
+        partition_key, sort_key = self.index_keys(IndexName)
+        value, conditions = MISSING, []
+        parts = [KeyConditionExpression]
+        while parts:
+            part = parts.pop()
+            expression = part.get_expression()
+            if type(part).__name__ == "And":
+                parts.extend(expression["values"])
+            elif type(part).__name__ == "Equals" and expression["values"][0].name == partition_key:
+                value = store(expression["values"][1])
+            else:
+                conditions.append(part)
+        if value is MISSING:
+            raise ClientError(
+                {"Error": {"Code": "ValidationException", "Message": f"Query condition missed key schema element: {partition_key}"}},
+                "Query"
+            )
+        self.wait()
+        with self.lock:
+            items, orders = self._ordered((IndexName, value), sort_key, self.partitions[IndexName].get(value, {}).values())
+        if conditions:
+            # Sort key conditions; the db layer doesn't use any, so no bisecting.
+            matched = [number for number, item in enumerate(items) if all(evaluate(c, item) for c in conditions)]
+            items, orders = [items[number] for number in matched], [orders[number] for number in matched]
+        return self._page(items, orders, IndexName, kwargs)
+
+    def scan(self, **kwargs):
+        self.wait()
+        with self.lock:
+            items, orders = self._ordered(SCAN, None, self.items.values())
+        return self._page(items, orders, None, kwargs)
+
+    def _order(self, sort_key):
+        def order(item):
+            return (item.get(sort_key, "") if sort_key else "", self.key_of(item))
+        return order
+
+    def _ordered(self, cache_key, sort_key, items):
+        # Called with the lock held. Lists are replaced, never changed, so
+        # they stay safe to read after it is released.
+        if cache_key not in self.ordered:
+            order = self._order(sort_key)
+            items = sorted(items, key=order)
+            self.ordered[cache_key] = items, [order(item) for item in items]
+        return self.ordered[cache_key]
+
+    def _page(self, items, orders, index_name, kwargs):
+        sort_key = self.index_keys(index_name)[1] if index_name else None
+        start = kwargs.get("ExclusiveStartKey")
+        after = self._order(sort_key)(store(start)) if start else None
+        limit = kwargs.get("Limit") or len(items)
+        if kwargs.get("ScanIndexForward", True):
+            begin = bisect.bisect_right(orders, after) if start else 0
+            evaluated = items[begin:begin + limit]
+            more = begin + limit < len(items)
+        else:
+            end = bisect.bisect_left(orders, after) if start else len(items)
+            evaluated = items[max(0, end - limit):end][::-1]
+            more = end - limit > 0
+        # Like DynamoDB, Limit counts items read, before the filter.
+        condition = kwargs.get("FilterExpression")
+        found = [copy(item) for item in evaluated if condition is None or evaluate(condition, item)]
+        result = {"Items": found, "Count": len(found), "ScannedCount": len(evaluated)}
+        self._consumed(result, kwargs, read_units(sum(item_size(item) for item in evaluated)))
+        if more and evaluated:
+            # The table key, plus the index key when paging an index.
+            last = evaluated[-1]
+            names = {self.partition_key, self.sort_key, *self.index_keys(index_name)} - {None}
+            result["LastEvaluatedKey"] = {name: copy(last[name]) for name in names if name in last}
+        return result
+
+
+class MemoryDynamoDB:
+    """Takes the place of the boto3 resource in db.dynamodb."""
+
+    def __init__(self, latency: Latency = Latency()):
+        self.latency = latency
+        self.tables = {}
+
+    def Table(self, name: str):
+        if name not in self.tables:
+            self.tables[name] = MemoryTable(name, self.latency)
+        return self.tables[name]
+
+    def batch_write_item(self, RequestItems: dict, **kwargs):
+        # One round trip for the whole batch.
+        delay = self.latency.sample()
+        if delay:
+            time.sleep(delay)
+        consumed = []
+        for name, requests in RequestItems.items():
+            table = self.Table(name)
+            units = 0.0
+            with table.lock:
+                for request in requests:
+                    if "PutRequest" in request:
+                        item = store(request["PutRequest"]["Item"])
+                        table._write(item)
+                    else:
+                        key = table._key(request["DeleteRequest"]["Key"])
+                        item = table.items.pop(key, None)
+                        if item is not None:
+                            table._unlink(key, item)
+                    units += write_units(item_size(item))
+            consumed.append({"TableName": name, "CapacityUnits": units})
+        result = {"UnprocessedItems": {}}
+        if kwargs.get("ReturnConsumedCapacity", "NONE") != "NONE":
+            result["ConsumedCapacity"] = consumed
+        return result
+
+    def batch_get_item(self, RequestItems: dict, **kwargs):
+        delay = self.latency.sample()
+        if delay:
+            time.sleep(delay)
+        responses = {}
+        consumed = []
+        for name, request in RequestItems.items():
+            if len(request["Keys"]) > 100:
+                raise ValueError("BatchGetItem takes at most 100 keys")
+            table = self.Table(name)
+            items = []
+            units = 0.0
+            with table.lock:
+                for key in request["Keys"]:
+                    item = table.items.get(table._key(key))
+                    if item is not None:
+                        items.append(copy(item))
+                        units += read_units(item_size(item))
+            # DynamoDB returns the items in no particular order.
+            items.reverse()
+            responses[name] = items
+            consumed.append({"TableName": name, "CapacityUnits": units})
+        result = {"Responses": responses, "UnprocessedKeys": {}}
+        if kwargs.get("ReturnConsumedCapacity", "NONE") != "NONE":
+            result["ConsumedCapacity"] = consumed
+        return result
+
+    def set_latency(self, latency: Latency):
+        self.latency = latency
+        for table in self.tables.values():
+            table.latency = latency
+
+
+class MemoryStorage:
+    """The cert bucket as a dict of key -> bytes."""
+
+    def __init__(self, latency: Latency = Latency()):
+        self.latency = latency
+        self.objects = {}
+        # upload id -> {part number: bytes}
+        self.uploads = {}
+        self.upload_ids = itertools.count(1)
+
+    async def wait(self, operation: str, key: str):
+        await measured("memory", operation, key, asyncio.sleep(self.latency.sample()))
+
+    async def list(self, prefix: str):
+        await self.wait("list", prefix)
+        for key in sorted(key for key in self.objects if key.startswith(prefix)):
+            yield key
+
+    async def get(self, key: str):
+        await self.wait("get", key)
+        return self.objects[key]
+
+    async def get_range(self, key: str, start: int, length: int):
+        await self.wait("get_range", f"{key}[{start}:{start + length}]")
+        return self.objects[key][start:start + length]
+
+    async def exists(self, key: str):
+        await self.wait("exists", key)
+        return key in self.objects
+
+    async def put(self, key: str, body: bytes, public: bool = False):
+        await self.wait("put", key)
+        self.objects[key] = bytes(body)
+
+    async def start_upload(self, key: str, public: bool = False):
+        await self.wait("start_upload", key)
+        upload_id = f"{key}#{next(self.upload_ids)}"
+        self.uploads[upload_id] = {}
+        return upload_id
+
+    async def put_part(self, key: str, upload_id: str, number: int, body: bytes):
+        await self.wait("put_part", f"{key}#{number}")
+        self.uploads[upload_id][number] = bytes(body)
+        return str(number)
+
+    async def complete_upload(self, key: str, upload_id: str, etags: list):
+        await self.wait("complete_upload", key)
+        parts = self.uploads.pop(upload_id)
+        self.objects[key] = b"".join(parts[number] for number in range(1, len(etags) + 1))
+
+    async def abort_upload(self, key: str, upload_id: str):
+        await self.wait("abort_upload", key)
+        self.uploads.pop(upload_id, None)
+
+
+class LatentSink:
+    """An email sink that keeps what it's sent after a simulated SES call."""
+
+    name = "memory"
+
+    def __init__(self, latency: Latency = Latency()):
+        self.latency = latency
+        self.sent = []
+
+    async def wait(self):
+        delay = self.latency.sample()
+        if delay:
+            await asyncio.sleep(delay)
+
+    async def send(self, email):
+        await self.wait()
+        self.sent.append(email)
+
+    async def send_bulk(self, emails):
+        await self.wait()
+        self.sent.extend(emails)
+        return [None] * len(emails)
+
+
+class StandIns(NamedTuple):
+    dynamodb: MemoryDynamoDB
+    storage: MemoryStorage
+    sink: LatentSink
+
+    def set_latency(self, dynamodb: Latency, storage: Latency, email: Latency):
+        self.dynamodb.set_latency(dynamodb)
+        self.storage.latency = storage
+        self.sink.latency = email
+
+
+def install(dynamodb: Latency = Latency(), storage: Latency = Latency(), email: Latency = Latency()):
+    """Swap the AWS clients for in-memory stand-ins, before the app is imported."""
+    import db.dynamodb
+    import services.storage
+    from services.email import outbox
+
+    if "main" in sys.modules:
+        raise RuntimeError("install() has to run before main is imported")
+    stand_ins = StandIns(MemoryDynamoDB(dynamodb), MemoryStorage(storage), LatentSink(email))
+    db.dynamodb.dynamodb = stand_ins.dynamodb
+    services.storage.storage = stand_ins.storage
+    outbox.sink = stand_ins.sink
+    return stand_ins
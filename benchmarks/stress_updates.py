@@ -0,0 +1,107 @@
+"""Concurrent-update stress test for the atomic db layer updates.
+
+Usage: DYNAMODB_ENDPOINT_URL=http://localhost:8000 python -m benchmarks.stress_updates [--writers 50]
+
+Runs against DynamoDB Local (or any other stand-in at DYNAMODB_ENDPOINT_URL)
+and refuses to run without one. Missing tables are created. Each check
+fires concurrent writers at a single item and verifies no update was lost.
+"""
+# Standard library
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+# Package
+import benchmarks.env  # noqa: F401
+
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
+from core.config import DYNAMODB_ENDPOINT_URL  # noqa: E402
+from db.dynamodb import dynamodb  # noqa: E402
+from db.invites import InvitesDB  # noqa: E402
+from db.recipients import RecipientsDB  # noqa: E402
+from db.users import UsersDB  # noqa: E402
+from models.invites import InviteInCreate  # noqa: E402
+from models.recipients import RecipientIn  # noqa: E402
+from models.users import UserRole  # noqa: E402
+from services.security import verify_password  # noqa: E402
+
+
+TABLES = ("ubadges.recipients", "ubadges.invites", "ubadges.users")
+
+
+def ensure_tables():
+    existing = {table.name for table in dynamodb.tables.all()}
+    for name in TABLES:
+        if name not in existing:
+            dynamodb.create_table(
+                TableName=name,
+                KeySchema=[{"AttributeName": "id", "KeyType": "HASH"}],
+                AttributeDefinitions=[{"AttributeName": "id", "AttributeType": "S"}],
+                BillingMode="PAY_PER_REQUEST"
+            ).wait_until_exists()
+
+
+async def check_addresses(writers: int):
+    recipient = await RecipientsDB().create_recipient(RecipientIn(name="Stress", email="stress@example.edu"))
+    await asyncio.gather(*(
+        RecipientsDB().add_address(recipient.id, f"issuer-{number}", f"address-{number}")
+        for number in range(writers)
+    ))
+    recipient = await RecipientsDB().get_recipients_by_id(recipient.id)
+    return len(recipient.addresses) == writers, f"{len(recipient.addresses)}/{writers} addresses kept"
+
+
+async def check_badges(writers: int):
+    invite = await InvitesDB().create(InviteInCreate(issuer_id="issuer", recipient_id="recipient", badge_id="badge-0"))
+    distinct = max(1, writers // 5)
+    # Every badge is added by several writers at once.
+    await asyncio.gather(*(
+        InvitesDB().add_badge(invite.id, f"badge-{number % distinct}")
+        for number in range(writers)
+    ))
+    invite = await InvitesDB().get_by_id(invite.id)
+    passed = sorted(invite.badges) == sorted(f"badge-{number}" for number in range(distinct))
+    return passed, f"{len(invite.badges)} badges for {distinct} distinct, {len(set(invite.badges))} unique"
+
+
+async def check_user_fields(writers: int):
+    user = await UsersDB().create_user(f"stress-{time.time()}@example.edu", "password", UserRole.MANAGER)
+    # Half the writers change the role, half the password; neither should
+    # overwrite the other's field with a stale value.
+    await asyncio.gather(*(
+        UsersDB().update_user(user.id, role=UserRole.ADMIN) if number % 2
+        else UsersDB().update_user(user.id, password=f"password-{number}")
+        for number in range(writers)
+    ))
+    user = await UsersDB().get_user_by_id(user.id)
+    passwords = [f"password-{number}" for number in range(0, writers, 2)]
+    password_kept = any(verify_password(password, user.hashed_password) for password in passwords)
+    return user.role == UserRole.ADMIN and password_kept, f"role {user.role}, new password kept: {password_kept}"
+
+
+async def main(args):
+    for name, check in (
+        ("addresses", check_addresses),
+        ("invite badges", check_badges),
+        ("user fields", check_user_fields)
+    ):
+        started = time.perf_counter()
+        passed, detail = await check(args.writers)
+        elapsed = time.perf_counter() - started
+        print(f"{name:>14}: {'ok' if passed else 'LOST UPDATES'} ({detail}, {elapsed:.2f}s)")
+        if not passed:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--writers", type=int, default=50)
+    args = parser.parse_args()
+    if not DYNAMODB_ENDPOINT_URL:
+        sys.exit("Set DYNAMODB_ENDPOINT_URL to a DynamoDB Local endpoint; this writes test items.")
+    ensure_tables()
+    sys.exit(asyncio.get_event_loop().run_until_complete(main(args)))
@@ -0,0 +1,59 @@
+"""Upload throughput, one PUT at a time vs. the concurrent uploader.
+
+Usage: python -m benchmarks.upload [--objects 1000] [--latency 0.03] [--concurrency 32]
+
+Runs offline against the local storage backend in a temporary directory.
+--latency adds a simulated round trip to every PUT so the numbers
+resemble S3 rather than a local disk.
+"""
+# Standard library
+import argparse
+import asyncio
+import tempfile
+import time
+
+# Package
+import benchmarks.env  # noqa: F401
+from services.storage import LocalStorage
+from services.uploader import Uploader
+
+
+class LatentStorage(LocalStorage):
+
+    def __init__(self, root: str, latency: float):
+        super().__init__(root)
+        self.latency = latency
+
+    async def put(self, key: str, body: bytes, public: bool = False):
+        await asyncio.sleep(self.latency)
+        await super().put(key, body, public)
+
+
+async def main(args):
+    body = b'{"type":"Assertion"}' * 100
+    with tempfile.TemporaryDirectory() as root:
+        storage = LatentStorage(root, args.latency)
+        objects = [(f"sequential/{number}.json", body) for number in range(args.objects)]
+
+        started = time.perf_counter()
+        for key, body in objects:
+            await storage.put(key, body)
+        sequential = time.perf_counter() - started
+
+        uploader = Uploader(storage, concurrency=args.concurrency)
+        objects = [(f"concurrent/{number}.json", body) for number in range(args.objects)]
+        started = time.perf_counter()
+        report = await uploader.upload_many(objects)
+        concurrent = time.perf_counter() - started
+
+    print(f"{'sequential':>14}: {args.objects / sequential:8.1f} objects/s")
+    print(f"{f'uploader x{args.concurrency}':>14}: {args.objects / concurrent:8.1f} objects/s "
+          f"({report.uploaded} uploaded, {len(report.failed)} failed)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--objects", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.03)
+    parser.add_argument("--concurrency", type=int, default=32)
+    asyncio.get_event_loop().run_until_complete(main(parser.parse_args()))
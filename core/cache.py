@@ -0,0 +1,235 @@
+# Standard library
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Tuple
+
+# Package
+from core.config import METRICS_ENABLED
+from core.metrics import registry
+
+
+class TTLCache:
+    """Size-bounded LRU cache whose entries expire after a time-to-live.
+
+    Not thread-safe; it is meant to be used from the event loop.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        entry = self.entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self.entries[key]
+        self.misses += 1
+        return default
+
+    def set(self, key, value, ttl: float = None):
+        if self.maxsize <= 0:
+            return
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        self.entries[key] = (time.monotonic() + ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, key):
+        self.entries.pop(key, None)
+
+    def clear(self):
+        self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def hit_ratio(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class SingleFlight:
+    """Collapses concurrent loads of the same key into one call.
+
+    Callers that arrive while a load is running wait for its result instead
+    of starting their own.
+    """
+
+    def __init__(self):
+        self.inflight = {}
+
+    async def do(self, key, load):
+        future = self.inflight.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = asyncio.get_event_loop().create_future()
+        self.inflight[key] = future
+        try:
+            result = await load()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as error:
+            future.set_exception(error)
+            # Mark the exception retrieved; waiters (if any) re-raise it.
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self.inflight[key]
+
+
+cache_lookups = registry.counter(
+    "cache_lookups_total",
+    "Read-through cache lookups, by cache and result (hit or miss).",
+    ("cache", "result")
+)
+cache_hit_ratio = registry.gauge(
+    "cache_hit_ratio",
+    "Share of a cache's lookups served without a load since the process started.",
+    ("cache",)
+)
+cache_invalidations = registry.counter(
+    "cache_invalidations_total",
+    "Keys dropped from a cache by writes in this worker or, through the bus, others.",
+    ("cache",)
+)
+
+
+class InvalidationBus:
+    """Routes cache invalidations to every cache subscribed under a name.
+
+    On its own the bus reaches the caches of this process. To reach other
+    workers, give it a transport: one with send(cache, key, origin) is
+    handed every invalidation published here, and calls deliver() on its
+    own bus for each one it receives. Keys must survive the transport, so
+    keep them to strings and tuples of strings.
+    """
+
+    def __init__(self):
+        self.subscribers = {}
+        self.transport = None
+
+    def subscribe(self, cache: str, callback):
+        self.subscribers.setdefault(cache, []).append(callback)
+
+    def publish(self, cache: str, key):
+        self.deliver(cache, key)
+        if self.transport is not None:
+            self.transport.send(cache, key, self)
+
+    def deliver(self, cache: str, key):
+        for callback in self.subscribers.get(cache, ()):
+            callback(key)
+
+
+class LocalTransport:
+    """Joins buses in one process, standing in for a message broker in tests:
+    one bus per simulated worker."""
+
+    def __init__(self):
+        self.buses = []
+
+    def attach(self, bus: InvalidationBus):
+        self.buses.append(bus)
+        bus.transport = self
+
+    def send(self, cache: str, key, origin: InvalidationBus):
+        for bus in self.buses:
+            if bus is not origin:
+                bus.deliver(cache, key)
+
+
+invalidation_bus = InvalidationBus()
+
+
+class ReadThroughCache:
+    """A process-wide TTL/LRU cache that loads its own misses.
+
+    Concurrent misses for one key share a single load, and a load that races
+    with an invalidation isn't cached, so a write is never overwritten by
+    the value it replaced. Nothing is cached for keys that load as None.
+    Cached values are shared by every caller; treat them as read-only.
+
+    A cache of values derived from another cache's can follow it: each key
+    invalidated there is dropped here too, wherever the write was.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        maxsize: int,
+        ttl: float,
+        bus: InvalidationBus = invalidation_bus,
+        follows: Tuple[str, ...] = ()
+    ):
+        self.name = name
+        self.cache = TTLCache(maxsize, ttl)
+        self.single_flight = SingleFlight()
+        self.generations = {}
+        self.bus = bus
+        for cache in (name, *follows):
+            bus.subscribe(cache, self.drop)
+
+    async def get(self, key, load):
+        value = self.lookup(key)
+        if value is not None:
+            return value
+
+        generation = self.generations.get(key, 0)
+        value = await self.single_flight.do(key, load)
+        self.store(key, value, generation)
+        return value
+
+    async def get_many(self, keys, load_many):
+        """Values for `keys` as a dict, loading every miss with one call to
+        load_many(missing_keys), which returns a dict of those it found."""
+        found = {}
+        missing = []
+        for key in dict.fromkeys(keys):
+            value = self.lookup(key)
+            if value is None:
+                missing.append(key)
+            else:
+                found[key] = value
+        if missing:
+            generations = [self.generations.get(key, 0) for key in missing]
+            loaded = await load_many(missing)
+            for key, generation in zip(missing, generations):
+                self.store(key, loaded.get(key), generation)
+            found.update(loaded)
+        return found
+
+    def lookup(self, key):
+        value = self.cache.get(key)
+        if METRICS_ENABLED:
+            cache_lookups.inc(self.name, "miss" if value is None else "hit")
+            cache_hit_ratio.set(self.name, value=self.cache.hit_ratio)
+        return value
+
+    def store(self, key, value, generation: int):
+        if value is not None and self.generations.get(key, 0) == generation:
+            self.cache.set(key, value)
+
+    def invalidate(self, key):
+        """Drop `key` here and, through the bus, on every other worker."""
+        self.bus.publish(self.name, key)
+
+    def drop(self, key):
+        self.generations[key] = self.generations.get(key, 0) + 1
+        self.cache.invalidate(key)
+        if METRICS_ENABLED:
+            cache_invalidations.inc(self.name)
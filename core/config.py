@@ -6,4 +6,131 @@ config = Config(".env")
 SECRET_KEY = config("SECRET_KEY", cast=Secret)
 ALGORITHM = config("ALGORITHM", cast=str)
 ACCESS_TOKEN_EXPIRE_MINUTES = config("ACCESS_TOKEN_EXPIRE_MINUTES", cast=int)
-API_URL = config("API_URL", cast=str)
\ No newline at end of file
+API_URL = config("API_URL", cast=str)
+
+# Maximum number of DynamoDB calls a worker keeps in flight at once.
+DYNAMODB_MAX_CONCURRENCY = config("DYNAMODB_MAX_CONCURRENCY", cast=int, default=32)
+
+# Point at DynamoDB Local (e.g. http://localhost:8000) instead of AWS.
+DYNAMODB_ENDPOINT_URL = config("DYNAMODB_ENDPOINT_URL", cast=str, default=None)
+
+# Default and maximum number of items returned by one page of a list endpoint.
+LIST_PAGE_SIZE = config("LIST_PAGE_SIZE", cast=int, default=100)
+LIST_MAX_PAGE_SIZE = config("LIST_MAX_PAGE_SIZE", cast=int, default=1000)
+
+# Number of recipients a bulk issuance works on concurrently.
+ISSUANCE_CONCURRENCY = config("ISSUANCE_CONCURRENCY", cast=int, default=32)
+
+# Background jobs: worker tasks per process, recipients handled between
+# progress saves, seconds to wait for queued jobs on shutdown, and where job
+# records are kept ("dynamodb" or "memory"). A worker claims a job for
+# JOB_LEASE_SECONDS and keeps renewing the claim while it runs; jobs whose
+# claim has lapsed (their worker died) are taken over by another worker.
+JOB_WORKERS = config("JOB_WORKERS", cast=int, default=2)
+JOB_CHUNK_SIZE = config("JOB_CHUNK_SIZE", cast=int, default=500)
+JOB_DRAIN_TIMEOUT = config("JOB_DRAIN_TIMEOUT", cast=float, default=30)
+JOB_STORE = config("JOB_STORE", cast=str, default="dynamodb")
+JOB_LEASE_SECONDS = config("JOB_LEASE_SECONDS", cast=int, default=60)
+
+# Outgoing email: where it goes ("ses", "file" or "memory"), the sender, the
+# file used by the "file" sink, SES sends per second and retries when SES
+# throttles. Setting SES_INVITE_TEMPLATE sends invites in bulk through that
+# SES template (publish it with python -m services.email). On shutdown,
+# queued email gets EMAIL_DRAIN_TIMEOUT seconds to go out.
+EMAIL_SINK = config("EMAIL_SINK", cast=str, default="ses")
+EMAIL_FROM_ADDRESS = config("EMAIL_FROM_ADDRESS", cast=str, default="digitalbadges@mail.fresnostate.edu")
+EMAIL_FILE_PATH = config("EMAIL_FILE_PATH", cast=str, default="outbox.jsonl")
+SES_MAX_SEND_RATE = config("SES_MAX_SEND_RATE", cast=float, default=14)
+SES_MAX_RETRIES = config("SES_MAX_RETRIES", cast=int, default=5)
+SES_INVITE_TEMPLATE = config("SES_INVITE_TEMPLATE", cast=str, default="")
+EMAIL_DRAIN_TIMEOUT = config("EMAIL_DRAIN_TIMEOUT", cast=float, default=30)
+
+# Users resolved from bearer tokens are cached per subject for this many
+# seconds; writes through UsersDB invalidate them, on other workers too
+# when core.cache.invalidation_bus has a transport. A size of 0 disables
+# the cache.
+USER_CACHE_SIZE = config("USER_CACHE_SIZE", cast=int, default=1024)
+USER_CACHE_TTL = config("USER_CACHE_TTL", cast=float, default=60)
+
+# Issuers (without their private keys) and badges are cached per worker for
+# this many seconds. Writes through IssuersDB and BadgesDB invalidate them,
+# on other workers too when core.cache.invalidation_bus has a transport. A
+# size of 0 disables a cache.
+ISSUER_CACHE_SIZE = config("ISSUER_CACHE_SIZE", cast=int, default=1024)
+ISSUER_CACHE_TTL = config("ISSUER_CACHE_TTL", cast=float, default=60)
+BADGE_CACHE_SIZE = config("BADGE_CACHE_SIZE", cast=int, default=4096)
+BADGE_CACHE_TTL = config("BADGE_CACHE_TTL", cast=float, default=60)
+
+# Password hashing: bcrypt cost, and the pool hashes run in ("process" or
+# "thread") so they stay off the event loop.
+BCRYPT_ROUNDS = config("BCRYPT_ROUNDS", cast=int, default=12)
+PASSWORD_HASH_POOL = config("PASSWORD_HASH_POOL", cast=str, default="process")
+PASSWORD_HASH_WORKERS = config("PASSWORD_HASH_WORKERS", cast=int, default=2)
+
+# Verified bearer tokens are remembered (until they expire) so repeat
+# requests skip signature checks. For RS*/PS*/ES* algorithms tokens are
+# signed with the private key file and verified with the public one; nodes
+# that only verify need just the public key.
+TOKEN_CACHE_SIZE = config("TOKEN_CACHE_SIZE", cast=int, default=4096)
+JWT_PRIVATE_KEY_FILE = config("JWT_PRIVATE_KEY_FILE", cast=str, default="")
+JWT_PUBLIC_KEY_FILE = config("JWT_PUBLIC_KEY_FILE", cast=str, default="")
+
+# Public issuer documents (profile and revocation list) are kept in memory
+# for PUBLIC_DOCUMENT_CACHE_TTL seconds and clients are told they may reuse
+# them for PUBLIC_DOCUMENT_MAX_AGE seconds.
+PUBLIC_DOCUMENT_CACHE_SIZE = config("PUBLIC_DOCUMENT_CACHE_SIZE", cast=int, default=1024)
+PUBLIC_DOCUMENT_CACHE_TTL = config("PUBLIC_DOCUMENT_CACHE_TTL", cast=float, default=300)
+PUBLIC_DOCUMENT_MAX_AGE = config("PUBLIC_DOCUMENT_MAX_AGE", cast=int, default=60)
+
+# Issuers whose revocations a worker keeps in memory, and seconds before it
+# reloads them from DynamoDB to pick up revocations made through other
+# workers.
+REVOCATION_INDEX_SIZE = config("REVOCATION_INDEX_SIZE", cast=int, default=1024)
+REVOCATION_INDEX_TTL = config("REVOCATION_INDEX_TTL", cast=float, default=300)
+
+# Certificate storage: "s3" (CERT_BUCKET) or "local" (a directory, for
+# development and tests).
+STORAGE_BACKEND = config("STORAGE_BACKEND", cast=str, default="s3")
+CERT_BUCKET = config("CERT_BUCKET", cast=str, default="dx.ubadges.poc")
+LOCAL_STORAGE_PATH = config("LOCAL_STORAGE_PATH", cast=str, default="storage")
+
+# Batch signing: certs read or written at once, and how Merkle roots are
+# anchored ("local" is a stub that doesn't touch a blockchain).
+SIGNING_CONCURRENCY = config("SIGNING_CONCURRENCY", cast=int, default=32)
+ANCHOR_BACKEND = config("ANCHOR_BACKEND", cast=str, default="local")
+
+# JSON-LD canonicalization for cert hashing: processes in the hashing pool.
+CANONICALIZE_WORKERS = config("CANONICALIZE_WORKERS", cast=int, default=4)
+
+# Certificate uploads: objects in flight at once (also the S3 connection
+# pool size) and retries of throttled or failed PUTs.
+STORAGE_MAX_CONCURRENCY = config("STORAGE_MAX_CONCURRENCY", cast=int, default=32)
+UPLOAD_MAX_RETRIES = config("UPLOAD_MAX_RETRIES", cast=int, default=5)
+
+# Cert storage layout: "objects" writes one object per cert, "packed" writes
+# a JSONL pack plus an offset index per issuance chunk and per signed batch.
+# PACK_GZIP_CHUNK_SIZE > 0 gzips packs in independently readable chunks of
+# that many certs. Signed packs are uploaded in parts of PACK_PART_SIZE
+# bytes (S3's minimum is 5 MiB) and packs are read back in ranges of
+# PACK_READ_SIZE bytes.
+CERT_STORAGE_FORMAT = config("CERT_STORAGE_FORMAT", cast=str, default="objects")
+PACK_GZIP_CHUNK_SIZE = config("PACK_GZIP_CHUNK_SIZE", cast=int, default=0)
+PACK_PART_SIZE = config("PACK_PART_SIZE", cast=int, default=8 * 1024 * 1024)
+PACK_READ_SIZE = config("PACK_READ_SIZE", cast=int, default=8 * 1024 * 1024)
+
+# Request, DynamoDB, storage and email metrics, served at /metrics in the
+# Prometheus text format. DynamoDB calls also ask for consumed capacity.
+METRICS_ENABLED = config("METRICS_ENABLED", cast=bool, default=True)
+
+# Per-request data-access tracing. With DB_TRACE on, responses carry an
+# X-DB-Trace summary header, and requests with more scans or repeats of an
+# identical read than these limits, or more than DB_TRACE_MAX_CALLS calls
+# (0 for no limit), are logged with every call they made.
+DB_TRACE = config("DB_TRACE", cast=bool, default=False)
+DB_TRACE_MAX_SCANS = config("DB_TRACE_MAX_SCANS", cast=int, default=0)
+DB_TRACE_MAX_REPEATS = config("DB_TRACE_MAX_REPEATS", cast=int, default=1)
+DB_TRACE_MAX_CALLS = config("DB_TRACE_MAX_CALLS", cast=int, default=0)
+
+# Validate every item read from DynamoDB with its pydantic model instead of
+# trusting what the service wrote. Slow; for debugging.
+DB_STRICT_HYDRATION = config("DB_STRICT_HYDRATION", cast=bool, default=False)
@@ -0,0 +1,229 @@
+# Standard library
+import bisect
+import time
+
+# Third party libraries
+from starlette.routing import Match
+
+# Package
+from core.config import METRICS_ENABLED
+
+
+# Seconds; from a fast DynamoDB read up to a slow bulk request.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+
+def escape(value: str):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names, values, extra: str = ""):
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """A named family of series, one per combination of label values.
+
+    Updates aren't locked; like the caches they're made from the event loop.
+    """
+
+    type = "untyped"
+
+    def __init__(self, name: str, description: str, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.series = {}
+
+    def render(self):
+        yield f"# HELP {self.name} {self.description}"
+        yield f"# TYPE {self.name} {self.type}"
+        for values, value in sorted(self.series.items()):
+            yield f"{self.name}{format_labels(self.labels, values)} {format_value(value)}"
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *values, amount=1):
+        self.series[values] = self.series.get(values, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def inc(self, *values, amount=1):
+        self.series[values] = self.series.get(values, 0) + amount
+
+    def dec(self, *values, amount=1):
+        self.series[values] = self.series.get(values, 0) - amount
+
+    def set(self, *values, value=0):
+        self.series[values] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, description: str, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, amount: float, *values):
+        series = self.series.get(values)
+        if series is None:
+            # Per-bucket counts (the last is +Inf), sum, count.
+            series = self.series[values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, amount)] += 1
+        series[1] += amount
+        series[2] += 1
+
+    def render(self):
+        yield f"# HELP {self.name} {self.description}"
+        yield f"# TYPE {self.name} {self.type}"
+        bounds = [*self.buckets, float("inf")]
+        for values, (counts, total, count) in sorted(self.series.items()):
+            cumulative = 0
+            for bound, bucket in zip(bounds, counts):
+                cumulative += bucket
+                le = format_labels(self.labels, values, f'le="{format_value(bound)}"')
+                yield f"{self.name}_bucket{le} {cumulative}"
+            labels = format_labels(self.labels, values)
+            yield f"{self.name}_sum{labels} {format_value(total)}"
+            yield f"{self.name}_count{labels} {count}"
+
+
+class Registry:
+    """Every metric of this process, rendered in the Prometheus text format.
+
+    Each worker process has its own registry, so with several workers each
+    scrape sees one of them; label the scrape targets per worker.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric: Metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, description: str, labels=()):
+        return self.register(Counter(name, description, labels))
+
+    def gauge(self, name: str, description: str, labels=()):
+        return self.register(Gauge(name, description, labels))
+
+    def histogram(self, name: str, description: str, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, description, labels, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+class CallMetrics:
+    """Count, failures and latency of the calls made to one backend."""
+
+    def __init__(self, prefix: str, subject: str, labels=()):
+        self.calls = registry.counter(f"{prefix}_requests_total", f"{subject} calls made.", labels)
+        self.errors = registry.counter(f"{prefix}_request_errors_total", f"{subject} calls that raised.", labels)
+        self.duration = registry.histogram(
+            f"{prefix}_request_duration_seconds",
+            f"{subject} call latency in seconds, including time queued for a worker thread.",
+            labels
+        )
+
+    async def measure(self, values: tuple, awaitable):
+        if not METRICS_ENABLED:
+            return await awaitable
+        started = time.perf_counter()
+        try:
+            return await awaitable
+        except Exception:
+            self.errors.inc(*values)
+            raise
+        finally:
+            self.calls.inc(*values)
+            self.duration.observe(time.perf_counter() - started, *values)
+
+
+http_requests = registry.counter(
+    "http_requests_total",
+    "HTTP requests handled, by route template and status.",
+    ("method", "route", "status")
+)
+http_duration = registry.histogram(
+    "http_request_duration_seconds",
+    "Time from receiving a request to sending the end of its response.",
+    ("method", "route")
+)
+http_in_flight = registry.gauge(
+    "http_requests_in_flight",
+    "HTTP requests being handled right now.",
+    ("method", "route")
+)
+
+
+class MetricsMiddleware:
+    """Per-route latency histograms, counts by status, and in-flight gauges.
+
+    Requests are labelled with the matching route's path template
+    ("/issuers/{issuer_id}"), not the raw path, so ids don't turn into
+    series of their own.
+    """
+
+    def __init__(self, app, router):
+        self.app = app
+        self.router = router
+
+    def route_of(self, scope):
+        partial = None
+        for route in self.router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+            if match == Match.PARTIAL and partial is None:
+                partial = route.path
+        return partial or "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route = self.route_of(scope)
+        status = 500
+
+        async def send_and_record(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        http_in_flight.inc(method, route)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_and_record)
+        finally:
+            http_in_flight.dec(method, route)
+            http_duration.observe(time.perf_counter() - started, method, route)
+            http_requests.inc(method, route, str(status))
@@ -0,0 +1,91 @@
+# Standard library
+import base64
+import binascii
+import json
+from urllib.parse import urlencode
+
+# Third party libraries
+import orjson
+from fastapi import HTTPException, Query
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.status import HTTP_400_BAD_REQUEST
+
+# Package
+from core.config import LIST_PAGE_SIZE, LIST_MAX_PAGE_SIZE
+from core.responses import json_default, project
+
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+class InvalidCursor(ValueError):
+    """A cursor that isn't a start key for the table or index being paged."""
+
+
+def encode_cursor(key: dict) -> str:
+    """Turn a DynamoDB LastEvaluatedKey into an opaque, URL-safe cursor."""
+    raw = json.dumps(key, separators=(",", ":"), default=json_default)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict:
+    padded = cursor + "=" * (-len(cursor) % 4)
+    try:
+        key = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursor("Malformed cursor")
+    if not isinstance(key, dict):
+        raise InvalidCursor("Malformed cursor")
+    return key
+
+
+class PageParams:
+    """Query parameters shared by every paginated list endpoint."""
+
+    def __init__(
+        self,
+        limit: int = Query(LIST_PAGE_SIZE, ge=1, le=LIST_MAX_PAGE_SIZE),
+        cursor: str = None
+    ):
+        self.limit = limit
+        self.start_key = None
+        if cursor:
+            try:
+                self.start_key = decode_cursor(cursor)
+            except InvalidCursor:
+                raise HTTPException(status_code=HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+async def invalid_cursor_handler(request: Request, exc: InvalidCursor):
+    # The db layer only learns which table a cursor is for once the page is
+    # read, after PageParams has run.
+    return JSONResponse({"detail": "Invalid cursor"}, status_code=HTTP_400_BAD_REQUEST)
+
+
+def set_next_link(request: Request, response: Response, last_key: dict):
+    """Point the client at the next page with a `Link: <...>; rel="next"` header."""
+    if not last_key:
+        return
+    params = dict(request.query_params)
+    params["cursor"] = encode_cursor(last_key)
+    url = request.url.replace(query=urlencode(params))
+    response.headers["Link"] = f'<{url}>; rel="next"'
+
+
+def wants_ndjson(request: Request) -> bool:
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def ndjson_response(pages, model):
+    """Stream items as newline-delimited JSON while the pages are read.
+
+    Only one DynamoDB page is held in memory at a time. Each item is
+    projected onto `model` since a streamed response skips FastAPI's
+    response_model filtering.
+    """
+    async def lines():
+        async for page in pages:
+            yield b"".join(orjson.dumps(project(item, model), default=json_default) + b"\n" for item in page)
+
+    return StreamingResponse(lines(), media_type=NDJSON_MEDIA_TYPE)
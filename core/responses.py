@@ -0,0 +1,73 @@
+# Standard library
+from decimal import Decimal
+from enum import Enum
+
+# Third party libraries
+import orjson
+from pydantic import BaseModel
+from starlette.responses import JSONResponse, Response
+
+
+def json_default(value):
+    if isinstance(value, BaseModel):
+        return value.dict()
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class ORJSONResponse(JSONResponse):
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, default=json_default)
+
+
+def _is_model(type_):
+    return isinstance(type_, type) and issubclass(type_, BaseModel)
+
+
+def project(value: BaseModel, model):
+    """Re-shape an already validated model into `model` without validating it again.
+
+    Only the fields `model` declares are copied, recursing into nested
+    models, so e.g. an IssuerInDB projected onto IssuerOut loses its
+    private keys exactly as response_model filtering would drop them.
+    """
+    if type(value) is model:
+        return value
+    fields = {}
+    for name, field in model.__fields__.items():
+        item = getattr(value, name, field.default)
+        if item is not None and _is_model(field.type_):
+            if isinstance(item, list):
+                item = [project(element, field.type_) for element in item]
+            elif isinstance(item, BaseModel):
+                item = project(item, field.type_)
+        fields[name] = item
+    return model.construct(**fields)
+
+
+# Set per response by the response class itself.
+_SKIPPED_HEADERS = {"content-length", "content-type"}
+
+
+def model_response(content, model, response: Response = None, status_code: int = 200):
+    """Return db models as `model`, serialized once with orjson.
+
+    FastAPI validates and re-encodes whatever a handler returns against its
+    response_model, unless the handler returns a Response itself. Models
+    from the db layer are already validated, so this projects them onto
+    the output model and hands back the finished response. Keep the
+    endpoint's response_model for the docs. Headers set on `response`
+    (Location, Link) are carried over.
+    """
+    if isinstance(content, list):
+        body = [project(item, model) for item in content]
+    else:
+        body = project(content, model)
+    headers = None
+    if response is not None:
+        headers = {key: value for key, value in response.headers.items() if key not in _SKIPPED_HEADERS}
+    return ORJSONResponse(body, status_code=status_code, headers=headers)
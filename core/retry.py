@@ -0,0 +1,22 @@
+# Standard library
+import asyncio
+import random
+
+
+async def with_backoff(attempt, retryable, max_retries: int):
+    """Await attempt() until it succeeds, retrying the errors retryable(error)
+    accepts up to max_retries times.
+
+    Waits between attempts grow exponentially with full jitter, capped at
+    20 seconds, and are spent outside attempt(), so anything it holds (a
+    semaphore, say) is released while backing off.
+    """
+    retries = 0
+    while True:
+        try:
+            return await attempt()
+        except Exception as error:
+            if retries >= max_retries or not retryable(error):
+                raise
+        retries += 1
+        await asyncio.sleep(random.uniform(0, min(20, 0.1 * 2 ** retries)))
@@ -0,0 +1,212 @@
+# Standard library
+import logging
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import NamedTuple
+
+# Package
+from core.config import DB_TRACE_MAX_SCANS, DB_TRACE_MAX_REPEATS, DB_TRACE_MAX_CALLS
+
+
+logger = logging.getLogger(__name__)
+
+# Reads whose repetition within one request is worth flagging.
+READS = ("get_item", "batch_get_item", "query", "scan", "get", "get_range", "exists", "list")
+
+
+class Call(NamedTuple):
+    service: str
+    resource: str
+    operation: str
+    key: str
+    duration: float
+
+    def __str__(self):
+        return f"{self.service} {self.resource} {self.operation} {self.key} ({self.duration * 1000:.1f} ms)"
+
+
+class Trace:
+    """Every data-access call made while handling one request."""
+
+    def __init__(self):
+        self.calls = []
+        self.started = time.perf_counter()
+
+    def record(self, service: str, resource: str, operation: str, key: str, duration: float):
+        self.calls.append(Call(service, resource, operation, key, duration))
+
+    def count(self, service: str = None, operation: str = None):
+        return sum(
+            1 for call in self.calls
+            if (service is None or call.service == service)
+            and (operation is None or call.operation == operation)
+        )
+
+    @property
+    def scans(self):
+        return [call for call in self.calls if call.operation == "scan"]
+
+    @property
+    def repeats(self):
+        """Identical reads made more than once, with how many times."""
+        reads = Counter(call[:4] for call in self.calls if call.operation in READS)
+        return {read: times for read, times in reads.items() if times > 1}
+
+    def problems(
+        self,
+        max_scans: int = DB_TRACE_MAX_SCANS,
+        max_repeats: int = DB_TRACE_MAX_REPEATS,
+        max_calls: int = DB_TRACE_MAX_CALLS
+    ):
+        problems = []
+        if len(self.scans) > max_scans:
+            problems.append(f"{len(self.scans)} scan(s)")
+        for (service, resource, operation, key), times in self.repeats.items():
+            if times > max_repeats:
+                problems.append(f"{service} {resource} {operation} {key} made {times} times")
+        if max_calls and len(self.calls) > max_calls:
+            problems.append(f"{len(self.calls)} calls")
+        return problems
+
+    def summary(self):
+        return (
+            f"calls={len(self.calls)}; dynamodb={self.count('dynamodb')}; scans={len(self.scans)}; "
+            f"repeats={sum(times - 1 for times in self.repeats.values())}; "
+            f"time={sum(call.duration for call in self.calls) * 1000:.1f}ms"
+        )
+
+    def format(self):
+        return "\n".join(f"  {call}" for call in self.calls) or "  (no calls)"
+
+
+current_trace = ContextVar("current_trace", default=None)
+
+
+def record(service: str, resource: str, operation: str, key: str, started: float):
+    trace = current_trace.get()
+    if trace is not None:
+        trace.record(service, resource, operation, key, time.perf_counter() - started)
+
+
+@contextmanager
+def tracing():
+    """Trace the data-access calls made inside the block, including by tasks it starts.
+
+    An active trace is reused, so a request handled inside the block adds
+    its calls to the caller's trace.
+    """
+    trace = current_trace.get()
+    if trace is not None:
+        yield trace
+        return
+    trace = Trace()
+    token = current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        current_trace.reset(token)
+
+
+@contextmanager
+def expect_calls(at_most: int, service: str = "dynamodb", scans: int = None, repeats: int = None):
+    """Fail with the full trace if the block makes more calls than budgeted.
+
+        with expect_calls(at_most=2):
+            await client.request("GET", f"/issuers/{issuer_id}", headers=headers)
+
+    `scans` and `repeats` additionally cap scans and repeated identical
+    reads (the extra calls beyond the first of each).
+    """
+    with tracing() as trace:
+        yield trace
+    failures = []
+    if trace.count(service) > at_most:
+        failures.append(f"{trace.count(service)} {service} calls, expected at most {at_most}")
+    if scans is not None and len(trace.scans) > scans:
+        failures.append(f"{len(trace.scans)} scans, expected at most {scans}")
+    extra = sum(times - 1 for times in trace.repeats.values())
+    if repeats is not None and extra > repeats:
+        failures.append(f"{extra} repeated reads, expected at most {repeats}")
+    if failures:
+        raise AssertionError("; ".join(failures) + "\n" + trace.format())
+
+
+def describe(condition):
+    """A short, readable form of a boto3 condition object."""
+    if condition is None:
+        return ""
+    if isinstance(condition, str):
+        return condition
+    expression = condition.get_expression()
+    values = expression["values"]
+    if type(condition).__name__ in ("And", "Or"):
+        return f" {expression['operator']} ".join(describe(value) for value in values)
+    if type(condition).__name__ == "Not":
+        return f"NOT {describe(values[0])}"
+    return " ".join(
+        [getattr(values[0], "name", str(values[0])), expression["operator"], *(
+            getattr(value, "name", repr(value)) for value in values[1:]
+        )]
+    )
+
+
+def describe_call(kwargs: dict):
+    """The key (or index and key condition) a DynamoDB call addresses."""
+    if "Key" in kwargs:
+        return ",".join(f"{name}={value}" for name, value in sorted(kwargs["Key"].items()))
+    if "RequestItems" in kwargs:
+        # Batch reads name their keys; batch writes just count their requests.
+        return "; ".join(
+            " ".join(
+                ",".join(f"{name}={value}" for name, value in sorted(key.items()))
+                for key in requests["Keys"]
+            ) if isinstance(requests, dict) else f"{len(requests)} requests"
+            for requests in kwargs["RequestItems"].values()
+        )
+    parts = []
+    if "IndexName" in kwargs:
+        parts.append(kwargs["IndexName"])
+    if "KeyConditionExpression" in kwargs:
+        parts.append(describe(kwargs["KeyConditionExpression"]))
+    if "FilterExpression" in kwargs:
+        parts.append(f"filter {describe(kwargs['FilterExpression'])}")
+    if "ExclusiveStartKey" in kwargs:
+        parts.append(f"after {sorted(kwargs['ExclusiveStartKey'].items())}")
+    return " ".join(parts)
+
+
+class TracingMiddleware:
+    """Traces each request's data-access calls.
+
+    The summary goes out in an X-DB-Trace header, and requests that scan
+    or repeat reads beyond the configured limits are logged with every
+    call they made. Streamed responses report the calls made before their
+    first byte.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with tracing() as trace:
+            async def send_with_trace(message):
+                if message["type"] == "http.response.start":
+                    headers = list(message.get("headers", []))
+                    headers.append((b"x-db-trace", trace.summary().encode()))
+                    message = {**message, "headers": headers}
+                await send(message)
+
+            await self.app(scope, receive, send_with_trace)
+
+        problems = trace.problems()
+        if problems:
+            logger.warning(
+                "%s %s: %s\n%s",
+                scope["method"], scope["path"], "; ".join(problems), trace.format()
+            )
@@ -1,59 +1,128 @@
 # Standard library
 import uuid
-from datetime import datetime
-from typing import List
+from typing import List, Tuple
 
 # Third party libraries
-import boto3
 from boto3.dynamodb.conditions import Key, Attr
+from botocore.exceptions import ClientError
 
 # Package
+from core.cache import ReadThroughCache
+from core.config import BADGE_CACHE_SIZE, BADGE_CACHE_TTL
+from db.dynamodb import AsyncTable, is_condition_failure
+from db.hydrate import hydrate, hydrate_all
 from models.badges import BadgeIn, BadgeInDB
 
 
+# Badges keyed by (badge_id, issuer_id). Writes through BadgesDB invalidate it.
+badge_cache = ReadThroughCache("badges", BADGE_CACHE_SIZE, BADGE_CACHE_TTL)
+
+
 class BadgesDB:
 
-    dynamodb = boto3.resource("dynamodb")
-    table = dynamodb.Table("ubadges.badges")
+    table = AsyncTable("ubadges.badges")
 
     async def get_all_badges(self):
-        result = self.table.scan()
-        badges = result.get("Items")
-        return list(map(lambda badge: BadgeInDB(**badge), badges))
+        badges = await self.table.scan_all()
+        return hydrate_all(BadgeInDB, badges)
 
 
     async def get_badge_by_id(self, badge_id: str, issuer_id: str):
-        result = self.table.get_item(
-            Key={'id': badge_id, 'issuer_id': issuer_id}
-        )
-        badge = result.get("Item")
-        if not badge is None:
-            return BadgeInDB(**badge)
-        return None
+        async def load():
+            result = await self.table.get_item(
+                Key={'id': badge_id, 'issuer_id': issuer_id}
+            )
+            badge = result.get("Item")
+            if not badge is None:
+                return hydrate(BadgeInDB, badge)
+            return None
+        return await badge_cache.get((badge_id, issuer_id), load)
+
+
+    async def get_badges_by_ids(self, keys: List[Tuple[str, str]]):
+        """Badges for (badge_id, issuer_id) pairs, in no particular order."""
+        async def load(missing):
+            badges = await self.table.batch_get([
+                {"id": badge_id, "issuer_id": issuer_id} for badge_id, issuer_id in missing
+            ])
+            return {(badge["id"], badge["issuer_id"]): hydrate(BadgeInDB, badge) for badge in badges}
+        return list((await badge_cache.get_many(keys, load)).values())
 
 
     async def get_badge_by_name(self, name: str):
-        result = self.table.scan(FilterExpression=Attr("name").eq(name))
+        result = await self.table.query(
+            IndexName="name-index",
+            KeyConditionExpression=Key("name").eq(name),
+            Limit=1
+        )
         badges = result.get("Items")
         if badges:
             badge = badges[0]
-            return BadgeInDB(**badge)
+            return hydrate(BadgeInDB, badge)
         return None
 
 
     async def get_badges_by_issuer_id(self, issuer_id: str):
-        result = self.table.scan(FilterExpression=Attr("issuer_id").eq(issuer_id))
-        badges = result.get("Items")
-        return list(map(lambda badge: BadgeInDB(**badge), badges))   
+        badges = await self.table.query_all(
+            IndexName="issuer_id-index",
+            KeyConditionExpression=Key("issuer_id").eq(issuer_id)
+        )
+        return hydrate_all(BadgeInDB, badges)   
     
 
+    async def get_badges_page_by_issuer_id(self, issuer_id: str, limit: int, start_key: dict = None):
+        badges, last_key = await self.table.query_page(
+            limit,
+            start_key,
+            IndexName="issuer_id-index",
+            KeyConditionExpression=Key("issuer_id").eq(issuer_id)
+        )
+        return hydrate_all(BadgeInDB, badges), last_key
+
+
+    async def iter_badge_pages_by_issuer_id(self, issuer_id: str):
+        pages = self.table.query_pages(
+            IndexName="issuer_id-index",
+            KeyConditionExpression=Key("issuer_id").eq(issuer_id)
+        )
+        async for badges in pages:
+            yield hydrate_all(BadgeInDB, badges)
+
+
     async def create_badge(self, badge: BadgeIn):
         badge_id = str(uuid.uuid4())
         badge_dict = badge.dict()
         badge_dict["id"] = badge_id
-        self.table.put_item(Item=badge_dict)
+        await self.table.put_item(Item=badge_dict)
+        badge_cache.invalidate((badge_id, badge.issuer_id))
         return await self.get_badge_by_id(badge_id, badge.issuer_id)
 
 
-    async def update_badge(self):
-        pass
\ No newline at end of file
+    async def update_badge(self, badge_id: str, badge: BadgeIn):
+        """Overwrite the badge's fields with `badge`'s; None if there's no such badge."""
+        try:
+            result = await self.table.update_item(
+                Key={"id": badge_id, "issuer_id": badge.issuer_id},
+                UpdateExpression=(
+                    "SET #badge_name = :n, description = :d, criteria = :c, image = :i, "
+                    "signatureLines = :s, template = :t"
+                ),
+                ConditionExpression=Attr("id").exists(),
+                ExpressionAttributeNames={"#badge_name": "name"},
+                ExpressionAttributeValues={
+                    ":n": badge.name,
+                    ":d": badge.description,
+                    ":c": badge.criteria.dict(),
+                    ":i": badge.image,
+                    ":s": [line.dict() for line in badge.signatureLines],
+                    ":t": badge.template
+                },
+                ReturnValues="ALL_NEW"
+            )
+        except ClientError as error:
+            if not is_condition_failure(error):
+                raise
+            return None
+        finally:
+            badge_cache.invalidate((badge_id, badge.issuer_id))
+        return hydrate(BadgeInDB, result["Attributes"])
@@ -0,0 +1,99 @@
+# Standard library
+from typing import List
+
+# Third party libraries
+from boto3.dynamodb.conditions import Key, Attr
+from botocore.exceptions import ClientError
+
+# Package
+from db.dynamodb import AsyncTable, is_condition_failure
+from db.hydrate import hydrate_all
+from models.certs import CertInDB
+
+
+def to_item(cert: CertInDB):
+    item = cert.dict()
+    if item["issued_at"] is not None:
+        item["issued_at"] = item["issued_at"].isoformat()
+    # Index keys can't be null; leaving them out keeps the item out of the index.
+    return {key: value for key, value in item.items() if value is not None}
+
+
+class CertsDB:
+    """Issued certs, one item each, keyed by recipient_id and cert_id.
+
+    Listing by issuer or badge goes through the issuer_id and badge_id
+    indexes, newest first.
+    """
+
+    table = AsyncTable("ubadges.certs")
+
+
+    async def get_certs_page_by_recipient_id(self, recipient_id: str, limit: int, start_key: dict = None):
+        certs, last_key = await self.table.query_page(
+            limit,
+            start_key,
+            KeyConditionExpression=Key("recipient_id").eq(recipient_id)
+        )
+        return hydrate_all(CertInDB, certs), last_key
+
+
+    async def iter_cert_pages_by_recipient_id(self, recipient_id: str):
+        pages = self.table.query_pages(
+            KeyConditionExpression=Key("recipient_id").eq(recipient_id)
+        )
+        async for certs in pages:
+            yield hydrate_all(CertInDB, certs)
+
+
+    def _owner_query(self, issuer_id: str, badge_id: str = None):
+        if badge_id is not None:
+            return {
+                "IndexName": "badge_id-index",
+                "KeyConditionExpression": Key("badge_id").eq(badge_id),
+                "ScanIndexForward": False
+            }
+        return {
+            "IndexName": "issuer_id-index",
+            "KeyConditionExpression": Key("issuer_id").eq(issuer_id),
+            "ScanIndexForward": False
+        }
+
+
+    async def get_certs_page_by_issuer_id(self, issuer_id: str, limit: int, start_key: dict = None, badge_id: str = None):
+        certs, last_key = await self.table.query_page(limit, start_key, **self._owner_query(issuer_id, badge_id))
+        return hydrate_all(CertInDB, certs), last_key
+
+
+    async def iter_cert_pages_by_issuer_id(self, issuer_id: str, badge_id: str = None):
+        async for certs in self.table.query_pages(**self._owner_query(issuer_id, badge_id)):
+            yield hydrate_all(CertInDB, certs)
+
+
+    async def create_cert(self, cert: CertInDB):
+        await self.table.put_item(Item=to_item(cert))
+        return cert
+
+
+    async def create_cert_once(self, cert: CertInDB):
+        """Record the cert unless it already is; True if this call wrote it."""
+        try:
+            await self.table.put_item(Item=to_item(cert), ConditionExpression=Attr("cert_id").not_exists())
+        except ClientError as error:
+            if not is_condition_failure(error):
+                raise
+            return False
+        return True
+
+
+    async def get_recorded_cert_ids(self, certs: List[CertInDB]):
+        """The ids of those certs that are already recorded."""
+        items = await self.table.batch_get([
+            {"recipient_id": cert.recipient_id, "cert_id": cert.cert_id} for cert in certs
+        ])
+        return {item["cert_id"] for item in items}
+
+
+    async def create_certs(self, certs: List[CertInDB]):
+        await self.table.batch_put([to_item(cert) for cert in certs])
+        return certs
@@ -0,0 +1,200 @@
+# Standard library
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Third party libraries
+import boto3
+from botocore.config import Config as BotoConfig
+from botocore.exceptions import ClientError
+
+# Package
+from core.config import DYNAMODB_MAX_CONCURRENCY, DYNAMODB_ENDPOINT_URL, METRICS_ENABLED
+from core.metrics import CallMetrics, registry
+from core.pagination import InvalidCursor
+from core.tracing import current_trace, describe_call, record
+from db.schema import KEYS, key_attributes
+
+
+# boto3 is synchronous, so every call is handed to a bounded pool of threads.
+# The pool size doubles as the limit on in-flight DynamoDB calls per worker,
+# and the HTTP connection pool is sized to match so no thread waits on a socket.
+executor = ThreadPoolExecutor(
+    max_workers=DYNAMODB_MAX_CONCURRENCY,
+    thread_name_prefix="dynamodb"
+)
+
+dynamodb = boto3.resource(
+    "dynamodb",
+    endpoint_url=DYNAMODB_ENDPOINT_URL,
+    config=BotoConfig(max_pool_connections=DYNAMODB_MAX_CONCURRENCY)
+)
+
+
+async def run_in_executor(func, *args, **kwargs):
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
+
+
+calls = CallMetrics("dynamodb", "DynamoDB", ("table", "operation"))
+consumed_capacity = registry.counter(
+    "dynamodb_consumed_capacity_units_total",
+    "Read and write capacity units DynamoDB reported as consumed.",
+    ("table", "operation")
+)
+
+
+def record_capacity(operation: str, consumed):
+    # A dict for single-table calls, a list of them for batch calls.
+    if isinstance(consumed, dict):
+        consumed = [consumed]
+    for entry in consumed or ():
+        consumed_capacity.inc(entry["TableName"], operation, amount=entry.get("CapacityUnits", 0))
+
+
+async def call(table: str, operation: str, func, **kwargs):
+    """Run one DynamoDB call in the pool, recording its latency and capacity.
+
+    The call is also added to the request's trace, if one is active.
+    """
+    traced = current_trace.get() is not None
+    if not METRICS_ENABLED and not traced:
+        return await run_in_executor(func, **kwargs)
+    started = time.perf_counter()
+    try:
+        if not METRICS_ENABLED:
+            return await run_in_executor(func, **kwargs)
+        kwargs.setdefault("ReturnConsumedCapacity", "TOTAL")
+        result = await calls.measure((table, operation), run_in_executor(func, **kwargs))
+        record_capacity(operation, result.get("ConsumedCapacity"))
+        return result
+    finally:
+        if traced:
+            record("dynamodb", table, operation, describe_call(kwargs), started)
+
+
+def is_condition_failure(error: ClientError):
+    return error.response.get("Error", {}).get("Code") == "ConditionalCheckFailedException"
+
+
+class AsyncTable:
+    """Awaitable wrapper around a boto3 DynamoDB Table.
+
+    All tables share one resource, and so one connection pool. Table actions
+    don't touch resource state, which makes them safe to call from the pool.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.table = dynamodb.Table(name)
+
+    async def get_item(self, **kwargs):
+        return await call(self.name, "get_item", self.table.get_item, **kwargs)
+
+    async def put_item(self, **kwargs):
+        return await call(self.name, "put_item", self.table.put_item, **kwargs)
+
+    async def update_item(self, **kwargs):
+        return await call(self.name, "update_item", self.table.update_item, **kwargs)
+
+    async def delete_item(self, **kwargs):
+        return await call(self.name, "delete_item", self.table.delete_item, **kwargs)
+
+    async def query(self, **kwargs):
+        return await call(self.name, "query", self.table.query, **kwargs)
+
+    async def scan(self, **kwargs):
+        return await call(self.name, "scan", self.table.scan, **kwargs)
+
+    async def query_all(self, **kwargs):
+        return await self._collect(self.query, **kwargs)
+
+    async def scan_all(self, **kwargs):
+        return await self._collect(self.scan, **kwargs)
+
+    async def query_page(self, limit: int, start_key: dict = None, **kwargs):
+        return await self._page(self.query, limit, start_key, **kwargs)
+
+    async def scan_page(self, limit: int, start_key: dict = None, **kwargs):
+        return await self._page(self.scan, limit, start_key, **kwargs)
+
+    def query_pages(self, **kwargs):
+        return self._pages(self.query, **kwargs)
+
+    def scan_pages(self, **kwargs):
+        return self._pages(self.scan, **kwargs)
+
+    async def batch_put(self, items: list):
+        # BatchWriteItem takes at most 25 requests and may hand some of them
+        # back unprocessed when the table is throttled, so retry those.
+        for start in range(0, len(items), 25):
+            request = {
+                self.name: [{"PutRequest": {"Item": item}} for item in items[start:start + 25]]
+            }
+            attempt = 0
+            while request:
+                if attempt:
+                    await asyncio.sleep(min(0.05 * 2 ** attempt, 2))
+                result = await call(self.name, "batch_write_item", dynamodb.batch_write_item, RequestItems=request)
+                request = result.get("UnprocessedItems")
+                attempt += 1
+
+    async def batch_get(self, keys: list):
+        """Every item with one of `keys`, in no particular order; missing keys are left out."""
+        # BatchGetItem rejects repeated keys and takes at most 100 per call.
+        unique = list({tuple(sorted(key.items())): key for key in keys}.values())
+        chunks = await asyncio.gather(*(
+            self._batch_get_chunk(unique[start:start + 100]) for start in range(0, len(unique), 100)
+        ))
+        return [item for chunk in chunks for item in chunk]
+
+    async def _batch_get_chunk(self, keys: list):
+        # Like batch writes, reads may come back partly unprocessed when the
+        # table is throttled, so retry the keys DynamoDB hands back.
+        items = []
+        request = {self.name: {"Keys": keys}}
+        attempt = 0
+        while request:
+            if attempt:
+                await asyncio.sleep(min(0.05 * 2 ** attempt, 2))
+            result = await call(self.name, "batch_get_item", dynamodb.batch_get_item, RequestItems=request)
+            items.extend(result.get("Responses", {}).get(self.name, []))
+            request = result.get("UnprocessedKeys")
+            attempt += 1
+        return items
+
+    async def _page(self, operation, limit, start_key, **kwargs):
+        kwargs["Limit"] = limit
+        if start_key:
+            self._check_start_key(start_key, kwargs.get("IndexName"))
+            kwargs["ExclusiveStartKey"] = start_key
+        result = await operation(**kwargs)
+        return result.get("Items", []), result.get("LastEvaluatedKey")
+
+    def _check_start_key(self, start_key: dict, index: str = None):
+        # Start keys arrive as client cursors. One without exactly the key's
+        # attributes, or with values that can't be key values, would make
+        # DynamoDB fail the call with a ValidationException.
+        if self.name not in KEYS:
+            return
+        if set(start_key) != key_attributes(self.name, index):
+            raise InvalidCursor("Cursor doesn't match the key")
+        if not all(isinstance(value, (str, int)) and not isinstance(value, bool) for value in start_key.values()):
+            raise InvalidCursor("Cursor doesn't match the key")
+
+    async def _pages(self, operation, **kwargs):
+        # A single query or scan stops at 1 MB, so keep following
+        # LastEvaluatedKey until DynamoDB says there is nothing left.
+        while True:
+            result = await operation(**kwargs)
+            yield result.get("Items", [])
+            if "LastEvaluatedKey" not in result:
+                return
+            kwargs["ExclusiveStartKey"] = result["LastEvaluatedKey"]
+
+    async def _collect(self, operation, **kwargs):
+        items = []
+        async for page in self._pages(operation, **kwargs):
+            items.extend(page)
+        return items
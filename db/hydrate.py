@@ -0,0 +1,95 @@
+# Standard library
+from copy import deepcopy
+from datetime import datetime
+from enum import Enum
+
+# Third party libraries
+from pydantic import BaseModel
+from pydantic.datetime_parse import parse_datetime
+from pydantic.fields import SHAPE_SINGLETON, SHAPE_LIST, SHAPE_SET, SHAPE_SEQUENCE, SHAPE_MAPPING
+
+# Package
+from core.config import DB_STRICT_HYDRATION
+
+
+# Items in DynamoDB were written by this service from validated models, so
+# reads rebuild models without validating them again. The only coercion
+# needed is undoing what DynamoDB and str() did on the way in: numbers come
+# back as Decimal, datetimes and enums as strings, nested models as dicts.
+# Each model's field converters are worked out once and cached.
+
+_MISSING = object()
+_plans = {}
+
+
+def _parse_datetime(value):
+    # Everything this service writes is ISO format, which the C parser
+    # handles; anything else falls back to pydantic's parser.
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            pass
+    return parse_datetime(value)
+
+
+def _scalar_converter(type_):
+    if isinstance(type_, type) and issubclass(type_, BaseModel):
+        return lambda value: hydrate(type_, value)
+    if isinstance(type_, type) and issubclass(type_, Enum):
+        return type_
+    if type_ is datetime:
+        return _parse_datetime
+    if type_ is int:
+        return int
+    if type_ is float:
+        return float
+    return None
+
+
+def _converter(field):
+    convert = _scalar_converter(field.type_)
+    if convert is None or field.shape == SHAPE_SINGLETON:
+        return convert
+    if field.shape in (SHAPE_LIST, SHAPE_SEQUENCE):
+        return lambda values: [convert(value) for value in values]
+    if field.shape == SHAPE_SET:
+        return lambda values: {convert(value) for value in values}
+    if field.shape == SHAPE_MAPPING:
+        return lambda values: {key: convert(value) for key, value in values.items()}
+    return None
+
+
+def _plan(model):
+    plan = _plans.get(model)
+    if plan is None:
+        plan = _plans[model] = [
+            (name, _converter(field), field.default)
+            for name, field in model.__fields__.items()
+        ]
+    return plan
+
+
+def hydrate(model, item: dict):
+    """Build `model` from a DynamoDB item without validation (unless strict)."""
+    if DB_STRICT_HYDRATION:
+        return model(**item)
+    values = {}
+    fields_set = set()
+    for name, convert, default in _plan(model):
+        value = item.get(name, _MISSING)
+        if value is _MISSING:
+            # Copy so instances never share a mutable default.
+            values[name] = default if default is None else deepcopy(default)
+            continue
+        fields_set.add(name)
+        values[name] = value if value is None or convert is None else convert(value)
+    # What BaseModel.construct does, minus its deepcopy of every default.
+    instance = model.__new__(model)
+    object.__setattr__(instance, "__dict__", values)
+    object.__setattr__(instance, "__fields_set__", fields_set)
+    return instance
+
+
+def hydrate_all(model, items: list):
+    return [hydrate(model, item) for item in items]
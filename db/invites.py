@@ -6,10 +6,12 @@ from datetime import datetime
 from typing import List
 
 # Third party libraries
-import boto3
 from boto3.dynamodb.conditions import Key, Attr
+from botocore.exceptions import ClientError
 
 # Package
+from db.dynamodb import AsyncTable, is_condition_failure
+from db.hydrate import hydrate
 from models.invites import InviteInCreate, InviteInDB
 
 
@@ -20,61 +22,78 @@ def generate_nonce(length=6):
 
 class InvitesDB:
 
-    dynamodb = boto3.resource("dynamodb")
-    table = dynamodb.Table("ubadges.invites")
+    table = AsyncTable("ubadges.invites")
 
 
     async def get_by_id(self, invite_id: str):
-        result = self.table.get_item(Key={"id": invite_id})
+        result = await self.table.get_item(Key={"id": invite_id})
         invite = result.get("Item")
         if invite:
-            return InviteInDB(**invite)
+            return hydrate(InviteInDB, invite)
         return None
 
 
     async def get_by_none(self, nonce: str):
-        result = self.table.scan(FilterExpression=Attr("nonce").eq(nonce))
+        result = await self.table.scan(FilterExpression=Attr("nonce").eq(nonce))
         invites = result.get("Items")
         if invites:
-            return InviteInDB(**invites[0])
+            return hydrate(InviteInDB, invites[0])
         return None
 
 
     async def get_by_issuer_and_recipient_ids(self, issuer_id: str, recipient_id: str):
-        result = self.table.scan(FilterExpression=Attr("issuer_id").eq(issuer_id)
-            & Attr("recipient_id").eq(recipient_id)
+        result = await self.table.query(
+            IndexName="recipient_id-index",
+            KeyConditionExpression=Key("recipient_id").eq(recipient_id)
+                & Key("issuer_id").eq(issuer_id)
         )
         invites = result.get("Items")
         if invites:
-            return InviteInDB(**invites[0])
+            return hydrate(InviteInDB, invites[0])
         return None
 
 
     async def create(self, invite: InviteInCreate):
-        invite_in_db = InviteInDB(
+        invite_in_db = self._new_invite(invite)
+        await self.table.put_item(Item=invite_in_db.dict())
+        return invite_in_db
+
+
+    async def create_many(self, invites: List[InviteInCreate]):
+        invites_in_db = list(map(self._new_invite, invites))
+        await self.table.batch_put([invite.dict() for invite in invites_in_db])
+        return invites_in_db
+
+
+    def _new_invite(self, invite: InviteInCreate):
+        return InviteInDB(
             id=str(uuid.uuid4()),
             nonce=generate_nonce(),
             badges=[invite.badge_id],
             issuer_id=invite.issuer_id,
             recipient_id=invite.recipient_id
         )
-        self.table.put_item(Item=invite_in_db.dict())
-        return invite_in_db
 
 
     async def add_badge(self, invite_id: str, badge_id: str):
-        invite = await self.get_by_id(invite_id)
-        if badge_id not in invite.badges:
-            invite.badges.append(badge_id)
-        self.table.update_item(
-            Key={"id": invite_id},
-            UpdateExpression="SET badges = :b",
-            ExpressionAttributeValues={
-                ":b": invite.badges
-            }
-        )
-        return invite
+        """Append badge_id unless the invite already has it, in one conditional update."""
+        try:
+            response = await self.table.update_item(
+                Key={"id": invite_id},
+                UpdateExpression="SET badges = list_append(badges, :b)",
+                ConditionExpression=Attr("id").exists() & ~Attr("badges").contains(badge_id),
+                ExpressionAttributeValues={
+                    ":b": [badge_id]
+                },
+                ReturnValues="ALL_NEW"
+            )
+        except ClientError as error:
+            if not is_condition_failure(error):
+                raise
+            # Already there (or the invite is gone); nothing was written.
+            return await self.get_by_id(invite_id)
+        return hydrate(InviteInDB, response["Attributes"])
 
 
     async def delete(self, invite_id: str):
-        self.table.delete_item(Key={"id": invite_id})
+        await self.table.delete_item(Key={"id": invite_id})
@@ -4,49 +4,112 @@ from datetime import datetime
 from typing import List
 
 # Third party libraries
-import boto3
 from boto3.dynamodb.conditions import Key, Attr
+from botocore.exceptions import ClientError
 
 # Package
-from models.issuers import IssuerIn, IssuerInDB
+from core.cache import ReadThroughCache
+from core.config import ISSUER_CACHE_SIZE, ISSUER_CACHE_TTL
+from db.dynamodb import AsyncTable, is_condition_failure
+from db.hydrate import hydrate, hydrate_all
+from models.issuers import IssuerIn, IssuerInDB, IssuerOut
 from models.keys import KeyInDB
 
 
+# Issuers keyed by id, as IssuerOut: hydrating that model drops the private
+# keys, so no cache ever holds one. Writes through IssuersDB invalidate it.
+issuer_cache = ReadThroughCache("issuers", ISSUER_CACHE_SIZE, ISSUER_CACHE_TTL)
+
+
+def key_item(key: KeyInDB):
+    # Keys are stored the way create_issuer writes them: dates as strings,
+    # and no date_revoked until the key is revoked.
+    item = {"public_key": key.public_key, "private_key": key.private_key, "date_created": str(key.date_created)}
+    if key.date_revoked:
+        item["date_revoked"] = str(key.date_revoked)
+    return item
+
+
 class IssuersDB:
 
-    dynamodb = boto3.resource("dynamodb")
-    table = dynamodb.Table("ubadges.issuers")
+    table = AsyncTable("ubadges.issuers")
 
 
     async def get_all_issuers(self) -> List[IssuerInDB]:
-        result = self.table.scan()
-        issuers = result.get("Items", [])
-        return list(map(lambda issuer: IssuerInDB(**issuer), issuers))
+        issuers = await self.table.scan_all()
+        return hydrate_all(IssuerInDB, issuers)
+
+
+    async def get_issuers_page(self, limit: int, start_key: dict = None, owner_id: str = None):
+        if owner_id:
+            issuers, last_key = await self.table.query_page(
+                limit,
+                start_key,
+                IndexName="owner_id-index",
+                KeyConditionExpression=Key("owner_id").eq(owner_id)
+            )
+        else:
+            issuers, last_key = await self.table.scan_page(limit, start_key)
+        return hydrate_all(IssuerInDB, issuers), last_key
+
+
+    async def iter_issuer_pages(self, owner_id: str = None):
+        if owner_id:
+            pages = self.table.query_pages(
+                IndexName="owner_id-index",
+                KeyConditionExpression=Key("owner_id").eq(owner_id)
+            )
+        else:
+            pages = self.table.scan_pages()
+        async for issuers in pages:
+            yield hydrate_all(IssuerInDB, issuers)
 
 
     async def get_issuer_by_id(self, issuer_id: str):
-        result = self.table.get_item(Key={"id": issuer_id})
+        result = await self.table.get_item(Key={"id": issuer_id})
         issuer = result.get("Item")
         if issuer:
-            return IssuerInDB(**issuer)
+            return hydrate(IssuerInDB, issuer)
         return None
 
 
+    async def get_public_issuer(self, issuer_id: str) -> IssuerOut:
+        """The issuer without its private keys, from the cache when possible."""
+        async def load():
+            result = await self.table.get_item(Key={"id": issuer_id})
+            issuer = result.get("Item")
+            if issuer:
+                return hydrate(IssuerOut, issuer)
+            return None
+        return await issuer_cache.get(issuer_id, load)
+
+
+    async def get_public_issuers(self, issuer_ids: List[str]) -> List[IssuerOut]:
+        async def load(missing):
+            issuers = await self.table.batch_get([{"id": issuer_id} for issuer_id in missing])
+            return {issuer["id"]: hydrate(IssuerOut, issuer) for issuer in issuers}
+        return list((await issuer_cache.get_many(issuer_ids, load)).values())
+
+
     async def get_issuer_by_name(self, name: str):
-        result = self.table.scan(FilterExpression=Attr("name").eq(name))
+        result = await self.table.query(
+            IndexName="name-index",
+            KeyConditionExpression=Key("name").eq(name),
+            Limit=1
+        )
         issuers = result.get("Items")
         if issuers:
             issuer = issuers[0]
-            return IssuerInDB(**issuer)
+            return hydrate(IssuerInDB, issuer)
         return None
 
 
     async def get_issuers_by_owner(self, owner_id: str):
-        result = self.table.scan(FilterExpression=Attr("owner_id").eq(owner_id))
-        issuers = result.get("Items")
-        if issuers:
-            return list(map(lambda issuer: IssuerInDB(**issuer), issuers))
-        return []
+        issuers = await self.table.query_all(
+            IndexName="owner_id-index",
+            KeyConditionExpression=Key("owner_id").eq(owner_id)
+        )
+        return hydrate_all(IssuerInDB, issuers)
 
 
     async def create_issuer(self, issuer: IssuerIn):
@@ -56,7 +119,7 @@ class IssuersDB:
         key_dict = issuer.key.dict()
         key_dict["date_created"] = str(datetime.utcnow())
 
-        self.table.put_item(
+        await self.table.put_item(
             Item={
                 "id": issuer_id,
                 "owner_id": issuer.owner_id,
@@ -68,47 +131,54 @@ class IssuersDB:
                 "revocations": []
             }
         )
+        issuer_cache.invalidate(issuer_id)
         return await self.get_issuer_by_id(issuer_id)
 
 
-    async def update_issuer(self, issuer_id, issuer: IssuerIn):
-        # Not checking that issuer_id exists or that new issuer name
-        # isn't already taken in the DB. This should be handled in the client.
-        # issuer_in_db = await self.get_issuer_by_id(issuer_id)
-        # keys = issuer_in_db.keys
-        # for key in keys:
-        #     if not key.date_revoked:
-        #         key.date_revoked = datetime.utcnow()
-        # keys.append(
-        #     KeyInDB(**issuer.key.dict(), date_created=datetime.utcnow())
-        # )
-        
-        # keys = list(map(lambda k: k.dict(), keys))
-        # for k in keys:
-        #     k["date_created"] = str(k["date_created"])
-        #     k["date_revoked"] = str(k["date_revoked"])
- 
-        # result = self.table.update_item(
-        #     Key={"id": issuer_id},
-        #     UpdateExpression="SET #issuer_name = :n, #issuer_url = :u, email = :e, image = :i, owner_id = :o, #issuer_keys = :k",
-        #     ExpressionAttributeNames={
-        #         "#issuer_name": "name",
-        #         "#issuer_url": "url",
-        #         "#issuer_keys": "keys"
-        #     },
-        #     ExpressionAttributeValues={
-        #         ":n": issuer.name, 
-        #         ":u": issuer.url,
-        #         ":e": issuer.email, 
-        #         ":i": issuer.image,
-        #         ":o": issuer.owner_id,
-        #         ":k": keys
-        #     },
-        #     ReturnValues="ALL_NEW"
-        # )
-        # return IssuerInDB(**result["Attributes"])
-        pass
+    async def update_issuer(self, current: IssuerInDB, issuer: IssuerIn):
+        """Overwrite the issuer's fields with `issuer`'s in one write.
+
+        A key other than the active one revokes the active key and becomes
+        the new one. Not checking that the new issuer name isn't already
+        taken; the caller does that. Returns None if the issuer is gone.
+        """
+        now = str(datetime.utcnow())
+        keys = [key_item(key) for key in current.keys]
+        active = [key for key in keys if not key.get("date_revoked")]
+        if not active or active[0]["public_key"] != issuer.key.public_key:
+            for key in active:
+                key["date_revoked"] = now
+            keys.append({**issuer.key.dict(), "date_created": now})
+
+        try:
+            result = await self.table.update_item(
+                Key={"id": current.id},
+                UpdateExpression="SET #issuer_name = :n, #issuer_url = :u, email = :e, image = :i, owner_id = :o, #issuer_keys = :k",
+                ConditionExpression=Attr("id").exists(),
+                ExpressionAttributeNames={
+                    "#issuer_name": "name",
+                    "#issuer_url": "url",
+                    "#issuer_keys": "keys"
+                },
+                ExpressionAttributeValues={
+                    ":n": issuer.name,
+                    ":u": issuer.url,
+                    ":e": issuer.email,
+                    ":i": issuer.image,
+                    ":o": issuer.owner_id,
+                    ":k": keys
+                },
+                ReturnValues="ALL_NEW"
+            )
+        except ClientError as error:
+            if not is_condition_failure(error):
+                raise
+            return None
+        finally:
+            issuer_cache.invalidate(current.id)
+        return hydrate(IssuerInDB, result["Attributes"])
     
 
     async def delete_issuer(self, issuer_id):
-        self.table.delete_item(Key={"id": issuer_id})
\ No newline at end of file
+        await self.table.delete_item(Key={"id": issuer_id})
+        issuer_cache.invalidate(issuer_id)
\ No newline at end of file
@@ -0,0 +1,97 @@
+# Standard library
+import asyncio
+
+# Package
+from db.issuers import IssuersDB
+from db.badges import BadgesDB
+from db.recipients import RecipientsDB
+
+
+class Loader:
+    """Loads entities by key, batching the keys asked for in one event-loop tick.
+
+    Keys requested together (from tasks started by the same gather, say)
+    are fetched with one call to `fetch`. The loader is also an identity
+    map: each key is fetched at most once, and every caller gets the same
+    instance, or None when there is no such entity. Failed loads aren't
+    remembered, so the next caller tries again.
+    """
+
+    def __init__(self, fetch, key_of):
+        self.fetch = fetch
+        self.key_of = key_of
+        self.loaded = {}
+        self.pending = []
+
+    async def load(self, key):
+        future = self.loaded.get(key)
+        if future is None:
+            loop = asyncio.get_event_loop()
+            future = self.loaded[key] = loop.create_future()
+            if not self.pending:
+                loop.call_soon(self.dispatch)
+            self.pending.append((key, future))
+        # Shielded so one cancelled caller doesn't cancel the load for the rest.
+        return await asyncio.shield(future)
+
+    async def load_many(self, keys):
+        return await asyncio.gather(*(self.load(key) for key in keys))
+
+    def prime(self, key, value):
+        """Remember a value the caller already has, such as one it just wrote."""
+        future = asyncio.get_event_loop().create_future()
+        future.set_result(value)
+        self.loaded[key] = future
+
+    def clear(self, key):
+        self.loaded.pop(key, None)
+
+    def dispatch(self):
+        batch, self.pending = self.pending, []
+        asyncio.ensure_future(self.resolve(batch))
+
+    async def resolve(self, batch):
+        try:
+            values = await self.fetch([key for key, _ in batch])
+        except asyncio.CancelledError:
+            for future in self.forget(batch):
+                future.cancel()
+            raise
+        except Exception as error:
+            for future in self.forget(batch):
+                future.set_exception(error)
+                # Mark the exception retrieved; waiters (if any) re-raise it.
+                future.exception()
+            return
+        found = {self.key_of(value): value for value in values}
+        for key, future in batch:
+            if not future.done():
+                future.set_result(found.get(key))
+
+    def forget(self, batch):
+        """Drop a failed batch's keys, returning the futures still waiting on them."""
+        for key, future in batch:
+            if self.loaded.get(key) is future:
+                del self.loaded[key]
+        return [future for _, future in batch if not future.done()]
+
+
+class Loaders:
+    """The loaders for one request (or job).
+
+    Badges are keyed by (badge_id, issuer_id), the others by id. Issuers
+    and badges come through their process-wide caches, issuers without
+    their private keys. Code that writes an entity mid-request should prime
+    or clear its key.
+    """
+
+    def __init__(self):
+        self.issuers = Loader(IssuersDB().get_public_issuers, lambda issuer: issuer.id)
+        self.badges = Loader(BadgesDB().get_badges_by_ids, lambda badge: (badge.id, badge.issuer_id))
+        self.recipients = Loader(RecipientsDB().get_recipients_by_ids, lambda recipient: recipient.id)
+
+
+async def get_loaders():
+    # FastAPI caches dependencies per request, so every Depends(get_loaders)
+    # in one request shares these.
+    return Loaders()
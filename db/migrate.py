@@ -0,0 +1,138 @@
+"""Create the tables and secondary indexes declared in db/schema.py.
+
+Usage: python -m db.migrate [--table ubadges.recipients] [--dry-run]
+
+A missing table is created with all of its indexes at once. DynamoDB
+backfills a new global secondary index from the existing items while it
+is in the CREATING state, so this waits for each index to become ACTIVE
+before moving on to the next one.
+"""
+# Standard library
+import argparse
+import time
+
+# Third party libraries
+import boto3
+
+# Package
+from core.config import DYNAMODB_ENDPOINT_URL
+from db.schema import INDEXES, KEYS
+
+
+# The same endpoint as db.dynamodb, so DynamoDB Local can be migrated too.
+client = boto3.client("dynamodb", endpoint_url=DYNAMODB_ENDPOINT_URL)
+
+
+def describe(table_name: str):
+    return client.describe_table(TableName=table_name)["Table"]
+
+
+def find(table_name: str):
+    """The table's description, or None if it doesn't exist."""
+    try:
+        return describe(table_name)
+    except client.exceptions.ResourceNotFoundException:
+        return None
+
+
+def key_schema(partition_key: str, sort_key: str = None):
+    schema = [{"AttributeName": partition_key, "KeyType": "HASH"}]
+    if sort_key:
+        schema.append({"AttributeName": sort_key, "KeyType": "RANGE"})
+    return schema
+
+
+def attribute_definitions(names):
+    # Every key attribute in the service is a string.
+    return [{"AttributeName": name, "AttributeType": "S"} for name in sorted(set(names) - {None})]
+
+
+def create_table(table_name: str):
+    key = KEYS[table_name]
+    indexes = INDEXES.get(table_name, [])
+    names = [*key, *(name for index in indexes for name in (index.partition_key, index.sort_key))]
+    create = {
+        "TableName": table_name,
+        "KeySchema": key_schema(*key),
+        "AttributeDefinitions": attribute_definitions(names),
+        "BillingMode": "PAY_PER_REQUEST"
+    }
+    if indexes:
+        create["GlobalSecondaryIndexes"] = [
+            {
+                "IndexName": index.name,
+                "KeySchema": key_schema(index.partition_key, index.sort_key),
+                "Projection": {"ProjectionType": index.projection}
+            }
+            for index in indexes
+        ]
+    client.create_table(**create)
+    client.get_waiter("table_exists").wait(TableName=table_name)
+    return describe(table_name)
+
+
+def index_statuses(table: dict):
+    return {
+        index["IndexName"]: index["IndexStatus"]
+        for index in table.get("GlobalSecondaryIndexes", [])
+    }
+
+
+def create_index(table: dict, index):
+    create = {
+        "IndexName": index.name,
+        "KeySchema": key_schema(index.partition_key, index.sort_key),
+        "Projection": {"ProjectionType": index.projection}
+    }
+    billing = table.get("BillingModeSummary", {}).get("BillingMode", "PROVISIONED")
+    if billing == "PROVISIONED":
+        throughput = table["ProvisionedThroughput"]
+        create["ProvisionedThroughput"] = {
+            "ReadCapacityUnits": throughput["ReadCapacityUnits"],
+            "WriteCapacityUnits": throughput["WriteCapacityUnits"]
+        }
+
+    client.update_table(
+        TableName=table["TableName"],
+        AttributeDefinitions=attribute_definitions([index.partition_key, index.sort_key]),
+        GlobalSecondaryIndexUpdates=[{"Create": create}]
+    )
+
+
+def wait_until_active(table_name: str, index_name: str, poll_seconds: int = 15):
+    while True:
+        table = describe(table_name)
+        if index_statuses(table).get(index_name) == "ACTIVE":
+            return table
+        time.sleep(poll_seconds)
+
+
+def migrate(table_names, dry_run=False):
+    for table_name in table_names:
+        table = find(table_name)
+        if table is None:
+            print(f"{table_name}: creating")
+            if dry_run:
+                continue
+            table = create_table(table_name)
+            print(f"{table_name}: ACTIVE")
+        for index in INDEXES.get(table_name, []):
+            status = index_statuses(table).get(index.name)
+            if status is not None:
+                print(f"{table_name} {index.name}: {status}")
+                continue
+            print(f"{table_name} {index.name}: creating")
+            if dry_run:
+                continue
+            # Only one index can be added per table at a time.
+            create_index(table, index)
+            table = wait_until_active(table_name, index.name)
+            print(f"{table_name} {index.name}: ACTIVE")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--table", action="append", choices=sorted(KEYS))
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    migrate(args.table or sorted(KEYS), dry_run=args.dry_run)
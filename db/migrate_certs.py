@@ -0,0 +1,113 @@
+"""Move recipients' certs lists into ubadges.certs.
+
+Usage: python -m db.migrate_certs [--resolve] [--dry-run]
+
+Each URL in a recipient's certs list becomes a cert item, then the list is
+replaced by cert_count. The update is conditional on the list being
+unchanged, and cert items are keyed by recipient and cert id, so an
+interrupted run can simply be repeated.
+
+--resolve reads each signed cert from storage to fill in issuer_id,
+badge_id and issued_at, so migrated certs also show up in the issuer and
+badge listings.
+"""
+# Standard library
+import argparse
+import asyncio
+import json
+
+# Third party libraries
+from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError
+
+# Package
+from db.certs import CertsDB
+from db.dynamodb import is_condition_failure
+from db.recipients import RecipientsDB
+from models.certs import CertInDB
+from services.cert import signed_cert_path
+from services.storage import storage
+
+
+URN_PREFIX = "urn:uuid:"
+
+
+def cert_id_from_url(url: str):
+    return url.rsplit("/", 1)[-1][:-len(".json")]
+
+
+def issuer_id_from_url(url: str):
+    # Issuer ids were written as .../issuers/{id} and later .../issuers/{id}/profile.
+    return url.split("/issuers/", 1)[1].split("/", 1)[0]
+
+
+async def resolve(cert: CertInDB):
+    try:
+        document = json.loads(await storage.get(signed_cert_path(cert.cert_id)))
+        badge = document["badge"]
+        badge_id = badge["id"][len(URN_PREFIX):] if badge["id"].startswith(URN_PREFIX) else badge["id"]
+        return CertInDB(**{
+            **cert.dict(),
+            "issuer_id": issuer_id_from_url(badge["issuer"]["id"]),
+            "badge_id": badge_id,
+            "issued_at": document["issuedOn"]
+        })
+    except Exception as error:
+        print(f"  {cert.cert_id}: not resolved ({error})")
+        return cert
+
+
+async def migrate_recipient(item: dict, resolve_certs: bool, dry_run: bool):
+    # A URL listed twice would be a repeated key, which fails the whole
+    # batch write, so keep each cert once.
+    urls = {}
+    for url in item["certs"]:
+        urls.setdefault(cert_id_from_url(url), url)
+    certs = [
+        CertInDB(recipient_id=item["id"], cert_id=cert_id, url=url)
+        for cert_id, url in urls.items()
+    ]
+    if resolve_certs:
+        certs = await asyncio.gather(*map(resolve, certs))
+    print(f"{item['id']}: {len(certs)} certs")
+    if dry_run:
+        return True
+
+    await CertsDB().create_certs(certs)
+    try:
+        await RecipientsDB.table.update_item(
+            Key={"id": item["id"]},
+            UpdateExpression="SET cert_count = if_not_exists(cert_count, :zero) + :n REMOVE certs",
+            ConditionExpression=Attr("certs").eq(item["certs"]),
+            ExpressionAttributeValues={
+                ":zero": 0,
+                ":n": len(certs)
+            }
+        )
+    except ClientError as error:
+        if not is_condition_failure(error):
+            raise
+        print(f"{item['id']}: certs changed during the migration; run it again")
+        return False
+    return True
+
+
+async def migrate(resolve_certs: bool = False, dry_run: bool = False):
+    migrated = skipped = 0
+    async for items in RecipientsDB.table.scan_pages():
+        for item in items:
+            if "certs" not in item:
+                continue
+            if await migrate_recipient(item, resolve_certs, dry_run):
+                migrated += 1
+            else:
+                skipped += 1
+    print(f"{migrated} recipients migrated, {skipped} to retry")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--resolve", action="store_true")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    asyncio.get_event_loop().run_until_complete(migrate(args.resolve, args.dry_run))
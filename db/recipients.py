@@ -4,38 +4,57 @@ from datetime import datetime
 from typing import List
 
 # Third party libraries
-import boto3
 from boto3.dynamodb.conditions import Key, Attr
+from botocore.exceptions import ClientError
 
 # Package
+from db.dynamodb import AsyncTable, is_condition_failure
+from db.hydrate import hydrate, hydrate_all
 from models.recipients import RecipientIn, RecipientInDB
 
 
 class RecipientsDB:
 
-    dynamodb = boto3.resource("dynamodb")
-    table = dynamodb.Table("ubadges.recipients")
+    table = AsyncTable("ubadges.recipients")
 
     
     async def get_all_recipients(self):
-        result = self.table.scan()
-        recipients = result.get("Items")
-        return list(map(lambda r: RecipientInDB(**r), recipients))
+        recipients = await self.table.scan_all()
+        return hydrate_all(RecipientInDB, recipients)
+
+
+    async def get_recipients_page(self, limit: int, start_key: dict = None):
+        recipients, last_key = await self.table.scan_page(limit, start_key)
+        return hydrate_all(RecipientInDB, recipients), last_key
+
+
+    async def iter_recipient_pages(self):
+        async for recipients in self.table.scan_pages():
+            yield hydrate_all(RecipientInDB, recipients)
 
 
     async def get_recipients_by_id(self, recipient_id):
-        result = self.table.get_item(Key={"id": recipient_id})
+        result = await self.table.get_item(Key={"id": recipient_id})
         recipient = result.get("Item")
         if not recipient is None:
-            return RecipientInDB(**recipient)
+            return hydrate(RecipientInDB, recipient)
         return None
 
 
+    async def get_recipients_by_ids(self, recipient_ids: List[str]):
+        recipients = await self.table.batch_get([{"id": recipient_id} for recipient_id in recipient_ids])
+        return hydrate_all(RecipientInDB, recipients)
+
+
     async def get_recipient_by_email(self, email):
-        result = self.table.scan(FilterExpression=Attr("email").eq(email))
+        result = await self.table.query(
+            IndexName="email-index",
+            KeyConditionExpression=Key("email").eq(email),
+            Limit=1
+        )
         recipients = result.get("Items")
         if recipients:
-            return RecipientInDB(**recipients[0])
+            return hydrate(RecipientInDB, recipients[0])
         return None
 
 
@@ -44,36 +63,56 @@ class RecipientsDB:
             id=str(uuid.uuid4()),
             name=recipient.name,
             email=recipient.email,
-            certs=[],
+            cert_count=0,
             addresses={}
         )
-        self.table.put_item(Item=recipient_in_db.dict())
+        await self.table.put_item(Item=recipient_in_db.dict())
         return recipient_in_db
 
 
-    async def add_address(self, recipient_id: str, issuer_id: str, address: str):
-        recipient = await self.get_recipients_by_id(recipient_id)
-        recipient.addresses[issuer_id] = address
-        self.table.update_item(
-            Key={"id": recipient_id},
-            UpdateExpression="SET addresses = :a",
-            ExpressionAttributeValues={
-                ":a": recipient.addresses
-            }
-        )
-        return recipient
+    async def create_recipients(self, recipients: List[RecipientIn]):
+        recipients_in_db = [
+            RecipientInDB(
+                id=str(uuid.uuid4()),
+                name=recipient.name,
+                email=recipient.email,
+                cert_count=0,
+                addresses={}
+            )
+            for recipient in recipients
+        ]
+        await self.table.batch_put([recipient.dict() for recipient in recipients_in_db])
+        return recipients_in_db
 
 
-    async def add_cert(self, recipient_id, cert_id):
-        recipient = await self.get_recipients_by_id(recipient_id)
-        signed_cert_path = f"dx.ubadges.poc/certs/{cert_id}.json"
-        cert_url = f"https://s3-us-west-2.amazonaws.com/{signed_cert_path}"
-        recipient.certs.append(cert_url)
-        self.table.update_item(
+    async def add_address(self, recipient_id: str, issuer_id: str, address: str):
+        """Set one issuer's address without touching the others; None if there's no such recipient."""
+        try:
+            response = await self.table.update_item(
+                Key={"id": recipient_id},
+                UpdateExpression="SET addresses.#issuer = :a",
+                ConditionExpression=Attr("id").exists(),
+                ExpressionAttributeNames={
+                    "#issuer": issuer_id
+                },
+                ExpressionAttributeValues={
+                    ":a": address
+                },
+                ReturnValues="ALL_NEW"
+            )
+        except ClientError as error:
+            if not is_condition_failure(error):
+                raise
+            return None
+        return hydrate(RecipientInDB, response["Attributes"])
+
+
+    async def increment_cert_count(self, recipient_id: str, count: int = 1):
+        await self.table.update_item(
             Key={"id": recipient_id},
-            UpdateExpression="SET certs = :c",
+            UpdateExpression="ADD cert_count :n",
+            ConditionExpression=Attr("id").exists(),
             ExpressionAttributeValues={
-                ":c": recipient.certs
+                ":n": count
             }
         )
-        return recipient
@@ -0,0 +1,45 @@
+# Standard library
+from datetime import datetime
+from typing import List
+
+# Third party libraries
+from boto3.dynamodb.conditions import Key
+
+# Package
+from db.dynamodb import AsyncTable
+from db.hydrate import hydrate_all
+from models.revocations import RevocationIn, RevocationInDB
+
+
+class RevocationsDB:
+    """Revoked certs, one item each, keyed by issuer_id and cert_id.
+
+    Kept out of the issuer item so large revocation lists neither approach
+    the 400 KB item limit nor get rewritten in full on every change.
+    """
+
+    table = AsyncTable("ubadges.revocations")
+
+
+    async def get_revocations_by_issuer_id(self, issuer_id: str):
+        revocations = await self.table.query_all(
+            KeyConditionExpression=Key("issuer_id").eq(issuer_id)
+        )
+        return hydrate_all(RevocationInDB, revocations)
+
+
+    async def create_revocations(self, issuer_id: str, revocations: List[RevocationIn]):
+        revoked_at = datetime.utcnow()
+        revocations_in_db = [
+            RevocationInDB(**revocation.dict(), issuer_id=issuer_id, revoked_at=revoked_at)
+            for revocation in revocations
+        ]
+        items = []
+        for revocation in revocations_in_db:
+            item = revocation.dict()
+            item["revoked_at"] = str(item["revoked_at"])
+            if item["reason"] is None:
+                del item["reason"]
+            items.append(item)
+        await self.table.batch_put(items)
+        return revocations_in_db
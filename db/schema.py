@@ -0,0 +1,71 @@
+# Standard library
+from typing import NamedTuple
+
+
+class Key(NamedTuple):
+    partition_key: str
+    sort_key: str = None
+
+
+class Index(NamedTuple):
+    name: str
+    partition_key: str
+    sort_key: str = None
+    projection: str = "ALL"
+
+
+# Primary key of every table the service uses. db/migrate.py creates any
+# table that doesn't exist yet with this key, on-demand billing and the
+# indexes below.
+KEYS = {
+    "ubadges.users": Key("id"),
+    "ubadges.issuers": Key("id"),
+    "ubadges.badges": Key("id", "issuer_id"),
+    "ubadges.recipients": Key("id"),
+    "ubadges.invites": Key("id"),
+    "ubadges.jobs": Key("id"),
+    "ubadges.certs": Key("recipient_id", "cert_id"),
+    "ubadges.revocations": Key("issuer_id", "cert_id"),
+}
+
+# Global secondary indexes each table is expected to have. Every lookup in the
+# db layer that isn't by primary key goes through one of these; db/migrate.py
+# creates whichever are missing.
+INDEXES = {
+    "ubadges.users": [
+        Index("email-index", "email"),
+        Index("role-index", "role"),
+    ],
+    "ubadges.issuers": [
+        Index("name-index", "name"),
+        Index("owner_id-index", "owner_id"),
+    ],
+    "ubadges.badges": [
+        Index("name-index", "name"),
+        Index("issuer_id-index", "issuer_id", "name"),
+    ],
+    "ubadges.recipients": [
+        Index("email-index", "email"),
+    ],
+    "ubadges.jobs": [
+        Index("status-index", "status"),
+    ],
+    "ubadges.certs": [
+        Index("issuer_id-index", "issuer_id", "issued_at"),
+        Index("badge_id-index", "badge_id", "issued_at"),
+    ],
+    "ubadges.invites": [
+        Index("recipient_id-index", "recipient_id", "issuer_id"),
+    ],
+}
+
+
+def key_attributes(table: str, index: str = None) -> set:
+    """Attributes in a LastEvaluatedKey from `table`, or from `index` on it."""
+    key = KEYS[table]
+    names = {key.partition_key, key.sort_key}
+    if index:
+        index = next(entry for entry in INDEXES[table] if entry.name == index)
+        names |= {index.partition_key, index.sort_key}
+    names.discard(None)
+    return names
@@ -2,88 +2,158 @@
 import uuid
 
 # Third party library imports
-import boto3
 from boto3.dynamodb.conditions import Key, Attr
+from botocore.exceptions import ClientError
 
 # Package imports
+from core.cache import ReadThroughCache
+from core.config import USER_CACHE_SIZE, USER_CACHE_TTL
+from db.dynamodb import AsyncTable, is_condition_failure
+from db.hydrate import hydrate, hydrate_all
 from models.users import UserRole, UserInDB
-from services.security import get_password_hash
+from services.security import hasher
+
+
+# Authenticated users keyed by email, the token subject. Kept here so that
+# writes through UsersDB can invalidate it, on every worker.
+user_cache = ReadThroughCache("users", USER_CACHE_SIZE, USER_CACHE_TTL)
+
+
+class EmailTaken(Exception):
+    pass
 
 
 class UsersDB:
 
-    dynamodb = boto3.resource("dynamodb")
-    table = dynamodb.Table("ubadges.users")
+    table = AsyncTable("ubadges.users")
 
 
     async def get_all_users(self):
-        result = self.table.scan()
-        users = result["Items"]
-        return list(map(lambda user: UserInDB(**user), users))
+        users = await self.table.scan_all()
+        return hydrate_all(UserInDB, users)
+
+
+    async def get_users_page(self, limit: int, start_key: dict = None, role: UserRole = None):
+        if role:
+            users, last_key = await self.table.query_page(
+                limit,
+                start_key,
+                IndexName="role-index",
+                KeyConditionExpression=Key("role").eq(role)
+            )
+        else:
+            users, last_key = await self.table.scan_page(limit, start_key)
+        return hydrate_all(UserInDB, users), last_key
+
+
+    async def iter_user_pages(self, role: UserRole = None):
+        if role:
+            pages = self.table.query_pages(
+                IndexName="role-index",
+                KeyConditionExpression=Key("role").eq(role)
+            )
+        else:
+            pages = self.table.scan_pages()
+        async for users in pages:
+            yield hydrate_all(UserInDB, users)
 
 
     async def get_user_by_id(self, user_id: str):
-        result = self.table.get_item(Key={"id": user_id})
+        result = await self.table.get_item(Key={"id": user_id})
         user = result.get("Item", None)
         if user:
-            return UserInDB(**user) 
+            return hydrate(UserInDB, user) 
         return None
 
 
     async def get_user_by_email(self, email: str):
-        result = self.table.query(
+        result = await self.table.query(
             IndexName="email-index",
             KeyConditionExpression=Key("email").eq(email)
         )
         users = result.get("Items")
-        if users:
-            return await self.get_user_by_id(users[0]["id"])
-        return None
+        if not users:
+            return None
+        # An index that projects every attribute already has the whole user;
+        # only a keys-only projection needs the second round trip.
+        if "hashed_password" in users[0]:
+            return hydrate(UserInDB, users[0])
+        return await self.get_user_by_id(users[0]["id"])
+
+
+    async def get_authenticated_user(self, email: str):
+        """get_user_by_email, from the cache when possible."""
+        return await user_cache.get(email, lambda: self.get_user_by_email(email))
 
 
     async def get_users_by_role(self, role: UserRole):
-        result = self.table.scan(FilterExpression=Attr('role').eq(role))
-        users = result["Items"]
-        return list(map(lambda user: UserInDB(**user), users))
+        users = await self.table.query_all(
+            IndexName="role-index",
+            KeyConditionExpression=Key("role").eq(role)
+        )
+        return hydrate_all(UserInDB, users)
 
 
     async def create_user(self, email: str, password: str, role: UserRole):
         user = UserInDB(
             id=str(uuid.uuid4()),
             email=email,
-            hashed_password=get_password_hash(password),
+            hashed_password=await hasher.hash(password),
             role=role
         )
-        self.table.put_item(Item=user.dict())
+        await self.table.put_item(Item=user.dict())
+        user_cache.invalidate(email)
         return user
 
 
+    async def set_password_hash(self, user_id: str, email: str, hashed_password: str):
+        await self.table.update_item(
+            Key={"id": user_id},
+            UpdateExpression="SET hashed_password = :p",
+            ExpressionAttributeValues={":p": hashed_password}
+        )
+        user_cache.invalidate(email)
+
+
     async def update_user(self, user_id, email: str = None, role: UserRole = None, password: str = None):
-        user = await self.get_user_by_id(user_id)
+        """Update the given fields in one conditional write.
 
+        Returns None if there's no such user and raises EmailTaken if another
+        user already has the new email. Changing the email costs an index
+        lookup first, since DynamoDB can't enforce uniqueness on an index.
+        """
+        changes = {}
         if email:
-            if email != user.email and await self.get_user_by_email(email):
-                raise Exception
-            user.email = email
-
+            owner = await self.get_user_by_email(email)
+            if owner is not None and owner.id != user_id:
+                raise EmailTaken(email)
+            changes["email"] = email
         if role:
-            user.role = role
-
+            changes["role"] = role
         if password:
-            user.hashed_password = get_password_hash(password)
-
-        response = self.table.update_item(
-            Key={"id": user_id},
-            UpdateExpression="SET email = :e, #user_role = :r, hashed_password = :p",
-            ExpressionAttributeNames={
-                "#user_role": "role"
-            },
-            ExpressionAttributeValues={
-                ":e": user.email,
-                ":r": user.role,
-                ":p": user.hashed_password
-            },
-            ReturnValues="ALL_NEW"
-        )
-
-        return UserInDB(**response["Attributes"])
+            changes["hashed_password"] = await hasher.hash(password)
+        if not changes:
+            return await self.get_user_by_id(user_id)
+
+        names = {f"#{field}": field for field in changes}
+        values = {f":{field}": value for field, value in changes.items()}
+        try:
+            response = await self.table.update_item(
+                Key={"id": user_id},
+                UpdateExpression="SET " + ", ".join(f"#{field} = :{field}" for field in changes),
+                ConditionExpression=Attr("id").exists(),
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues=values,
+                # The old item has the previous email to evict from the cache;
+                # the new one is the old with the changes applied.
+                ReturnValues="ALL_OLD"
+            )
+        except ClientError as error:
+            if not is_condition_failure(error):
+                raise
+            return None
+
+        previous = response["Attributes"]
+        user_cache.invalidate(previous["email"])
+        user_cache.invalidate(changes.get("email", previous["email"]))
+        return hydrate(UserInDB, {**previous, **changes})
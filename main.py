@@ -4,18 +4,53 @@ from starlette.requests import Request
 from starlette.staticfiles import StaticFiles
 
 # Package imports
+from core.config import METRICS_ENABLED, DB_TRACE
+from core.metrics import MetricsMiddleware
+from core.pagination import InvalidCursor, invalid_cursor_handler
+from core.tracing import TracingMiddleware
 from routers import (
     auth,
     users,
     issuers,
-    recipients
+    recipients,
+    jobs,
+    metrics
 )
+from services.jobs import runner
+from services.email import outbox
+from services.security import hasher
+from services.canonical import cert_hasher
+# Imported for their job handlers.
+from services import issuance, signer  # noqa: F401
 
 app = FastAPI()
 
+app.add_exception_handler(InvalidCursor, invalid_cursor_handler)
+
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 app.include_router(auth.router, prefix="/auth")
 app.include_router(users.router, prefix="/users")
 app.include_router(issuers.router, prefix="/issuers")
-app.include_router(recipients.router, prefix="/recipients")
\ No newline at end of file
+app.include_router(recipients.router, prefix="/recipients")
+app.include_router(jobs.router, prefix="/jobs")
+
+if METRICS_ENABLED:
+    app.include_router(metrics.router)
+    app.add_middleware(MetricsMiddleware, router=app.router)
+
+if DB_TRACE:
+    app.add_middleware(TracingMiddleware)
+
+
+@app.on_event("startup")
+async def start_job_runner():
+    await runner.start()
+
+
+@app.on_event("shutdown")
+async def stop_job_runner():
+    await runner.stop()
+    await outbox.stop()
+    hasher.shutdown()
+    cert_hasher.shutdown()
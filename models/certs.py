@@ -0,0 +1,15 @@
+# Standard library
+from datetime import datetime
+
+# Third party libraries
+from pydantic import BaseModel
+
+
+class CertInDB(BaseModel):
+    recipient_id: str
+    cert_id: str
+    url: str
+    # Certs migrated from the old recipient certs lists may lack these.
+    issuer_id: str = None
+    badge_id: str = None
+    issued_at: datetime = None
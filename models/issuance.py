@@ -0,0 +1,27 @@
+# Standard library
+from enum import Enum, unique
+from typing import List
+
+# Third party libraries
+from pydantic import BaseModel, EmailStr
+
+
+@unique
+class IssuanceStatus(str, Enum):
+    ISSUED = "issued"
+    INVITED = "invited"
+    FAILED = "failed"
+
+
+class IssuanceResult(BaseModel):
+    email: EmailStr
+    status: IssuanceStatus
+    recipient_id: str = None
+    error: str = None
+
+
+class IssuanceReport(BaseModel):
+    issued: int
+    invited: int
+    failed: int
+    results: List[IssuanceResult]
@@ -0,0 +1,46 @@
+# Standard library
+from datetime import datetime
+from enum import Enum, unique
+from typing import List
+
+# Third party libraries
+from pydantic import BaseModel
+
+# Package
+from models.issuance import IssuanceResult
+
+
+@unique
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+class JobBase(BaseModel):
+    id: str
+    kind: str
+    status: JobStatus
+    created_by: str
+    total: int = 0
+    processed: int = 0
+    issued: int = 0
+    invited: int = 0
+    failed: int = 0
+    errors: List[IssuanceResult] = []
+    error: str = None
+    created_at: datetime
+    updated_at: datetime
+
+
+class JobInDB(JobBase):
+    params: dict = {}
+    # The worker running the job, and until when (epoch seconds) its claim
+    # holds unless renewed.
+    owner: str = None
+    lease_expires: int = 0
+
+
+class JobOut(JobBase):
+    pass
@@ -1,9 +1,9 @@
 # Standard library
 from datetime import datetime
-from typing import List, Dict
+from typing import Dict
 
 # Third party libraries
-from pydantic import BaseModel, EmailStr, HttpUrl
+from pydantic import BaseModel, EmailStr
 
 
 class RecipientBase(BaseModel):
@@ -17,5 +17,5 @@ class RecipientIn(RecipientBase):
 
 class RecipientInDB(RecipientBase):
     id: str
-    certs: List[HttpUrl]
-    addresses: Dict[str, str]
\ No newline at end of file
+    addresses: Dict[str, str]
+    cert_count: int = 0
@@ -0,0 +1,20 @@
+# Standard library
+from datetime import datetime
+
+# Third party libraries
+from pydantic import BaseModel
+
+
+class RevocationIn(BaseModel):
+    cert_id: str
+    reason: str = None
+
+
+class RevocationInDB(RevocationIn):
+    issuer_id: str
+    revoked_at: datetime
+
+
+class RevocationsOut(BaseModel):
+    requested: int
+    revoked: int
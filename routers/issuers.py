@@ -1,4 +1,6 @@
 # Standard library imports
+import asyncio
+import logging
 from typing import List, Union
 from collections import ChainMap
 
@@ -6,9 +8,9 @@ from collections import ChainMap
 from fastapi import APIRouter, Depends, HTTPException
 from starlette.requests import Request
 from starlette.responses import Response
-from starlette.templating import Jinja2Templates
 from starlette.status import (
     HTTP_201_CREATED,
+    HTTP_202_ACCEPTED,
     HTTP_204_NO_CONTENT,
     HTTP_400_BAD_REQUEST,
     HTTP_403_FORBIDDEN,
@@ -18,40 +20,56 @@ from starlette.status import (
 from pydantic import EmailStr
 
 # Package level imports
-from core.config import API_URL
+from core.pagination import PageParams, set_next_link, wants_ndjson, ndjson_response
+from core.responses import model_response
 from db.issuers import IssuersDB
 from db.badges import BadgesDB
 from db.recipients import RecipientsDB
 from db.invites import InvitesDB
+from db.certs import CertsDB
+from db.loaders import Loaders, get_loaders
 from services.auth import get_current_user
-from services.email import send_email
-from services.cert import issue_cert
+from services.cert import issue_cert, get_signed_cert, today
+from services.documents import get_profile_document, document_response
+from services.revocations import revocation_index
+from services.issuance import unique_recipients
+from services.jobs import new_job, runner
 from models.issuers import IssuerIn, IssuerInDB, IssuerOut
 from models.users import UserRole, UserInDB
 from models.badges import BadgeIn, BadgeInDB
-from models.recipients import RecipientIn, RecipientInDB
-from models.invites import InviteInCreate, InviteInDB, InviteAcceptResponse
+from models.recipients import RecipientIn
+from models.invites import InviteAcceptResponse
+from models.jobs import JobOut
+from models.certs import CertInDB
+from models.revocations import RevocationIn, RevocationsOut
 
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
-templates = Jinja2Templates(directory="templates")
 
 
 @router.get("/", response_model=List[IssuerOut])
-async def get_issuers(current_user: UserInDB = Depends(get_current_user)):
-    if current_user.role == UserRole.ADMIN:
-        issuers = await IssuersDB().get_all_issuers() 
-    else:
-        issuers = await IssuersDB().get_issuers_by_owner(current_user.id)
-    return list(map(lambda issuer: issuer.dict(), issuers))
+async def get_issuers(
+    request: Request,
+    response: Response,
+    page: PageParams = Depends(),
+    current_user: UserInDB = Depends(get_current_user)
+):
+    owner_id = None if current_user.role == UserRole.ADMIN else current_user.id
+    if wants_ndjson(request):
+        return ndjson_response(IssuersDB().iter_issuer_pages(owner_id), IssuerOut)
+    issuers, last_key = await IssuersDB().get_issuers_page(page.limit, page.start_key, owner_id)
+    set_next_link(request, response, last_key)
+    return model_response(issuers, IssuerOut, response)
 
 
 @router.get("/{issuer_id}", response_model=IssuerOut)
 async def get_issuer(issuer_id: str, current_user: UserInDB = Depends(get_current_user)):
-    issuer = await IssuersDB().get_issuer_by_id(issuer_id)
+    issuer = await IssuersDB().get_public_issuer(issuer_id)
     if issuer is None:
         raise HTTPException(status_code=HTTP_404_NOT_FOUND)
-    return issuer.dict()
+    return model_response(issuer, IssuerOut)
 
 
 @router.post("/", status_code=HTTP_201_CREATED, response_model=IssuerOut)
@@ -67,17 +85,18 @@ async def create_issuer(response: Response, issuer: IssuerIn, current_user: User
 
    new_issuer = await IssuersDB().create_issuer(issuer)
    response.headers["Location"] = f"/issuers/{new_issuer.id}"
-   return new_issuer.dict()
+   return model_response(new_issuer, IssuerOut, response, HTTP_201_CREATED)
 
 
 @router.put("/{issuer_id}", status_code=HTTP_204_NO_CONTENT)
 async def update_issuer(issuer_id: str, issuer: IssuerIn, current_user: UserInDB = Depends(get_current_user)):
-    issuer_in_db = await IssuersDB().get_issuer_by_id(issuer_id)
+    # Read in full, not from the cache: the update keeps the stored keys.
+    current = await IssuersDB().get_issuer_by_id(issuer_id)
 
-    if issuer_in_db is None:
+    if current is None:
         raise HTTPException(status_code=HTTP_404_NOT_FOUND)
    
-    if current_user.role != UserRole.ADMIN and issuer_in_db.owner_id != current_user.id:
+    if current_user.role != UserRole.ADMIN and current.owner_id != current_user.id:
         raise HTTPException(status_code=HTTP_403_FORBIDDEN)
 
     issuer_in_db = await IssuersDB().get_issuer_by_name(issuer.name)
@@ -87,14 +106,25 @@ async def update_issuer(issuer_id: str, issuer: IssuerIn, current_user: UserInDB
             detail=f"Issuer name {issuer.name} is already taken."
         ) 
 
-    await IssuersDB().update_issuer(issuer_id, issuer)
+    if await IssuersDB().update_issuer(current, issuer) is None:
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND)
 
 
 @router.get("/{issuer_id}/badges", response_model=List[BadgeInDB])
-async def get_badges_by_issuer(issuer_id: str, current_user: UserInDB = Depends(get_current_user)):
-    if await IssuersDB().get_issuer_by_id(issuer_id) is None:
+async def get_badges_by_issuer(
+    request: Request,
+    response: Response,
+    issuer_id: str,
+    page: PageParams = Depends(),
+    current_user: UserInDB = Depends(get_current_user)
+):
+    if await IssuersDB().get_public_issuer(issuer_id) is None:
         raise HTTPException(status_code=HTTP_404_NOT_FOUND)
-    return await BadgesDB().get_badges_by_issuer_id(issuer_id)
+    if wants_ndjson(request):
+        return ndjson_response(BadgesDB().iter_badge_pages_by_issuer_id(issuer_id), BadgeInDB)
+    badges, last_key = await BadgesDB().get_badges_page_by_issuer_id(issuer_id, page.limit, page.start_key)
+    set_next_link(request, response, last_key)
+    return model_response(badges, BadgeInDB, response)
 
 
 @router.post("/{issuer_id}/badges", response_model=BadgeInDB, status_code=HTTP_201_CREATED)
@@ -104,7 +134,7 @@ async def create_badge(
     response: Response,
     current_user: UserInDB = Depends(get_current_user)
 ):
-    if await IssuersDB().get_issuer_by_id(issuer_id) is None:
+    if await IssuersDB().get_public_issuer(issuer_id) is None:
         raise HTTPException(status_code=HTTP_404_NOT_FOUND)
     if await BadgesDB().get_badge_by_name(badge_in.name):
         raise HTTPException(status_code=HTTP_409_CONFLICT)
@@ -114,136 +144,195 @@ async def create_badge(
 
 
 @router.get("/{issuer_id}/badges/{badge_id}", response_model=BadgeInDB)
-async def get_badge_by_id(issuer_id: str, badge_id: str, current_user: UserInDB = Depends(get_current_user)):
-    if await IssuersDB().get_issuer_by_id(issuer_id) is None:
-        raise HTTPException(status_code=HTTP_404_NOT_FOUND)
-    badge = await BadgesDB().get_badge_by_id(badge_id, issuer_id)
-    if badge is None:
+async def get_badge_by_id(
+    issuer_id: str,
+    badge_id: str,
+    loaders: Loaders = Depends(get_loaders),
+    current_user: UserInDB = Depends(get_current_user)
+):
+    issuer, badge = await asyncio.gather(
+        loaders.issuers.load(issuer_id),
+        loaders.badges.load((badge_id, issuer_id))
+    )
+    if issuer is None or badge is None:
         raise HTTPException(status_code=HTTP_404_NOT_FOUND)
     return badge
 
 
 @router.put("/{issuer_id}/badges/{badge_id}", status_code=HTTP_204_NO_CONTENT)
 async def update_badge(issuer_id: str, badge_id: str, badge_in: BadgeIn, current_user: UserInDB = Depends(get_current_user)):
-    pass
+    if badge_in.issuer_id != issuer_id:
+        raise HTTPException(status_code=HTTP_400_BAD_REQUEST, detail="A badge can't move to another issuer.")
+    if await IssuersDB().get_public_issuer(issuer_id) is None:
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND)
+    badge_in_db = await BadgesDB().get_badge_by_name(badge_in.name)
+    if badge_in_db and badge_in_db.id != badge_id:
+        raise HTTPException(status_code=HTTP_409_CONFLICT)
+    if await BadgesDB().update_badge(badge_id, badge_in) is None:
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND)
 
 
-@router.post("/{issuer_id}/badges/{badge_id}/issue")
-async def issuer_badge(
+@router.get("/{issuer_id}/certs", response_model=List[CertInDB])
+async def get_certs_by_issuer(
     request: Request,
+    response: Response,
+    issuer_id: str,
+    page: PageParams = Depends(),
+    current_user: UserInDB = Depends(get_current_user)
+):
+    if await IssuersDB().get_public_issuer(issuer_id) is None:
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND)
+    if wants_ndjson(request):
+        return ndjson_response(CertsDB().iter_cert_pages_by_issuer_id(issuer_id), CertInDB)
+    certs, last_key = await CertsDB().get_certs_page_by_issuer_id(issuer_id, page.limit, page.start_key)
+    set_next_link(request, response, last_key)
+    return model_response(certs, CertInDB, response)
+
+
+@router.get("/{issuer_id}/badges/{badge_id}/certs", response_model=List[CertInDB])
+async def get_certs_by_badge(
+    request: Request,
+    response: Response,
+    issuer_id: str,
+    badge_id: str,
+    page: PageParams = Depends(),
+    current_user: UserInDB = Depends(get_current_user)
+):
+    if await BadgesDB().get_badge_by_id(badge_id, issuer_id) is None:
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND)
+    if wants_ndjson(request):
+        return ndjson_response(CertsDB().iter_cert_pages_by_issuer_id(issuer_id, badge_id), CertInDB)
+    certs, last_key = await CertsDB().get_certs_page_by_issuer_id(issuer_id, page.limit, page.start_key, badge_id)
+    set_next_link(request, response, last_key)
+    return model_response(certs, CertInDB, response)
+
+
+@router.post("/{issuer_id}/badges/{badge_id}/issue", response_model=JobOut, status_code=HTTP_202_ACCEPTED)
+async def issuer_badge(
+    response: Response,
     issuer_id: str,
     badge_id: str,
     recipients: List[RecipientIn], 
+    loaders: Loaders = Depends(get_loaders),
     current_user: UserInDB = Depends(get_current_user)
 ):
-    issuer = await IssuersDB().get_issuer_by_id(issuer_id)
-    badge = await BadgesDB().get_badge_by_id(badge_id, issuer_id)
+    issuer, badge = await asyncio.gather(
+        loaders.issuers.load(issuer_id),
+        loaders.badges.load((badge_id, issuer_id))
+    )
     if issuer is None or badge is None:
         raise HTTPException(status_code=HTTP_404_NOT_FOUND)
 
-    for recipient in recipients:
-        # Add recipients to DB if they don't already exist.
-        recipient_in_db = await RecipientsDB().get_recipient_by_email(recipient.email)
-        if recipient_in_db is None: 
-            recipient_in_db = await RecipientsDB().create_recipient(recipient)
-        
-        # If recipient already has public key associated with the issuer,
-        # Then just issue them a certificate. Otherwise, send the recipient
-        # an invite email.
-        if issuer_id in recipient_in_db.addresses:
-            await issue_cert(issuer, recipient_in_db, badge)
-        else:
-            invite = await InvitesDB().get_by_issuer_and_recipient_ids(issuer_id, recipient_in_db.id)
-            if invite is None:
-                invite = await InvitesDB().create(InviteInCreate(issuer_id=issuer_id, recipient_id=recipient_in_db.id, badge_id=badge_id))
-            
-            if badge_id not in invite.badges:
-                InvitesDB().add_badge(invite.id, badge_id)
-
-            invite_html = templates.TemplateResponse(
-                "invite.html",
-                {
-                    "request": request,
-                    "issuer_url": f'{API_URL}/issuers/{issuer_id}/profile',
-                    "nonce": invite.nonce
-                }
-            ).body.decode('utf-8')
-
-            send_email(
-                from_address="digitalbadges@mail.fresnostate.edu",
-                to_addresses=[recipient_in_db.email],
-                subject="[DX - uBadge]",
-                body=invite_html,
-                is_html=True
-            )
+    recipients = unique_recipients(recipients)
+    job = new_job(
+        kind="issue_badge",
+        created_by=current_user.id,
+        params={"issuer_id": issuer_id, "badge_id": badge_id},
+        total=len(recipients)
+    )
+    await runner.submit(job, [recipient.dict() for recipient in recipients])
+    response.headers["Location"] = f"/jobs/{job.id}"
+    return job
 
 
-@router.get("/{issuer_id}/profile")
-async def get_issuer_profile(request: Request, issuer_id: str):
-    issuer = await IssuersDB().get_issuer_by_id(issuer_id)
+@router.post("/{issuer_id}/batches/{date}/sign", response_model=JobOut, status_code=HTTP_202_ACCEPTED)
+async def sign_batch(
+    response: Response,
+    issuer_id: str,
+    date: str,
+    force: bool = False,
+    current_user: UserInDB = Depends(get_current_user)
+):
+    issuer = await IssuersDB().get_public_issuer(issuer_id)
     if issuer is None:
         raise HTTPException(status_code=HTTP_404_NOT_FOUND)
+    if current_user.role != UserRole.ADMIN and issuer.owner_id != current_user.id:
+        raise HTTPException(status_code=HTTP_403_FORBIDDEN)
+    if date == "today":
+        date = today()
+    elif len(date) != 8 or not date.isdigit():
+        raise HTTPException(status_code=HTTP_400_BAD_REQUEST, detail="date must be YYYYMMDD")
+
+    job = new_job(
+        kind="sign_batch",
+        created_by=current_user.id,
+        params={"issuer_id": issuer_id, "date": date, "force": force},
+        total=0
+    )
+    await runner.submit(job)
+    response.headers["Location"] = f"/jobs/{job.id}"
+    return job
+
+
+@router.get("/{issuer_id}/batches/{date}/certs/{cert_id}")
+async def get_batch_cert(issuer_id: str, date: str, cert_id: str):
+    body = await get_signed_cert(issuer_id, date, cert_id)
+    if body is None:
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND)
+    return Response(body, media_type="application/json")
 
-    active_keys = [key for key in issuer.keys if key.date_revoked is None]
-    active_key  = active_keys[0]
-
-    return {
-        "@context": [
-            "https://w3id.org/openbadges/v2",
-            "https://w3id.org/blockcerts/v2"
-        ],
-        "type": "Profile",
-        "id": f"{API_URL}/issuers/{issuer.id}/profile",
-        "name": issuer.name,
-        "url": issuer.url,
-        "introductionURL": f"{API_URL}/issuers/{issuer.id}/intro",
-        "publicKey": [
-            {
-            "id": f"ecdsa-koblitz-pubkey:{active_key.public_key}",
-            "created": active_key.date_created
-            }
-        ],
-        "revocationList": f"{API_URL}/issuers/{issuer.id}/revocations",
-        "image": issuer.image,
-        "email": issuer.email
-    }
+
+@router.get("/{issuer_id}/profile")
+async def get_issuer_profile(request: Request, issuer_id: str):
+    document = await get_profile_document(issuer_id)
+    if document is None:
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND)
+    return document_response(request, document)
 
 
 @router.get("/{issuer_id}/revocations")
-async def get_revocations(issuer_id: str):
-    return {
-        "@context": "https://w3id.org/openbadges/v2",
-        "id": f"{API_URL}/issuers/{issuer_id}/revocations",
-        "type": "RevocationList",
-        "issuer": f"{API_URL}/issuers/{issuer_id}/profile",
-        "revokedAssertions": [
-            {
-            "id": "urn:uuid:93019408-acd8-4420-be5e-0400d643954a",
-            "revocationReason": "Honor code violation"
-            },
-            {
-            "id": "urn:uuid:eda7d784-c03b-40a2-ac10-4857e9627329",
-            "revocationReason": "Issued in error."
-            }
-        ]
-    }
+async def get_revocations(request: Request, issuer_id: str):
+    revocations = await revocation_index.get(issuer_id)
+    if revocations is None:
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND)
+    return document_response(request, revocations.get_document())
+
+
+@router.post("/{issuer_id}/revocations", response_model=RevocationsOut)
+async def revoke_certs(
+    issuer_id: str,
+    revocations: List[RevocationIn],
+    current_user: UserInDB = Depends(get_current_user)
+):
+    issuer = await IssuersDB().get_public_issuer(issuer_id)
+    if issuer is None:
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND)
+    if current_user.role != UserRole.ADMIN and issuer.owner_id != current_user.id:
+        raise HTTPException(status_code=HTTP_403_FORBIDDEN)
+
+    revoked = await revocation_index.revoke(issuer_id, revocations)
+    return RevocationsOut(requested=len(revocations), revoked=len(revoked))
 
 
 @router.post("/{issuer_id}/intro")
-async def handle_invite_accept(issuer_id: str, accept_response: InviteAcceptResponse):
+async def handle_invite_accept(
+    issuer_id: str,
+    accept_response: InviteAcceptResponse,
+    loaders: Loaders = Depends(get_loaders)
+):
     invite = await InvitesDB().get_by_none(accept_response.nonce)
     if invite is None or invite.issuer_id != issuer_id:
         raise HTTPException(status_code=HTTP_400_BAD_REQUEST)
-    recipient = await RecipientsDB().get_recipients_by_id(invite.recipient_id)
-    if recipient is None:
+    # Everything is looked up before the address is written, so a missing
+    # issuer or badge can't fail the request half-way through.
+    issuer, badges = await asyncio.gather(
+        loaders.issuers.load(issuer_id),
+        loaders.badges.load_many([(badge_id, issuer_id) for badge_id in invite.badges])
+    )
+    if issuer is None:
         raise HTTPException(status_code=HTTP_404_NOT_FOUND)
+    missing = [badge_id for badge_id, badge in zip(invite.badges, badges) if badge is None]
+    if missing:
+        logger.warning("Invite %s names deleted badge(s) %s; skipping them", invite.id, ", ".join(missing))
 
     recipient = await RecipientsDB().add_address(invite.recipient_id, issuer_id, accept_response.bitcoinAddress)
-    issuer = await IssuersDB().get_issuer_by_id(issuer_id)
+    if recipient is None:
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND)
+    loaders.recipients.prime(recipient.id, recipient)
 
-    for badge_id in invite.badges:
-        badge = BadgesDB().get_badge_by_id(badge_id, issuer_id)
-        issue_cert(issuer, recipient, badge)
+    for badge in badges:
+        if badge is not None:
+            await issue_cert(issuer, recipient, badge)
 
     await InvitesDB().delete(invite.id)
 
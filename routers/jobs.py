@@ -0,0 +1,23 @@
+# Third party library imports
+from fastapi import APIRouter, Depends, HTTPException
+from starlette.status import HTTP_404_NOT_FOUND
+
+# Package imports
+from services.auth import get_current_user
+from services.jobs import runner
+from models.jobs import JobOut
+from models.users import UserRole, UserInDB
+
+
+router = APIRouter()
+
+
+@router.get("/{job_id}", response_model=JobOut)
+async def get_job(job_id: str, current_user: UserInDB = Depends(get_current_user)):
+    job = await runner.store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND)
+    # Other users' jobs are reported as missing rather than forbidden.
+    if current_user.role != UserRole.ADMIN and job.created_by != current_user.id:
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND)
+    return job
@@ -0,0 +1,14 @@
+# Third party library imports
+from fastapi import APIRouter
+from starlette.responses import Response
+
+# Package imports
+from core.metrics import CONTENT_TYPE, registry
+
+
+router = APIRouter()
+
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return Response(registry.render(), media_type=CONTENT_TYPE)
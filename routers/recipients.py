@@ -1,6 +1,7 @@
 from typing import List
 
 from fastapi import APIRouter, Depends, HTTPException
+from starlette.requests import Request
 from starlette.responses import Response
 from starlette.status import (
     HTTP_201_CREATED,
@@ -10,17 +11,31 @@ from starlette.status import (
     HTTP_409_CONFLICT
 )
 
+from core.pagination import PageParams, set_next_link, wants_ndjson, ndjson_response
+from core.responses import model_response
 from db.recipients import RecipientsDB
+from db.certs import CertsDB
 from services.auth import get_current_user
 from models.users import UserRole, UserInDB
 from models.recipients import RecipientIn, RecipientInDB
+from models.certs import CertInDB
 
 router = APIRouter()
 
 
 @router.get("/", response_model=List[RecipientInDB])
-async def get_all_recipients(prefix: str = None, current_user: UserInDB = Depends(get_current_user)):
-    return await RecipientsDB().get_all_recipients()
+async def get_all_recipients(
+    request: Request,
+    response: Response,
+    prefix: str = None,
+    page: PageParams = Depends(),
+    current_user: UserInDB = Depends(get_current_user)
+):
+    if wants_ndjson(request):
+        return ndjson_response(RecipientsDB().iter_recipient_pages(), RecipientInDB)
+    recipients, last_key = await RecipientsDB().get_recipients_page(page.limit, page.start_key)
+    set_next_link(request, response, last_key)
+    return model_response(recipients, RecipientInDB, response)
 
 
 @router.get("/{recipient_id}", response_model=RecipientInDB)
@@ -28,7 +43,24 @@ async def get_recipient(recipient_id: str, current_user: UserInDB = Depends(get_
     recipient = await RecipientsDB().get_recipients_by_id(recipient_id)
     if recipient is None:
         raise HTTPException(status_code=HTTP_404_NOT_FOUND)
-    return recipient
+    return model_response(recipient, RecipientInDB)
+
+
+@router.get("/{recipient_id}/certs", response_model=List[CertInDB])
+async def get_recipient_certs(
+    request: Request,
+    response: Response,
+    recipient_id: str,
+    page: PageParams = Depends(),
+    current_user: UserInDB = Depends(get_current_user)
+):
+    if await RecipientsDB().get_recipients_by_id(recipient_id) is None:
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND)
+    if wants_ndjson(request):
+        return ndjson_response(CertsDB().iter_cert_pages_by_recipient_id(recipient_id), CertInDB)
+    certs, last_key = await CertsDB().get_certs_page_by_recipient_id(recipient_id, page.limit, page.start_key)
+    set_next_link(request, response, last_key)
+    return model_response(certs, CertInDB, response)
 
 
 @router.post("/", response_model=RecipientInDB, status_code=HTTP_201_CREATED)
@@ -41,7 +73,7 @@ async def create_recipient(
         raise HTTPException(status_code=HTTP_409_CONFLICT)
     recipient = await RecipientsDB().create_recipient(recipient)
     response.headers["Location"] = f"/recipients/{recipient.id}"
-    return recipient
+    return model_response(recipient, RecipientInDB, response, HTTP_201_CREATED)
 
 
 @router.put("/{recipient_id}")
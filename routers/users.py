@@ -5,6 +5,7 @@ from typing import List
 # Third party imports
 import jwt
 from fastapi import APIRouter, Depends, HTTPException
+from starlette.requests import Request
 from starlette.responses import Response
 from starlette.status import (
     HTTP_201_CREATED,
@@ -16,7 +17,9 @@ from starlette.status import (
 )
 
 # Package imports
-from db.users import UsersDB
+from core.pagination import PageParams, set_next_link, wants_ndjson, ndjson_response
+from core.responses import model_response
+from db.users import UsersDB, EmailTaken
 from services.auth import get_current_user
 from models.users import (
     UserRole,
@@ -31,12 +34,18 @@ router = APIRouter()
 
 
 @router.get("/", response_model=List[UserOut])
-async def get_users(role: UserRole= None, current_user: UserInDB = Depends(get_current_user)):
-    if role:
-        users = await UsersDB().get_users_by_role(role)
-    else:
-        users = await UsersDB().get_all_users()
-    return users
+async def get_users(
+    request: Request,
+    response: Response,
+    role: UserRole = None,
+    page: PageParams = Depends(),
+    current_user: UserInDB = Depends(get_current_user)
+):
+    if wants_ndjson(request):
+        return ndjson_response(UsersDB().iter_user_pages(role), UserOut)
+    users, last_key = await UsersDB().get_users_page(page.limit, page.start_key, role)
+    set_next_link(request, response, last_key)
+    return model_response(users, UserOut, response)
 
 
 @router.get("/{user_id}", response_model=UserOut)
@@ -44,7 +53,7 @@ async def get_user(user_id: str, current_user: UserInDB = Depends(get_current_us
     user = await UsersDB().get_user_by_id(user_id)
     if user is None:
         raise HTTPException(status_code=HTTP_404_NOT_FOUND)
-    return user
+    return model_response(user, UserOut)
 
 
 @router.post("/", status_code=HTTP_201_CREATED, response_model=UserOut)
@@ -60,7 +69,7 @@ async def create_user(user: UserInCreate, response: Response, current_user: User
 
     user = await UsersDB().create_user(**user.dict())
     response.headers["Location"] = f"/users/{user.id}"
-    return user
+    return model_response(user, UserOut, response, HTTP_201_CREATED)
 
 
 @router.put("/{user_id}", status_code=HTTP_204_NO_CONTENT)
@@ -68,13 +77,12 @@ async def update_user(user_id: str, user: UserInUpdate, current_user: UserInDB =
     if current_user.role != UserRole.ADMIN:
         raise HTTPException(status_code=HTTP_403_FORBIDDEN)
 
-    if await UsersDB().get_user_by_id(user_id) is None:
-        raise HTTPException(status_code=HTTP_404_NOT_FOUND)
-
     try:
         update_user = await UsersDB().update_user(user_id, **user.dict())
-    except:
+    except EmailTaken:
         raise HTTPException(
             status_code=HTTP_400_BAD_REQUEST, 
             detail=f"Email {user.email} is already taken"
         )
+    if update_user is None:
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND)
@@ -7,7 +7,7 @@ from starlette.status import HTTP_401_UNAUTHORIZED
 
 # Package imports
 from db.users import UsersDB
-from services.security import verify_password
+from services.security import hasher
 from services.jwt import decode_access_token
 
 
@@ -16,8 +16,16 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
 
 async def authenticate_user(email: str, password: str):
     user = await UsersDB().get_user_by_email(email)
-    if not user or not verify_password(password, user.hashed_password):
+    if not user:
         return False
+    verified, new_hash = await hasher.verify_and_update(password, user.hashed_password)
+    if not verified:
+        return False
+    # The stored hash predates the configured scheme or cost, so upgrade it
+    # while the plain password is at hand.
+    if new_hash:
+        await UsersDB().set_password_hash(user.id, user.email, new_hash)
+        user.hashed_password = new_hash
     return user
 
 
@@ -31,7 +39,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         token_data = decode_access_token(token)
     except:
         raise credentials_exception
-    user = await UsersDB().get_user_by_email(token_data.username)
+    user = await UsersDB().get_authenticated_user(token_data.username)
     if user is None:
         raise credentials_exception
     return user
@@ -0,0 +1,158 @@
+"""JSON-LD canonicalization and hashing of certs, without network access.
+
+Usage: python -m services.canonical {fetch,check}
+
+Certs only reference the contexts in PRELOADED_CONTEXTS, which are read
+from services/contexts/ instead of being fetched. They're committed there,
+so deployments never need the network; `fetch` refreshes them. `check`
+hashes services/contexts/sample-cert.json and compares the result with
+SAMPLE_CERT_DIGEST, exiting non-zero on a mismatch.
+"""
+# Standard library imports
+import argparse
+import asyncio
+import functools
+import hashlib
+import json
+import os
+import sys
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+
+# Third party imports
+from pyld import jsonld
+
+# Package imports
+from core.config import CANONICALIZE_WORKERS
+
+
+CONTEXT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "contexts")
+
+PRELOADED_CONTEXTS = {
+    "https://w3id.org/openbadges/v2": "openbadges-v2.json",
+    "https://w3id.org/blockcerts/v2": "blockcerts-v2.json"
+}
+
+
+# Leaf hash of services/contexts/sample-cert.json. It changes only if the
+# contexts or the canonicalization do, and then every verifier would
+# compute different hashes for certs already issued.
+SAMPLE_CERT_DIGEST = "35e1dd8463b88db96d11a53d740c3849e81dc8572f87a6c3c3111a142427ce51"
+
+
+class ContextNotCached(Exception):
+    pass
+
+
+@functools.lru_cache(maxsize=None)
+def load_context(url: str):
+    """Parse a cached context once per process."""
+    filename = PRELOADED_CONTEXTS.get(url)
+    if filename is None:
+        raise ContextNotCached(f"{url} is not a preloaded JSON-LD context")
+    try:
+        with open(os.path.join(CONTEXT_DIR, filename)) as context:
+            return json.load(context)
+    except FileNotFoundError:
+        raise ContextNotCached(f"{url} is missing; run python -m services.canonical fetch")
+
+
+def document_loader(url: str, options: dict = None):
+    return {
+        "contextUrl": None,
+        "documentUrl": url,
+        "document": load_context(url)
+    }
+
+
+# pyld memoizes processed contexts in its active context cache, so with
+# every cert naming the same contexts they're expanded once per process.
+NORMALIZE_OPTIONS = {
+    "algorithm": "URDNA2015",
+    "format": "application/n-quads",
+    "documentLoader": document_loader
+}
+
+
+def normalize(cert: dict):
+    return jsonld.normalize(cert, NORMALIZE_OPTIONS)
+
+
+def hash_cert(cert: dict):
+    """Blockcerts leaf hash: sha256 of the cert's URDNA2015 N-Quads."""
+    return hashlib.sha256(normalize(cert).encode()).digest()
+
+
+def hash_certs(certs: List[dict]):
+    return [hash_cert(cert) for cert in certs]
+
+
+class CertHasher:
+    """Canonicalizes and hashes certs on a process pool.
+
+    Normalization is pure Python and CPU bound, so one batch is split into
+    a chunk per worker rather than one task per cert, keeping pickling
+    overhead low.
+    """
+
+    def __init__(self, workers: int = CANONICALIZE_WORKERS):
+        self.workers = workers
+        self.executor = None
+
+    def get_executor(self):
+        # Created on first use so importing this module never forks.
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self.executor
+
+    async def hash_many(self, certs: List[dict]):
+        if not certs:
+            return []
+        loop = asyncio.get_event_loop()
+        size = -(-len(certs) // self.workers)
+        chunks = [certs[start:start + size] for start in range(0, len(certs), size)]
+        results = await asyncio.gather(*(
+            loop.run_in_executor(self.get_executor(), hash_certs, chunk) for chunk in chunks
+        ))
+        return [digest for chunk in results for digest in chunk]
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+
+cert_hasher = CertHasher()
+
+
+def fetch_contexts():
+    os.makedirs(CONTEXT_DIR, exist_ok=True)
+    for url, filename in PRELOADED_CONTEXTS.items():
+        request = urllib.request.Request(url, headers={"Accept": "application/ld+json, application/json"})
+        with urllib.request.urlopen(request) as response:
+            context = json.load(response)
+        with open(os.path.join(CONTEXT_DIR, filename), "w") as cached:
+            json.dump(context, cached, indent=2, sort_keys=True)
+            cached.write("\n")
+        print(f"{url} -> {filename}")
+
+
+def check_sample_cert():
+    with open(os.path.join(CONTEXT_DIR, "sample-cert.json")) as sample:
+        digest = hash_cert(json.load(sample)).hex()
+    if digest != SAMPLE_CERT_DIGEST:
+        print(f"sample cert hashed to {digest}, expected {SAMPLE_CERT_DIGEST}")
+        return 1
+    print(f"sample cert hash ok: {digest}")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=("fetch", "check"))
+    args = parser.parse_args()
+    if args.command == "fetch":
+        fetch_contexts()
+    else:
+        sys.exit(check_sample_cert())
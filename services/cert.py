@@ -1,128 +1,189 @@
-import os
 import datetime
 import uuid
-import json
-from io import BytesIO
+from typing import List, Tuple
 
 # Third party imports
-import boto3
+import orjson
 import pytz
 from pytz import timezone
-# from flask import render_template
 
 # Package imports
+from core.config import API_URL
 from models.recipients import RecipientInDB
 from models.badges import BadgeInDB
 from models.issuers import IssuerInDB
+from models.certs import CertInDB
+from db.certs import CertsDB
 from db.recipients import RecipientsDB
+from services.packs import INDEX_SUFFIX, PackWriter, write_pack, get_index, read_cert
+from services.storage import storage
+from services.uploader import uploader
 
 
-bucket = boto3.resource('s3').Bucket('dx.ubadges.poc')
+def batch_prefix(date: str, issuer_id: str):
+    return f"batch/{date}/{issuer_id}/"
 
 
-def generate_unsigned_cert(issuer: IssuerInDB, recipient: RecipientInDB, badge: BadgeInDB):
-    unsigned_cert_id = str(uuid.uuid4())
-    issuer_public_key = [key for key in issuer.keys if key.date_revoked is None][0]
-
-    # Get date in pacific time
-    date = datetime.datetime.now(tz=pytz.utc)
-    date = date.astimezone(timezone('US/Pacific'))
-
-    display_html = ""
-    # display_html = render_template('cert/template_{}.html'.format(badge['template']),
-    #     issuerID=issuer['id'], 
-    #     recipientName=recipient['name'],
-    #     description=badge['description'],
-    #     badgeImage=badge['image'],
-    #     badgeName=badge['name'],
-    #     date=str(date),
-    #     signature=badge['signatureLines'][0]['image'],
-    #     template=badge['template'])
-    
-    unsigned_cert = ""
-    # unsigned_cert = render_template('cert/unsigned_cert.json',
-    #     date=date.isoformat(),
-    #     issuer_public_key=str(issuer_public_key),
-    #     issuer_url=issuer['url'],
-    #     issuer_name=issuer['name'],
-    #     issuer_email=issuer['email'],
-    #     issuer_path='{}/issuers/{}'.format(os.getenv('API_URL'), issuer['id']),
-    #     issuer_image=issuer['image'],
-    #     issuer_revocations_path='{}/issuers/{}/revocations'.format(os.getenv('API_URL'), issuer['id']),
-    #     badge_name=badge['name'],
-    #     badge_narrative=badge['criteria']['narrative'],
-    #     badge_image=badge['image'],
-    #     badge_urn='urn:uuid:{}'.format(badge['id']),
-    #     badge_description=badge['description'],
-    #     badge_signature_lines=badge['signatureLines'],
-    #     cert_urn='urn:uuid:{}'.format(unsigned_cert_id),
-    #     recipient_name=recipient['name'],
-    #     recipient_email=recipient['email'],
-    #     recipient_public_key='ecdsa-koblitz-pubkey:{}'.format(recipient['addresses'][issuer['id']]),
-    #     display_html=display_html)
-
-    unsigned_cert = {
-        "issuedOn": str(date),
-        "recipient": {
-            "identity": recipient.email,
-            "type": "email",
-            "hashed": False
-        },
-        "type": "Assertion",
-        "verification": {
-            "publicKey": f"ecdsa-koblitz-pubkey:{issuer_public_key}",
-            "type": ["MerkleProofVerification2017", "Extension"]
-        },
-        "@context": ["https://w3id.org/openbadges/v2", "https://w3id.org/blockcerts/v2"],
-        "badge": {
-            "issuer": {
-                "url": issuer.url,
-                "name": issuer.name,
-                "email": issuer.email,
-                "type": "Profile",
-                "id": f"http://44.230.82.35/issuers/{issuer.id}",
-                "image": issuer.image,
-                "revocationList": f"http://44.230.82.35/issuers/{issuer.id}/revocations"
+def signed_cert_path(cert_id: str):
+    return f"certs/{cert_id}.json"
+
+
+PACIFIC = timezone('US/Pacific')
+
+CONTEXT = ["https://w3id.org/openbadges/v2", "https://w3id.org/blockcerts/v2"]
+
+
+def active_key(issuer: IssuerInDB):
+    return next(key for key in issuer.keys if key.date_revoked is None)
+
+
+class CertTemplate:
+    """The part of a cert shared by every recipient of one badge, serialized once.
+
+    render() serializes only the per-recipient fields and splices them
+    onto the shared prefix, so a batch never rebuilds the issuer and badge
+    blocks.
+    """
+
+    def __init__(self, issuer: IssuerInDB, badge: BadgeInDB):
+        self.issuer_id = issuer.id
+        shared = {
+            "@context": CONTEXT,
+            "type": "Assertion",
+            "verification": {
+                "publicKey": f"ecdsa-koblitz-pubkey:{active_key(issuer).public_key}",
+                "type": ["MerkleProofVerification2017", "Extension"]
             },
-            "name": badge.name,
-            "type": "BadgeClass",
-            "critaria": badge.criteria.dict(),
-            "image": badge.image,
-            "id": f"urn:uuid:{badge.id}",
-            "description": badge.description,
-            "signatureLines": list(map(lambda signatureLine: signatureLine.dict(), badge.signatureLines))
-        },
-        "id": f"urn:uuid:{unsigned_cert_id}",
-        "recipientProfile": {
-            "publicKey": f"ecdsa-koblitz-pubkey:{recipient.addresses[issuer.id]}",
-            "name": recipient.name,
-            "type": ["RecipientProfile", "Extension"]
+            "badge": {
+                "issuer": {
+                    "url": issuer.url,
+                    "name": issuer.name,
+                    "email": issuer.email,
+                    "type": "Profile",
+                    "id": f"{API_URL}/issuers/{issuer.id}/profile",
+                    "image": issuer.image,
+                    "revocationList": f"{API_URL}/issuers/{issuer.id}/revocations"
+                },
+                "name": badge.name,
+                "type": "BadgeClass",
+                "criteria": badge.criteria.dict(),
+                "image": badge.image,
+                "id": f"urn:uuid:{badge.id}",
+                "description": badge.description,
+                "signatureLines": [signature_line.dict() for signature_line in badge.signatureLines]
+            }
         }
-    }
-    return unsigned_cert_id, unsigned_cert
-        
+        # Drop the closing brace; render() supplies the rest of the object.
+        self.prefix = orjson.dumps(shared)[:-1] + b","
+
+    def render(self, recipient: RecipientInDB, cert_id: str = None, issued_on: str = None):
+        """Return the new cert's id and its serialized JSON."""
+        cert_id = cert_id or str(uuid.uuid4())
+        issued_on = issued_on or datetime.datetime.now(tz=PACIFIC).isoformat()
+        fields = orjson.dumps({
+            "id": f"urn:uuid:{cert_id}",
+            "issuedOn": issued_on,
+            "recipient": {
+                "identity": recipient.email,
+                "type": "email",
+                "hashed": False
+            },
+            "recipientProfile": {
+                "publicKey": f"ecdsa-koblitz-pubkey:{recipient.addresses[self.issuer_id]}",
+                "name": recipient.name,
+                "type": ["RecipientProfile", "Extension"]
+            }
+        })
+        return cert_id, self.prefix + fields[1:]
+
+
+def generate_unsigned_cert(issuer: IssuerInDB, recipient: RecipientInDB, badge: BadgeInDB):
+    unsigned_cert_id, body = CertTemplate(issuer, badge).render(recipient)
+    return unsigned_cert_id, orjson.loads(body)
+
 
-async def upload_unsigned_cert(issuer_id, unsigned_cert_id, unsigned_cert):
-    date        = datetime.datetime.now(tz=pytz.utc)
-    
-    fileobj     = BytesIO(json.dumps(unsigned_cert).encode())
-    filepath    = f"batch/{date.strftime('%Y%m%d')}/{issuer_id}/unsigned/{unsigned_cert_id}.json"
-    bucket.upload_fileobj(fileobj, filepath, ExtraArgs={'ACL': 'public-read'})
-    
+def today():
+    return datetime.datetime.now(tz=pytz.utc).strftime('%Y%m%d')
 
-async def issue_cert(issuer: IssuerInDB, recipient: RecipientInDB, badge: BadgeInDB):
-    # Get issuer's active key
-    issuer_public_key = [key for key in issuer.keys if key.date_revoked is None][0]
 
-    # Get recipient's address associated with this issuer
-    recipient_address = recipient.addresses[issuer.id]
+def cert_url(issuer_id: str, date: str, cert_id: str):
+    return f"{API_URL}/issuers/{issuer_id}/batches/{date}/certs/{cert_id}"
+
+
+def new_cert(issuer: IssuerInDB, badge: BadgeInDB, recipient: RecipientInDB, cert_id: str, date: str):
+    return CertInDB(
+        recipient_id=recipient.id,
+        cert_id=cert_id,
+        url=cert_url(issuer.id, date, cert_id),
+        issuer_id=issuer.id,
+        badge_id=badge.id,
+        issued_at=datetime.datetime.utcnow()
+    )
+
+
+async def upload_unsigned_cert(issuer_id: str, unsigned_cert_id: str, body: bytes, date: str):
+    filepath    = f"{batch_prefix(date, issuer_id)}unsigned/{unsigned_cert_id}.json"
+    await uploader.upload(filepath, body, public=True)
+
+
+async def upload_unsigned_pack(issuer_id: str, certs: List[Tuple[str, bytes]], date: str, pack_id: str = None):
+    """Write (cert id, body) pairs into one pack in the date's batch.
+
+    Writing again with the same pack_id replaces the pack.
+    """
+    writer = PackWriter(f"{batch_prefix(date, issuer_id)}packs/{pack_id or uuid.uuid4()}")
+    for unsigned_cert_id, body in certs:
+        writer.add(unsigned_cert_id, body)
+    await write_pack(uploader, writer, public=True)
+
+
+async def issue_cert(
+    issuer: IssuerInDB,
+    recipient: RecipientInDB,
+    badge: BadgeInDB,
+    template: CertTemplate = None,
+    cert_id: str = None
+):
+    """Issue one cert. Pass the template when issuing the same badge to many recipients.
+
+    Issuing again with the same cert_id replaces the unsigned cert's body
+    but doesn't record the cert or count it a second time.
+    """
+    template = template or CertTemplate(issuer, badge)
+    date = today()
 
     # Generate unsigned cert
-    unsigned_cert_id, unsigned_cert = generate_unsigned_cert(issuer, recipient, badge)
+    unsigned_cert_id, body = template.render(recipient, cert_id)
 
     # Upload unsigned cert to file storage
-    await upload_unsigned_cert(issuer.id, unsigned_cert_id, unsigned_cert)
-    
-    # Update recipients DB entry with new cert
-    await RecipientsDB().add_cert(recipient.id, unsigned_cert_id)
+    await upload_unsigned_cert(issuer.id, unsigned_cert_id, body, date)
+
+    # Record the cert against its recipient. A crash between these two
+    # writes leaves that recipient's count one short; it never counts a
+    # cert twice.
+    if await CertsDB().create_cert_once(new_cert(issuer, badge, recipient, unsigned_cert_id, date)):
+        await RecipientsDB().increment_cert_count(recipient.id)
+
+
+def issued_by(body: bytes, issuer_id: str):
+    # The profile URL's host is whatever API_URL was at issue time.
+    issuer = orjson.loads(body).get("badge", {}).get("issuer", {})
+    return str(issuer.get("id", "")).endswith(f"/issuers/{issuer_id}/profile")
+
+
+async def get_signed_cert(issuer_id: str, date: str, cert_id: str):
+    """A signed cert's JSON from the batch's signed pack, falling back to its own object.
 
+    Per-cert objects aren't stored under the issuer, so one issued by
+    another issuer counts as not found.
+    """
+    index = await get_index(storage, f"{batch_prefix(date, issuer_id)}signed{INDEX_SUFFIX}")
+    if index is not None:
+        body = await read_cert(storage, index, cert_id)
+        if body is not None:
+            return body
+    if await storage.exists(signed_cert_path(cert_id)):
+        body = await storage.get(signed_cert_path(cert_id))
+        if issued_by(body, issuer_id):
+            return body
+    return None
@@ -0,0 +1,98 @@
+# Standard library imports
+import hashlib
+import json
+from typing import NamedTuple
+
+# Third party imports
+from fastapi.encoders import jsonable_encoder
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.status import HTTP_304_NOT_MODIFIED
+
+# Package imports
+from core.cache import ReadThroughCache
+from core.config import (
+    API_URL,
+    PUBLIC_DOCUMENT_CACHE_SIZE,
+    PUBLIC_DOCUMENT_CACHE_TTL,
+    PUBLIC_DOCUMENT_MAX_AGE
+)
+from db.issuers import IssuersDB, issuer_cache
+from models.issuers import IssuerInDB
+
+
+class Document(NamedTuple):
+    body: bytes
+    etag: str
+
+    @classmethod
+    def from_content(cls, content: dict):
+        return cls.from_body(json.dumps(jsonable_encoder(content), separators=(",", ":")).encode())
+
+    @classmethod
+    def from_body(cls, body: bytes):
+        return cls(body=body, etag='"%s"' % hashlib.sha256(body).hexdigest()[:32])
+
+
+# Serialized issuer profiles by issuer id. Profiles are built from issuers,
+# so the cache follows the issuer cache's invalidations.
+profile_cache = ReadThroughCache(
+    "profiles",
+    PUBLIC_DOCUMENT_CACHE_SIZE,
+    PUBLIC_DOCUMENT_CACHE_TTL,
+    follows=(issuer_cache.name,)
+)
+
+
+def profile(issuer: IssuerInDB):
+    active_keys = [key for key in issuer.keys if key.date_revoked is None]
+    active_key  = active_keys[0]
+
+    return {
+        "@context": [
+            "https://w3id.org/openbadges/v2",
+            "https://w3id.org/blockcerts/v2"
+        ],
+        "type": "Profile",
+        "id": f"{API_URL}/issuers/{issuer.id}/profile",
+        "name": issuer.name,
+        "url": issuer.url,
+        "introductionURL": f"{API_URL}/issuers/{issuer.id}/intro",
+        "publicKey": [
+            {
+            "id": f"ecdsa-koblitz-pubkey:{active_key.public_key}",
+            "created": active_key.date_created
+            }
+        ],
+        "revocationList": f"{API_URL}/issuers/{issuer.id}/revocations",
+        "image": issuer.image,
+        "email": issuer.email
+    }
+
+
+async def get_profile_document(issuer_id: str):
+    async def load():
+        issuer = await IssuersDB().get_public_issuer(issuer_id)
+        if issuer is None:
+            return None
+        return Document.from_content(profile(issuer))
+    return await profile_cache.get(issuer_id, load)
+
+
+def opaque_tag(tag: str) -> str:
+    # If-None-Match uses the weak comparison (RFC 7232): a W/ prefix on
+    # either tag doesn't stop a match.
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def document_response(request: Request, document: Document):
+    headers = {
+        "ETag": document.etag,
+        "Cache-Control": f"public, max-age={PUBLIC_DOCUMENT_MAX_AGE}"
+    }
+    if_none_match = request.headers.get("if-none-match", "")
+    tags = [opaque_tag(tag) for tag in if_none_match.split(",")]
+    if opaque_tag(document.etag) in tags or "*" in tags:
+        return Response(status_code=HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(document.body, media_type="application/json", headers=headers)
@@ -1,29 +1,319 @@
+# Standard library
+import argparse
+import asyncio
+import json
+import logging
+import os
+from typing import List, NamedTuple
+
+# Third party imports
 import boto3
+from botocore.config import Config as BotoConfig
+from botocore.exceptions import ClientError
+from starlette.concurrency import run_in_threadpool
+
+# Package imports
+from core.config import (
+    EMAIL_FROM_ADDRESS,
+    EMAIL_SINK,
+    EMAIL_FILE_PATH,
+    EMAIL_DRAIN_TIMEOUT,
+    SES_MAX_SEND_RATE,
+    SES_MAX_RETRIES,
+    SES_INVITE_TEMPLATE
+)
+from core.metrics import CallMetrics
+from core.retry import with_backoff
+from services.templates import invite_context, render_invite, render_invite_template
+
+
+logger = logging.getLogger(__name__)
+
+INVITE_SUBJECT = "[DX - uBadge]"
+
+# SendBulkTemplatedEmail accepts at most 50 destinations per call.
+MAX_BULK_DESTINATIONS = 50
+
+THROTTLING_CODES = ("Throttling", "ThrottlingException", "ServiceUnavailable")
+
+calls = CallMetrics("email", "Email sink", ("sink", "operation"))
 
-from models.invites import InviteInDB
 
-def send_email(from_address, to_addresses, subject, body, is_html=False):
-    msg = {
+class Email(NamedTuple):
+    to_address: str
+    subject: str = None
+    body: str = None
+    is_html: bool = True
+    template: str = None
+    template_data: dict = None
+    from_address: str = EMAIL_FROM_ADDRESS
+
+
+def invite_email(to_address: str, issuer_id: str, nonce: str):
+    if SES_INVITE_TEMPLATE:
+        return Email(
+            to_address=to_address,
+            template=SES_INVITE_TEMPLATE,
+            template_data=invite_context(issuer_id, nonce)
+        )
+    return Email(
+        to_address=to_address,
+        subject=INVITE_SUBJECT,
+        body=render_invite(issuer_id, nonce)
+    )
+
+
+def build_message(subject, body, is_html=False):
+    part = "Html" if is_html else "Text"
+    return {
         'Subject': {
             'Data': subject,
             'Charset': 'utf-8'
         },
-        'Body': {}
+        'Body': {
+            part: {
+                'Data': body,
+                'Charset': 'utf-8'
+            }
+        }
     }
 
-    if is_html:
-        msg['Body']['Html'] = {}
-        msg['Body']['Html']['Data'] = body
-        msg['Body']['Html']['Charset'] = 'utf-8'
-    else:
-        msg['Body']['Text'] = {}
-        msg['Body']['Text']['Data'] = body
-        msg['Body']['Text']['Charset'] = 'utf-8'
-
-    boto3.client('ses').send_email(
-        Source=from_address,
-        Destination={
-            'ToAddresses': to_addresses
-        },
-        Message=msg
-    )
+
+def is_throttled(error: Exception):
+    if not isinstance(error, ClientError):
+        return False
+    code = error.response.get("Error", {}).get("Code")
+    message = error.response.get("Error", {}).get("Message", "")
+    # A spent daily quota is also reported as Throttling, but retrying
+    # within this process won't help with that one.
+    return code in THROTTLING_CODES and "Daily message quota" not in message
+
+
+class SESSink:
+    """Sends through one long-lived SES client shared by every send."""
+
+    name = "ses"
+
+    def __init__(self):
+        self.client = boto3.client(
+            "ses",
+            config=BotoConfig(max_pool_connections=max(10, int(SES_MAX_SEND_RATE)))
+        )
+
+    async def send(self, email: Email):
+        await run_in_threadpool(
+            self.client.send_email,
+            Source=email.from_address,
+            Destination={'ToAddresses': [email.to_address]},
+            Message=build_message(email.subject, email.body, email.is_html)
+        )
+
+    async def send_bulk(self, emails: List[Email]):
+        """Send emails sharing one SES template. Returns an error or None per email."""
+        result = await run_in_threadpool(
+            self.client.send_bulk_templated_email,
+            Source=emails[0].from_address,
+            Template=emails[0].template,
+            DefaultTemplateData="{}",
+            Destinations=[
+                {
+                    "Destination": {"ToAddresses": [email.to_address]},
+                    "ReplacementTemplateData": json.dumps(email.template_data)
+                }
+                for email in emails
+            ]
+        )
+        return [
+            None if status["Status"] == "Success" else status.get("Error") or status["Status"]
+            for status in result["Status"]
+        ]
+
+
+class MemorySink:
+    """Keeps sent emails in a list, for tests."""
+
+    name = "memory"
+
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, email: Email):
+        self.sent.append(email)
+
+    async def send_bulk(self, emails: List[Email]):
+        self.sent.extend(emails)
+        return [None] * len(emails)
+
+
+class FileSink:
+    """Appends sent emails to a JSON-lines file, for local development."""
+
+    name = "file"
+
+    def __init__(self, path: str = EMAIL_FILE_PATH):
+        self.path = path
+
+    async def send(self, email: Email):
+        await run_in_threadpool(self.write, [email])
+
+    async def send_bulk(self, emails: List[Email]):
+        await run_in_threadpool(self.write, emails)
+        return [None] * len(emails)
+
+    def write(self, emails: List[Email]):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "a") as outbox_file:
+            for email in emails:
+                outbox_file.write(json.dumps(email._asdict()) + "\n")
+
+
+class RateLimiter:
+    """Spaces calls out to at most `rate` per second across all callers."""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate
+        self.next_slot = 0
+
+    async def acquire(self, count: int = 1):
+        loop = asyncio.get_event_loop()
+        now = loop.time()
+        wait = self.next_slot - now
+        self.next_slot = max(now, self.next_slot) + self.interval * count
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class Outbox:
+    """Queue of outgoing email, sent at no more than SES_MAX_SEND_RATE.
+
+    send() waits until the email has been handed to the sink, so callers
+    still see which recipients failed. Consecutive templated emails that use
+    the same template go out together in one bulk call.
+    """
+
+    def __init__(
+        self,
+        sink,
+        rate: float = SES_MAX_SEND_RATE,
+        max_retries: int = SES_MAX_RETRIES,
+        workers: int = 8
+    ):
+        self.sink = sink
+        self.limiter = RateLimiter(rate)
+        self.max_retries = max_retries
+        self.workers = workers
+        self.queue = None
+        self.tasks = []
+
+    async def send(self, email: Email):
+        self.start()
+        future = asyncio.get_event_loop().create_future()
+        self.queue.put_nowait((email, future))
+        await future
+
+    def start(self):
+        # Several workers so a slow SES call doesn't hold the rate below the limit.
+        if not self.tasks:
+            self.queue = asyncio.Queue()
+            self.tasks = [asyncio.ensure_future(self.work()) for _ in range(self.workers)]
+
+    async def stop(self, timeout: float = EMAIL_DRAIN_TIMEOUT):
+        if not self.tasks:
+            return
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Stopping with %d email(s) unsent", self.queue.qsize())
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        # Emails still queued won't be sent; don't leave their senders waiting.
+        while not self.queue.empty():
+            _, future = self.queue.get_nowait()
+            future.cancel()
+
+    async def work(self):
+        pending = None
+        while True:
+            batch = [pending or await self.queue.get()]
+            pending = None
+            template = batch[0][0].template
+            while template and len(batch) < MAX_BULK_DESTINATIONS and not self.queue.empty():
+                item = self.queue.get_nowait()
+                if item[0].template != template:
+                    pending = item
+                    break
+                batch.append(item)
+            try:
+                await self.deliver(batch)
+            except asyncio.CancelledError:
+                for _, future in batch + ([pending] if pending else []):
+                    future.cancel()
+                raise
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def deliver(self, batch):
+        emails = [email for email, _ in batch]
+        await self.limiter.acquire(len(emails))
+        try:
+            if emails[0].template:
+                errors = await self.with_retries(self.sink.send_bulk, emails)
+            else:
+                await self.with_retries(self.sink.send, emails[0])
+                errors = [None]
+        except Exception as error:
+            logger.warning("Sending %d email(s) failed: %s", len(emails), error)
+            errors = [error] * len(emails)
+
+        for (_, future), error in zip(batch, errors):
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(None)
+            else:
+                future.set_exception(error if isinstance(error, Exception) else RuntimeError(error))
+
+    async def with_retries(self, send, *args):
+        async def attempt():
+            return await calls.measure((self.sink.name, send.__name__), send(*args))
+        return await with_backoff(attempt, is_throttled, self.max_retries)
+
+
+def get_sink(name: str = EMAIL_SINK):
+    sinks = {
+        "ses": SESSink,
+        "file": FileSink,
+        "memory": MemorySink
+    }
+    return sinks[name]()
+
+
+outbox = Outbox(get_sink())
+
+
+def publish_invite_template(name: str):
+    """Create or update the SES template used for bulk invite sends."""
+    client = boto3.client("ses")
+    template = {
+        "TemplateName": name,
+        "SubjectPart": INVITE_SUBJECT,
+        "HtmlPart": render_invite_template()
+    }
+    try:
+        client.create_template(Template=template)
+    except ClientError as error:
+        if error.response["Error"]["Code"] != "AlreadyExists":
+            raise
+        client.update_template(Template=template)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Publish the invite email as an SES template.")
+    parser.add_argument("--name", default=SES_INVITE_TEMPLATE or "ubadges-invite")
+    args = parser.parse_args()
+    publish_invite_template(args.name)
@@ -0,0 +1,294 @@
+# Standard library
+import asyncio
+import uuid
+from typing import List
+
+# Package imports
+from core.config import ISSUANCE_CONCURRENCY, JOB_CHUNK_SIZE, CERT_STORAGE_FORMAT
+from db.recipients import RecipientsDB
+from db.certs import CertsDB
+from db.invites import InvitesDB
+from db.loaders import Loaders
+from services.cert import CertTemplate, issue_cert, new_cert, today, upload_unsigned_pack
+from services.email import invite_email, outbox
+from services.jobs import JobStore, runner
+from models.issuers import IssuerInDB
+from models.badges import BadgeInDB
+from models.recipients import RecipientIn, RecipientInDB
+from models.invites import InviteInCreate, InviteInDB
+from models.issuance import IssuanceStatus, IssuanceResult, IssuanceReport
+from models.jobs import JobInDB
+
+
+# Job records keep per-recipient failures up to this many bytes of JSON, so
+# the job item stays well inside DynamoDB's 400 KB item limit. Longer error
+# messages are cut to MAX_ERROR_LENGTH characters first.
+MAX_JOB_ERROR_BYTES = 100 * 1024
+MAX_ERROR_LENGTH = 500
+
+
+def record_failures(job: JobInDB, failures: List[IssuanceResult]):
+    """Add failures to job.errors until they reach MAX_JOB_ERROR_BYTES."""
+    size = sum(len(error.json().encode()) for error in job.errors)
+    for failure in failures:
+        if failure.error and len(failure.error) > MAX_ERROR_LENGTH:
+            failure = failure.copy(update={"error": failure.error[:MAX_ERROR_LENGTH]})
+        size += len(failure.json().encode())
+        if size > MAX_JOB_ERROR_BYTES:
+            return
+        job.errors.append(failure)
+
+
+def unique_recipients(recipients: List[RecipientIn]):
+    """Drop repeated emails, keeping the first occurrence of each."""
+    seen = set()
+    unique = []
+    for recipient in recipients:
+        email = recipient.email.lower()
+        if email not in seen:
+            seen.add(email)
+            unique.append(recipient)
+    return unique
+
+
+def describe_error(error: Exception):
+    return str(error) or type(error).__name__
+
+
+class BulkIssuance:
+    """Issue one badge to many recipients in a few batched, concurrent stages.
+
+    1. Resolve every email to a recipient and batch-write the new ones.
+    2. Look up invites for recipients without an address for this issuer,
+       batch-write the missing ones and add the badge to the rest.
+    3. Issue certs and send invite emails concurrently.
+
+    Work is bounded by ISSUANCE_CONCURRENCY, and a failure only affects the
+    recipient it happened for. With a job_id, each recipient's cert id is
+    derived from the job, so running the same recipients again (a job
+    resumed partway through a chunk) doesn't issue their certs twice.
+    """
+
+    def __init__(
+        self,
+        issuer: IssuerInDB,
+        badge: BadgeInDB,
+        concurrency: int = ISSUANCE_CONCURRENCY,
+        job_id: str = None
+    ):
+        self.issuer = issuer
+        self.badge = badge
+        self.job_id = job_id
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.results = {}
+        self._template = None
+
+    @property
+    def template(self):
+        # Built on first issue so an issuer without an active key fails
+        # per recipient, like any other issuing error.
+        if self._template is None:
+            self._template = CertTemplate(self.issuer, self.badge)
+        return self._template
+
+    async def run(self, recipients: List[RecipientIn]) -> IssuanceReport:
+        recipients = unique_recipients(recipients)
+
+        resolved = await self.resolve_recipients(recipients)
+        enrolled = [r for r in resolved if self.issuer.id in r.addresses]
+        invitees = [r for r in resolved if self.issuer.id not in r.addresses]
+        invites = await self.prepare_invites(invitees)
+
+        if CERT_STORAGE_FORMAT == "packed":
+            work = await self.issue_packed(enrolled)
+        else:
+            work = [(recipient, self.issue(recipient)) for recipient in enrolled]
+        work += [
+            (recipient, self.invite(recipient, invites[recipient.id]))
+            for recipient in invitees if recipient.id in invites
+        ]
+        outcomes = await self.gather(coro for _, coro in work)
+        for (recipient, _), outcome in zip(work, outcomes):
+            if isinstance(outcome, Exception):
+                self.fail(recipient.email, outcome, recipient.id)
+            else:
+                self.succeed(recipient, outcome)
+
+        return self.report(recipients)
+
+    async def resolve_recipients(self, recipients: List[RecipientIn]):
+        found = await self.gather(
+            RecipientsDB().get_recipient_by_email(recipient.email) for recipient in recipients
+        )
+        resolved = []
+        new = []
+        for recipient, recipient_in_db in zip(recipients, found):
+            if isinstance(recipient_in_db, Exception):
+                self.fail(recipient.email, recipient_in_db)
+            elif recipient_in_db is None:
+                new.append(recipient)
+            else:
+                resolved.append(recipient_in_db)
+
+        if new:
+            try:
+                resolved.extend(await RecipientsDB().create_recipients(new))
+            except Exception as error:
+                for recipient in new:
+                    self.fail(recipient.email, error)
+        return resolved
+
+    async def prepare_invites(self, invitees: List[RecipientInDB]):
+        found = await self.gather(
+            InvitesDB().get_by_issuer_and_recipient_ids(self.issuer.id, recipient.id)
+            for recipient in invitees
+        )
+        invites = {}
+        missing = []
+        for recipient, invite in zip(invitees, found):
+            if isinstance(invite, Exception):
+                self.fail(recipient.email, invite, recipient.id)
+            elif invite is None:
+                missing.append(recipient)
+            else:
+                invites[recipient.id] = invite
+
+        if missing:
+            try:
+                created = await InvitesDB().create_many([
+                    InviteInCreate(issuer_id=self.issuer.id, recipient_id=recipient.id, badge_id=self.badge.id)
+                    for recipient in missing
+                ])
+            except Exception as error:
+                for recipient in missing:
+                    self.fail(recipient.email, error, recipient.id)
+            else:
+                invites.update((invite.recipient_id, invite) for invite in created)
+
+        stale = [invite for invite in invites.values() if self.badge.id not in invite.badges]
+        updated = await self.gather(InvitesDB().add_badge(invite.id, self.badge.id) for invite in stale)
+        recipients_by_id = {recipient.id: recipient for recipient in invitees}
+        for invite, outcome in zip(stale, updated):
+            if isinstance(outcome, Exception):
+                self.fail(recipients_by_id[invite.recipient_id].email, outcome, invite.recipient_id)
+                del invites[invite.recipient_id]
+        return invites
+
+    def cert_id(self, recipient: RecipientInDB):
+        if self.job_id is None:
+            return str(uuid.uuid4())
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f"urn:ubadges:job:{self.job_id}:{recipient.id}"))
+
+    async def issue(self, recipient: RecipientInDB):
+        await issue_cert(self.issuer, recipient, self.badge, self.template, self.cert_id(recipient))
+        return IssuanceStatus.ISSUED
+
+    async def issue_packed(self, recipients: List[RecipientInDB]):
+        """Write every recipient's cert into one pack and record the certs,
+        then return the work that bumps each recipient's cert count.
+
+        For a job the pack's name follows from its certs, so a re-run
+        replaces the pack, and only certs that weren't recorded yet are
+        counted.
+        """
+        if not recipients:
+            return []
+        date = today()
+        try:
+            certs = [(recipient, *self.template.render(recipient, self.cert_id(recipient))) for recipient in recipients]
+            records = [new_cert(self.issuer, self.badge, recipient, cert_id, date) for recipient, cert_id, _ in certs]
+            pack_id = None
+            recorded = set()
+            if self.job_id is not None:
+                cert_ids = ",".join(sorted(cert_id for _, cert_id, _ in certs))
+                pack_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f"urn:ubadges:pack:{cert_ids}"))
+                recorded = await CertsDB().get_recorded_cert_ids(records)
+            await upload_unsigned_pack(self.issuer.id, [(cert_id, body) for _, cert_id, body in certs], date, pack_id)
+            await CertsDB().create_certs(records)
+        except Exception as error:
+            for recipient in recipients:
+                self.fail(recipient.email, error, recipient.id)
+            return []
+        return [
+            (recipient, self.count_cert(recipient) if cert_id not in recorded else self.already_issued())
+            for recipient, cert_id, _ in certs
+        ]
+
+    async def count_cert(self, recipient: RecipientInDB):
+        await RecipientsDB().increment_cert_count(recipient.id)
+        return IssuanceStatus.ISSUED
+
+    async def already_issued(self):
+        return IssuanceStatus.ISSUED
+
+    async def invite(self, recipient: RecipientInDB, invite: InviteInDB):
+        await outbox.send(invite_email(recipient.email, self.issuer.id, invite.nonce))
+        return IssuanceStatus.INVITED
+
+    async def gather(self, coros):
+        async def bounded(coro):
+            async with self.semaphore:
+                return await coro
+        return await asyncio.gather(*map(bounded, coros), return_exceptions=True)
+
+    def succeed(self, recipient: RecipientInDB, status: IssuanceStatus):
+        self.results[recipient.email.lower()] = IssuanceResult(
+            email=recipient.email,
+            status=status,
+            recipient_id=recipient.id
+        )
+
+    def fail(self, email: str, error: Exception, recipient_id: str = None):
+        self.results[email.lower()] = IssuanceResult(
+            email=email,
+            status=IssuanceStatus.FAILED,
+            recipient_id=recipient_id,
+            error=describe_error(error)
+        )
+
+    def report(self, recipients: List[RecipientIn]):
+        results = [self.results[recipient.email.lower()] for recipient in recipients]
+        counts = {status: 0 for status in IssuanceStatus}
+        for result in results:
+            counts[result.status] += 1
+        return IssuanceReport(
+            issued=counts[IssuanceStatus.ISSUED],
+            invited=counts[IssuanceStatus.INVITED],
+            failed=counts[IssuanceStatus.FAILED],
+            results=results
+        )
+
+
+async def issue_badge(
+    issuer: IssuerInDB,
+    badge: BadgeInDB,
+    recipients: List[RecipientIn],
+    job_id: str = None
+) -> IssuanceReport:
+    return await BulkIssuance(issuer, badge, job_id=job_id).run(recipients)
+
+
+async def run_issuance_job(job: JobInDB, store: JobStore):
+    loaders = Loaders()
+    issuer, badge = await asyncio.gather(
+        loaders.issuers.load(job.params["issuer_id"]),
+        loaders.badges.load((job.params["badge_id"], job.params["issuer_id"]))
+    )
+    if issuer is None or badge is None:
+        raise LookupError("Issuer or badge no longer exists")
+
+    recipients = [RecipientIn(**recipient) for recipient in await store.load_payload(job.id)]
+    # job.processed is where a resumed job picks up again.
+    for start in range(job.processed, len(recipients), JOB_CHUNK_SIZE):
+        chunk = recipients[start:start + JOB_CHUNK_SIZE]
+        report = await issue_badge(issuer, badge, chunk, job.id)
+        job.processed = start + len(chunk)
+        job.issued += report.issued
+        job.invited += report.invited
+        job.failed += report.failed
+        failures = [result for result in report.results if result.status == IssuanceStatus.FAILED]
+        record_failures(job, failures)
+        await store.save(job)
+
+
+runner.register("issue_badge", run_issuance_job)
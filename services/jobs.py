@@ -0,0 +1,383 @@
+# Standard library
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime
+from decimal import Decimal
+from typing import Awaitable, Callable, Dict, List
+
+# Third party imports
+from boto3.dynamodb.conditions import Key, Attr
+from botocore.exceptions import ClientError
+
+# Package imports
+from core.config import JOB_WORKERS, JOB_DRAIN_TIMEOUT, JOB_STORE, JOB_LEASE_SECONDS
+from db.dynamodb import AsyncTable, is_condition_failure
+from db.hydrate import hydrate, hydrate_all
+from models.jobs import JobStatus, JobInDB
+
+
+logger = logging.getLogger(__name__)
+
+UNFINISHED = (JobStatus.QUEUED, JobStatus.RUNNING)
+
+# Identifies this process's claims on jobs.
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class LeaseLost(Exception):
+    """The job's claim lapsed and another worker may have taken it over."""
+
+
+def claimable(job: JobInDB, now: int):
+    return job.status in UNFINISHED and job.lease_expires < now
+
+
+def new_job(kind: str, created_by: str, params: dict, total: int = 0):
+    now = datetime.utcnow()
+    return JobInDB(
+        id=str(uuid.uuid4()),
+        kind=kind,
+        status=JobStatus.QUEUED,
+        created_by=created_by,
+        params=params,
+        total=total,
+        created_at=now,
+        updated_at=now
+    )
+
+
+class JobStore(ABC):
+    """Where job records and their input payloads are kept.
+
+    A worker runs a job only after claim() gives it a lease, and renew()
+    extends the lease while it runs. Once a job has an owner, save() fails
+    with LeaseLost if the lease has passed to someone else, so a worker that
+    stalled past its lease can't overwrite the new owner's progress.
+    """
+
+    @abstractmethod
+    async def create(self, job: JobInDB, payload: list):
+        ...
+
+    @abstractmethod
+    async def get(self, job_id: str) -> JobInDB:
+        ...
+
+    @abstractmethod
+    async def save(self, job: JobInDB):
+        ...
+
+    @abstractmethod
+    async def load_payload(self, job_id: str) -> list:
+        ...
+
+    @abstractmethod
+    async def get_unfinished(self) -> List[JobInDB]:
+        ...
+
+    @abstractmethod
+    async def claim(self, job_id: str, owner: str, lease_expires: int) -> JobInDB:
+        """Mark the job RUNNING under `owner`; None if it's finished or
+        another worker's lease on it hasn't expired."""
+
+    @abstractmethod
+    async def renew(self, job: JobInDB, lease_expires: int):
+        """Extend the lease on a claimed job, raising LeaseLost if it's gone."""
+
+
+class MemoryJobStore(JobStore):
+
+    def __init__(self):
+        self.jobs = {}
+        self.payloads = {}
+
+    async def create(self, job: JobInDB, payload: list):
+        self.jobs[job.id] = job.copy(deep=True)
+        self.payloads[job.id] = list(payload)
+
+    async def get(self, job_id: str):
+        job = self.jobs.get(job_id)
+        return job.copy(deep=True) if job else None
+
+    async def save(self, job: JobInDB):
+        if job.owner and self.jobs[job.id].owner != job.owner:
+            raise LeaseLost(job.id)
+        job.updated_at = datetime.utcnow()
+        self.jobs[job.id] = job.copy(deep=True)
+
+    async def load_payload(self, job_id: str):
+        return list(self.payloads[job_id])
+
+    async def get_unfinished(self):
+        return [job.copy(deep=True) for job in self.jobs.values() if job.status in UNFINISHED]
+
+    async def claim(self, job_id: str, owner: str, lease_expires: int):
+        job = self.jobs.get(job_id)
+        if job is None or not claimable(job, int(time.time())):
+            return None
+        job.status = JobStatus.RUNNING
+        job.owner = owner
+        job.lease_expires = lease_expires
+        job.updated_at = datetime.utcnow()
+        return job.copy(deep=True)
+
+    async def renew(self, job: JobInDB, lease_expires: int):
+        stored = self.jobs[job.id]
+        if stored.owner != job.owner:
+            raise LeaseLost(job.id)
+        stored.lease_expires = job.lease_expires = lease_expires
+
+
+class DynamoJobStore(JobStore):
+    """Jobs in the ubadges.jobs table.
+
+    The payload (a recipient list can be far bigger than DynamoDB's 400 KB
+    item limit) is split across extra items keyed "{job_id}#payload#{n}".
+    Those items have no status, so they stay out of status-index.
+    """
+
+    table = AsyncTable("ubadges.jobs")
+    payload_chunk_size = 500
+
+    async def create(self, job: JobInDB, payload: list):
+        chunks = [
+            {
+                "id": f"{job.id}#payload#{n}",
+                "items": payload[start:start + self.payload_chunk_size]
+            }
+            for n, start in enumerate(range(0, len(payload), self.payload_chunk_size))
+        ]
+        job.params["payload_chunks"] = len(chunks)
+        await self.table.batch_put(chunks)
+        await self.save(job)
+
+    async def get(self, job_id: str):
+        result = await self.table.get_item(Key={"id": job_id})
+        job = result.get("Item")
+        if job and "status" in job:
+            return hydrate(JobInDB, job)
+        return None
+
+    async def save(self, job: JobInDB):
+        job.updated_at = datetime.utcnow()
+        # Round-trip through JSON so enums and datetimes are stored as strings.
+        # Numbers read back from DynamoDB are Decimals, which pydantic encodes
+        # as floats; boto3 rejects floats, so parse them back as Decimals.
+        item = json.loads(job.json(), parse_float=Decimal)
+        if not job.owner:
+            await self.table.put_item(Item=item)
+            return
+        try:
+            await self.table.put_item(Item=item, ConditionExpression=Attr("owner").eq(job.owner))
+        except ClientError as error:
+            if not is_condition_failure(error):
+                raise
+            raise LeaseLost(job.id)
+
+    async def load_payload(self, job_id: str):
+        job = await self.get(job_id)
+        payload = []
+        for n in range(int(job.params.get("payload_chunks", 0))):
+            result = await self.table.get_item(Key={"id": f"{job_id}#payload#{n}"})
+            payload.extend(result["Item"]["items"])
+        return payload
+
+    async def get_unfinished(self):
+        jobs = []
+        for status in UNFINISHED:
+            jobs.extend(await self.table.query_all(
+                IndexName="status-index",
+                KeyConditionExpression=Key("status").eq(status)
+            ))
+        return hydrate_all(JobInDB, jobs)
+
+    async def claim(self, job_id: str, owner: str, lease_expires: int):
+        try:
+            result = await self.table.update_item(
+                Key={"id": job_id},
+                UpdateExpression="SET #status = :running, #owner = :owner, lease_expires = :lease, updated_at = :now",
+                ConditionExpression=Attr("status").is_in([status.value for status in UNFINISHED]) & (
+                    Attr("lease_expires").not_exists() | Attr("lease_expires").lt(int(time.time()))
+                ),
+                ExpressionAttributeNames={
+                    "#status": "status",
+                    "#owner": "owner"
+                },
+                ExpressionAttributeValues={
+                    ":running": JobStatus.RUNNING.value,
+                    ":owner": owner,
+                    ":lease": lease_expires,
+                    ":now": datetime.utcnow().isoformat()
+                },
+                ReturnValues="ALL_NEW"
+            )
+        except ClientError as error:
+            if not is_condition_failure(error):
+                raise
+            return None
+        return hydrate(JobInDB, result["Attributes"])
+
+    async def renew(self, job: JobInDB, lease_expires: int):
+        try:
+            await self.table.update_item(
+                Key={"id": job.id},
+                UpdateExpression="SET lease_expires = :lease",
+                ConditionExpression=Attr("owner").eq(job.owner),
+                ExpressionAttributeValues={":lease": lease_expires}
+            )
+        except ClientError as error:
+            if not is_condition_failure(error):
+                raise
+            raise LeaseLost(job.id)
+        job.lease_expires = lease_expires
+
+
+JobHandler = Callable[[JobInDB, JobStore], Awaitable[None]]
+
+
+class JobRunner:
+    """In-process queue of jobs worked by a fixed pool of asyncio tasks.
+
+    Handlers update and save the job as they make progress, so a job
+    interrupted by shutdown or a crash is left QUEUED or RUNNING with its
+    progress recorded. Every worker process sharing the store looks for such
+    jobs at start() and again every lease period, and runs one only once it
+    has claimed it, so a job is never run by two workers at once. A job
+    whose worker died is taken over when its lease expires.
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        workers: int = JOB_WORKERS,
+        owner: str = WORKER_ID,
+        lease: int = JOB_LEASE_SECONDS
+    ):
+        self.store = store
+        self.workers = workers
+        self.owner = owner
+        self.lease = lease
+        self.handlers: Dict[str, JobHandler] = {}
+        self.queue = None
+        self.tasks = []
+        # Ids queued or running here, so a job is never queued twice.
+        self.pending = set()
+
+    def register(self, kind: str, handler: JobHandler):
+        self.handlers[kind] = handler
+
+    async def submit(self, job: JobInDB, payload: list = ()):
+        await self.store.create(job, list(payload))
+        self.enqueue(job.id)
+        return job
+
+    def enqueue(self, job_id: str):
+        if job_id not in self.pending:
+            self.pending.add(job_id)
+            self.queue.put_nowait(job_id)
+
+    async def start(self):
+        self.queue = asyncio.Queue()
+        self.pending = set()
+        await self.resume()
+        self.tasks = [asyncio.ensure_future(self.work()) for _ in range(self.workers)]
+        self.tasks.append(asyncio.ensure_future(self.watch()))
+
+    async def resume(self):
+        now = int(time.time())
+        for job in await self.store.get_unfinished():
+            if claimable(job, now) and job.id not in self.pending:
+                logger.info("Resuming job %s (%s)", job.id, job.status.value)
+                self.enqueue(job.id)
+
+    async def watch(self):
+        while True:
+            await asyncio.sleep(self.lease)
+            try:
+                await self.resume()
+            except Exception:
+                logger.exception("Could not look for unfinished jobs")
+
+    async def stop(self, timeout: float = JOB_DRAIN_TIMEOUT):
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Stopping with %d job(s) unfinished", self.queue.qsize())
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    async def work(self):
+        while True:
+            job_id = await self.queue.get()
+            try:
+                await self.run(job_id)
+            except LeaseLost:
+                logger.warning("Lost the lease on job %s; another worker has it", job_id)
+            except Exception:
+                logger.exception("Job %s could not be run", job_id)
+            finally:
+                self.pending.discard(job_id)
+                self.queue.task_done()
+
+    def lease_deadline(self):
+        return int(time.time()) + self.lease
+
+    async def run(self, job_id: str):
+        job = await self.store.claim(job_id, self.owner, self.lease_deadline())
+        if job is None:
+            return
+
+        handler = asyncio.ensure_future(self.handlers[job.kind](job, self.store))
+        heartbeat = asyncio.ensure_future(self.heartbeat(job))
+        try:
+            await asyncio.wait({handler, heartbeat}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            heartbeat.cancel()
+            if not handler.done():
+                # Shutting down, or the lease was lost: stop where it is.
+                handler.cancel()
+            await asyncio.gather(handler, heartbeat, return_exceptions=True)
+
+        if handler.cancelled():
+            raise LeaseLost(job.id)
+        error = handler.exception()
+        if isinstance(error, LeaseLost):
+            raise error
+        if error is not None:
+            logger.error("Job %s failed", job.id, exc_info=error)
+            job.status = JobStatus.FAILED
+            job.error = str(error) or type(error).__name__
+        else:
+            job.status = JobStatus.COMPLETED
+        await self.store.save(job)
+
+    async def heartbeat(self, job: JobInDB):
+        """Renew the job's lease until cancelled; returns if the lease is lost."""
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            try:
+                await self.store.renew(job, self.lease_deadline())
+            except LeaseLost:
+                return
+            except Exception:
+                # Try again next beat; the lease outlasts a couple of misses.
+                logger.exception("Could not renew the lease on job %s", job.id)
+
+
+def get_store(name: str = JOB_STORE) -> JobStore:
+    stores = {
+        "dynamodb": DynamoJobStore,
+        "memory": MemoryJobStore
+    }
+    return stores[name]()
+
+
+runner = JobRunner(get_store())
@@ -1,32 +1,131 @@
+"""Access token signing and verification.
+
+Usage: python -m services.jwt check
+
+`check` signs and verifies a token with a throwaway ES256 key pair, which
+fails if the asymmetric algorithms' dependency (cryptography) is missing.
+"""
 # Standard library imports
+import argparse
+import hashlib
+import sys
+import time
 from datetime import datetime, timedelta
 
 # Third party imports
 import jwt
+from jwt.algorithms import get_default_algorithms
 from pydantic import BaseModel
 
 # Package imports
-from core.config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
+from core.cache import TTLCache
+from core.config import (
+    SECRET_KEY,
+    ALGORITHM,
+    ACCESS_TOKEN_EXPIRE_MINUTES,
+    TOKEN_CACHE_SIZE,
+    JWT_PRIVATE_KEY_FILE,
+    JWT_PUBLIC_KEY_FILE
+)
 from models.jwt import JWTPayload
 from models.tokens import TokenData
 
 
+# The asymmetric algorithms PyJWT offers when cryptography is installed.
+ASYMMETRIC_ALGORITHM_PREFIXES = ("RS", "PS", "ES")
+
+
+def read_key(path: str):
+    if not path:
+        return None
+    with open(path) as key_file:
+        return key_file.read()
+
+
+# Fail at startup, not at the first login, when the algorithm can't be used.
+if ALGORITHM not in get_default_algorithms():
+    raise RuntimeError(f"JWT algorithm {ALGORITHM} isn't available (asymmetric ones need cryptography)")
+
+# Keys are resolved once instead of on every encode/decode.
+if ALGORITHM.startswith(ASYMMETRIC_ALGORITHM_PREFIXES):
+    # Every node verifies tokens, so the public key is required. The private
+    # key is only needed where tokens are issued.
+    if not JWT_PUBLIC_KEY_FILE:
+        raise RuntimeError(f"JWT_PUBLIC_KEY_FILE must be set for {ALGORITHM}")
+    SIGNING_KEY = read_key(JWT_PRIVATE_KEY_FILE)
+    VERIFYING_KEY = read_key(JWT_PUBLIC_KEY_FILE)
+else:
+    SIGNING_KEY = VERIFYING_KEY = str(SECRET_KEY)
+
+# Digest of an already verified token -> (TokenData, exp timestamp).
+token_cache = TTLCache(TOKEN_CACHE_SIZE, ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+
+
 def create_access_token(*, payload: JWTPayload, expires_delta: timedelta = None):
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES) 
     payload.exp = expire
-    encoded_jwt = jwt.encode(payload.dict(), str(SECRET_KEY), algorithm=ALGORITHM)
+    if SIGNING_KEY is None:
+        raise RuntimeError(f"JWT_PRIVATE_KEY_FILE must be set to issue {ALGORITHM} tokens")
+    encoded_jwt = jwt.encode(payload.dict(), SIGNING_KEY, algorithm=ALGORITHM)
     return encoded_jwt
     
 
 def decode_access_token(token: str):
+    digest = hashlib.sha256(token.encode()).digest()
+    cached = token_cache.get(digest)
+    if cached is not None:
+        token_data, expires_at = cached
+        # The cache entry's TTL is monotonic-clock based; check the token's own
+        # exp as well so a cached token is never accepted past its expiry.
+        if expires_at > time.time():
+            return token_data
+        token_cache.invalidate(digest)
+
     try:
-        payload = jwt.decode(token, str(SECRET_KEY), algorithms=[ALGORITHM])
+        payload = jwt.decode(token, VERIFYING_KEY, algorithms=[ALGORITHM])
         username = payload.get("sub")
         if username is None:
             raise jwt.PyJWTError
     except:
         raise jwt.PyJWTError
-    return TokenData(username=username)
\ No newline at end of file
+
+    token_data = TokenData(username=username)
+    expires_at = payload.get("exp")
+    if expires_at is not None:
+        token_cache.set(digest, (token_data, expires_at), ttl=expires_at - time.time())
+    return token_data
+
+
+def check_es256_round_trip():
+    """Sign and verify a token with a throwaway ES256 key; 0 if it works."""
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+
+    private_key = ec.generate_private_key(ec.SECP256R1(), default_backend())
+    private_pem = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption()
+    )
+    public_pem = private_key.public_key().public_bytes(
+        serialization.Encoding.PEM,
+        serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    token = jwt.encode({"sub": "check"}, private_pem, algorithm="ES256")
+    payload = jwt.decode(token, public_pem, algorithms=["ES256"])
+    if payload != {"sub": "check"}:
+        print(f"ES256 round trip returned {payload}")
+        return 1
+    print("ES256 round trip ok")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=("check",))
+    parser.parse_args()
+    sys.exit(check_es256_round_trip())
@@ -0,0 +1,43 @@
+# Standard library imports
+import hashlib
+from typing import List
+
+
+def sha256(data: bytes):
+    return hashlib.sha256(data).digest()
+
+
+class MerkleTree:
+    """Merkle tree over 32-byte leaf hashes, built one level at a time.
+
+    Follows the Chainpoint layout Blockcerts verifiers expect: a parent is
+    sha256(left + right) and an unpaired node moves up a level unchanged.
+    Only the hashes are kept, about 64 bytes per leaf for the whole tree.
+    """
+
+    def __init__(self, leaves: List[bytes]):
+        if not leaves:
+            raise ValueError("A Merkle tree needs at least one leaf")
+        self.levels = [leaves]
+        level = leaves
+        while len(level) > 1:
+            parents = [sha256(level[i] + level[i + 1]) for i in range(0, len(level) - 1, 2)]
+            if len(level) % 2:
+                parents.append(level[-1])
+            self.levels.append(parents)
+            level = parents
+
+    @property
+    def root(self):
+        return self.levels[-1][0]
+
+    def proof(self, index: int):
+        """Sibling hashes from leaf `index` up to the root, in MerkleProof2017 form."""
+        proof = []
+        for level in self.levels[:-1]:
+            sibling = index ^ 1
+            if sibling < len(level):
+                side = "left" if index % 2 else "right"
+                proof.append({side: level[sibling].hex()})
+            index //= 2
+        return proof
@@ -0,0 +1,237 @@
+"""Packed cert storage: many certs in one JSONL object plus an offset index.
+
+A pack named NAME is two objects:
+
+    NAME.jsonl (or NAME.jsonl.gz)   one cert per line
+    NAME.index.json                 where each cert's line is
+
+With gzip, the data is a series of independent gzip members of up to
+PACK_GZIP_CHUNK_SIZE certs each, which is still one valid .gz file. Index
+entries are [start, length] of the line, or for gzip [start, length] of
+the member plus [start, length] of the line once it's decompressed. The
+index is written last, so a pack without one is incomplete and ignored.
+
+A versioned pack's data goes to NAME.VERSION.jsonl(.gz) instead, so that
+replacing the pack never changes bytes an older index points at.
+"""
+# Standard library imports
+import asyncio
+import gzip
+import json
+from typing import List, Tuple
+
+# Package imports
+from core.cache import TTLCache
+from core.config import PACK_GZIP_CHUNK_SIZE, PACK_PART_SIZE, PACK_READ_SIZE
+
+
+INDEX_SUFFIX = ".index.json"
+
+# Signed packs only change when a batch is force re-signed, which writes
+# versioned data and drops the index here. Other workers may serve the old
+# index until it expires, which still reads the old version consistently.
+index_cache = TTLCache(maxsize=64, ttl=300)
+
+
+class PackWriter:
+    """Builds a pack's data and index.
+
+    Data accumulates until take() hands it over, so a writer can be
+    drained part by part (see PackUpload) or all at once by finish().
+    """
+
+    def __init__(self, name: str, chunk_size: int = PACK_GZIP_CHUNK_SIZE, version: str = None):
+        self.name = name
+        self.chunk_size = chunk_size
+        self.version = version
+        self.data = bytearray()
+        # Bytes already taken, which come before data.
+        self.taken = 0
+        self.certs = {}
+        self.chunk = bytearray()
+        self.chunk_ids = []
+
+    @property
+    def data_key(self):
+        base = f"{self.name}.{self.version}" if self.version else self.name
+        return f"{base}.jsonl.gz" if self.chunk_size > 0 else f"{base}.jsonl"
+
+    @property
+    def index_key(self):
+        return f"{self.name}{INDEX_SUFFIX}"
+
+    def __len__(self):
+        return len(self.certs) + len(self.chunk_ids)
+
+    def add(self, cert_id: str, body: bytes):
+        line = body + b"\n"
+        if self.chunk_size <= 0:
+            self.certs[cert_id] = [self.taken + len(self.data), len(line)]
+            self.data += line
+            return
+        self.chunk_ids.append((cert_id, len(self.chunk), len(line)))
+        self.chunk += line
+        if len(self.chunk_ids) >= self.chunk_size:
+            self.flush_chunk()
+
+    def flush_chunk(self):
+        if not self.chunk_ids:
+            return
+        member = gzip.compress(bytes(self.chunk))
+        for cert_id, line_start, line_length in self.chunk_ids:
+            self.certs[cert_id] = [self.taken + len(self.data), len(member), line_start, line_length]
+        self.data += member
+        self.chunk = bytearray()
+        self.chunk_ids = []
+
+    def take(self) -> bytearray:
+        """The data added since the last take."""
+        data, self.data = self.data, bytearray()
+        self.taken += len(data)
+        return data
+
+    def finish(self) -> Tuple[bytearray, bytes]:
+        """The rest of the data, and the index."""
+        self.flush_chunk()
+        data = self.take()
+        index = {
+            "version": 1,
+            "data": self.data_key,
+            "compression": "gzip" if self.chunk_size > 0 else None,
+            "count": len(self.certs),
+            "certs": self.certs
+        }
+        return data, json.dumps(index, separators=(",", ":")).encode()
+
+
+async def write_pack(uploader, writer: PackWriter, public: bool = False):
+    data, index = writer.finish()
+    await uploader.upload(writer.data_key, data, public=public)
+    await uploader.upload(writer.index_key, index, public=public)
+    index_cache.invalidate(writer.index_key)
+
+
+class PackUpload:
+    """Streams a pack's data to storage as a multipart upload.
+
+    A part goes up each time part_size bytes have been added, so memory
+    holds about one part rather than the whole pack. finish() completes the
+    upload and writes the index; abort() discards the parts instead.
+    """
+
+    def __init__(self, uploader, writer: PackWriter, public: bool = False, part_size: int = PACK_PART_SIZE):
+        self.uploader = uploader
+        self.writer = writer
+        self.public = public
+        self.part_size = part_size
+        self.upload_id = None
+        self.etags = []
+
+    async def add(self, cert_id: str, body: bytes):
+        self.writer.add(cert_id, body)
+        if len(self.writer.data) >= self.part_size:
+            await self.put_part(self.writer.take())
+
+    async def put_part(self, data: bytes):
+        storage, key = self.uploader.storage, self.writer.data_key
+        if self.upload_id is None:
+            self.upload_id = await self.uploader.retry(storage.start_upload, key, public=self.public)
+        number = len(self.etags) + 1
+        self.etags.append(await self.uploader.retry(storage.put_part, key, self.upload_id, number, data))
+
+    async def finish(self):
+        data, index = self.writer.finish()
+        # The last part may be smaller than the minimum.
+        if data or not self.etags:
+            await self.put_part(data)
+        storage = self.uploader.storage
+        await self.uploader.retry(storage.complete_upload, self.writer.data_key, self.upload_id, self.etags)
+        await self.uploader.upload(self.writer.index_key, index, public=self.public)
+        index_cache.invalidate(self.writer.index_key)
+
+    async def abort(self):
+        if self.upload_id is not None:
+            await self.uploader.retry(self.uploader.storage.abort_upload, self.writer.data_key, self.upload_id)
+
+
+async def read_index(storage, index_key: str):
+    return json.loads(await storage.get(index_key))
+
+
+async def get_index(storage, index_key: str):
+    """read_index, cached; None if there's no such pack."""
+    index = index_cache.get(index_key)
+    if index is None:
+        if not await storage.exists(index_key):
+            return None
+        index = await read_index(storage, index_key)
+        index_cache.set(index_key, index)
+    return index
+
+
+async def read_cert(storage, index: dict, cert_id: str):
+    """One cert's JSON by byte-range read, or None if it isn't in the pack."""
+    entry = index["certs"].get(cert_id)
+    if entry is None:
+        return None
+    data = await storage.get_range(index["data"], entry[0], entry[1])
+    if index["compression"] == "gzip":
+        data = gzip.decompress(data)[entry[2]:entry[2] + entry[3]]
+    return data.rstrip(b"\n")
+
+
+def read_ranges(index: dict, read_size: int):
+    """Split the data into [start, end) ranges of about read_size bytes.
+
+    Ranges only break between lines, or between gzip members. Each comes
+    with the (cert_id, entry) pairs it holds.
+    """
+    ranges = []
+    start = end = None
+    certs = []
+    # The index is in write order, which is data order.
+    for cert_id, entry in index["certs"].items():
+        # Certs in the same gzip member share its start.
+        if start is not None and entry[0] >= end and end - start >= read_size:
+            ranges.append((start, end, certs))
+            start, certs = None, []
+        if start is None:
+            start = entry[0]
+        end = entry[0] + entry[1]
+        certs.append((cert_id, entry))
+    if certs:
+        ranges.append((start, end, certs))
+    return ranges
+
+
+async def iter_pack(storage, index: dict, read_size: int = PACK_READ_SIZE):
+    """Yield (cert_id, body) for every cert, reading the data range by range.
+
+    Gzip members are decompressed one at a time, and the next range is
+    fetched while the current one is being consumed.
+    """
+    def fetch(byte_range):
+        start, end, _ = byte_range
+        return asyncio.ensure_future(storage.get_range(index["data"], start, end - start))
+
+    ranges = read_ranges(index, read_size)
+    ahead = fetch(ranges[0]) if ranges else None
+    try:
+        for number, (start, _, certs) in enumerate(ranges):
+            data = await ahead
+            ahead = fetch(ranges[number + 1]) if number + 1 < len(ranges) else None
+            member_start, member = None, None
+            for cert_id, entry in certs:
+                block = data[entry[0] - start:entry[0] - start + entry[1]]
+                if index["compression"] == "gzip":
+                    if entry[0] != member_start:
+                        member_start, member = entry[0], gzip.decompress(block)
+                    block = member[entry[2]:entry[2] + entry[3]]
+                yield cert_id, block.rstrip(b"\n")
+    finally:
+        if ahead is not None:
+            ahead.cancel()
+
+
+async def list_packs(storage, prefix: str) -> List[str]:
+    return [key async for key in storage.list(prefix) if key.endswith(INDEX_SUFFIX)]
@@ -0,0 +1,119 @@
+# Standard library imports
+import asyncio
+import json
+from typing import List, Optional
+
+# Package imports
+from core.cache import SingleFlight, TTLCache
+from core.config import API_URL, REVOCATION_INDEX_SIZE, REVOCATION_INDEX_TTL
+from db.issuers import IssuersDB
+from db.revocations import RevocationsDB
+from models.revocations import RevocationIn, RevocationInDB
+from services.documents import Document
+
+
+CERT_ID_PREFIX = "urn:uuid:"
+
+
+def normalize_cert_id(cert_id: str):
+    """Certs are revoked by bare id; accept the urn:uuid: form assertions use too."""
+    if cert_id.startswith(CERT_ID_PREFIX):
+        return cert_id[len(CERT_ID_PREFIX):]
+    return cert_id
+
+
+def revoked_assertion(revocation: RevocationInDB):
+    assertion = {"id": f"{CERT_ID_PREFIX}{revocation.cert_id}"}
+    if revocation.reason:
+        assertion["revocationReason"] = revocation.reason
+    return assertion
+
+
+class IssuerRevocations:
+    """One issuer's revoked cert ids plus its published RevocationList.
+
+    Each revoked assertion is serialized once when it's added, so publishing
+    after a change only joins the existing fragments back together.
+    """
+
+    def __init__(self, issuer_id: str, revocations: List[RevocationInDB]):
+        self.issuer_id = issuer_id
+        self.revoked = set()
+        self.fragments = []
+        self.document = None
+        self.add(revocations)
+
+    def add(self, revocations: List[RevocationInDB]):
+        for revocation in revocations:
+            if revocation.cert_id not in self.revoked:
+                self.revoked.add(revocation.cert_id)
+                self.fragments.append(json.dumps(revoked_assertion(revocation), separators=(",", ":")))
+                self.document = None
+
+    def get_document(self):
+        if self.document is None:
+            header = json.dumps({
+                "@context": "https://w3id.org/openbadges/v2",
+                "id": f"{API_URL}/issuers/{self.issuer_id}/revocations",
+                "type": "RevocationList",
+                "issuer": f"{API_URL}/issuers/{self.issuer_id}/profile"
+            }, separators=(",", ":"))
+            body = header[:-1] + ',"revokedAssertions":[' + ",".join(self.fragments) + "]}"
+            self.document = Document.from_body(body.encode())
+        return self.document
+
+
+class RevocationIndex:
+    """In-memory revocation lists, loaded once per issuer and kept up to date
+    by the revocations made through this process.
+
+    The REVOCATION_INDEX_SIZE most recently used lists are kept, and each
+    is reloaded after REVOCATION_INDEX_TTL seconds to pick up revocations
+    made by other workers. Issuers that don't exist aren't kept.
+    """
+
+    def __init__(self, maxsize: int = REVOCATION_INDEX_SIZE, ttl: float = REVOCATION_INDEX_TTL):
+        self.issuers = TTLCache(maxsize, ttl)
+        self.single_flight = SingleFlight()
+
+    async def get(self, issuer_id: str) -> Optional[IssuerRevocations]:
+        """The issuer's revocations, or None if there's no such issuer."""
+        entry = self.issuers.get(issuer_id)
+        if entry is not None:
+            return entry
+        return await self.single_flight.do(issuer_id, lambda: self.load(issuer_id))
+
+    async def load(self, issuer_id: str):
+        issuer, revocations = await asyncio.gather(
+            IssuersDB().get_public_issuer(issuer_id),
+            RevocationsDB().get_revocations_by_issuer_id(issuer_id)
+        )
+        if issuer is None:
+            return None
+        entry = IssuerRevocations(issuer_id, revocations)
+        self.issuers.set(issuer_id, entry)
+        return entry
+
+    async def is_revoked(self, issuer_id: str, cert_id: str):
+        entry = await self.get(issuer_id)
+        return entry is not None and normalize_cert_id(cert_id) in entry.revoked
+
+    async def revoke(self, issuer_id: str, revocations: List[RevocationIn]):
+        """Store the revocations that are new and return them.
+
+        The caller checks that the issuer exists.
+        """
+        entry = await self.get(issuer_id)
+        new = {}
+        for revocation in revocations:
+            cert_id = normalize_cert_id(revocation.cert_id)
+            if cert_id not in entry.revoked and cert_id not in new:
+                new[cert_id] = RevocationIn(cert_id=cert_id, reason=revocation.reason)
+        if not new:
+            return []
+        created = await RevocationsDB().create_revocations(issuer_id, list(new.values()))
+        entry.add(created)
+        return created
+
+
+revocation_index = RevocationIndex()
@@ -1,11 +1,77 @@
+# Standard library imports
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# Third party library imports
 from passlib.context import CryptContext
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Package imports
+from core.config import BCRYPT_ROUNDS, PASSWORD_HASH_POOL, PASSWORD_HASH_WORKERS
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
 
+def verify_and_update_password(plain_password, hashed_password):
+    """Verify, and return a fresh hash too if the stored one uses an outdated scheme or cost."""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
 def get_password_hash(password):
     return pwd_context.hash(password)
+
+
+class PasswordHasher:
+    """Runs bcrypt in a bounded pool so a burst of logins can't stall the loop.
+
+    Each bcrypt call takes a few hundred milliseconds of CPU at cost 12.
+    The pool caps how many run at once, and the rest wait their turn.
+    """
+
+    def __init__(self, pool: str = PASSWORD_HASH_POOL, workers: int = PASSWORD_HASH_WORKERS):
+        self.pool = pool
+        self.workers = workers
+        self.executor = None
+        self.pending = 0
+
+    @property
+    def queue_depth(self):
+        """Calls waiting for a free worker."""
+        return max(0, self.pending - self.workers)
+
+    def get_executor(self):
+        # Created on first use so importing this module never forks.
+        if self.executor is None:
+            if self.pool == "process":
+                self.executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self.executor
+
+    async def run(self, func, *args):
+        self.pending += 1
+        try:
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(self.get_executor(), func, *args)
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password):
+        return await self.run(get_password_hash, password)
+
+    async def verify(self, plain_password, hashed_password):
+        return await self.run(verify_password, plain_password, hashed_password)
+
+    async def verify_and_update(self, plain_password, hashed_password):
+        return await self.run(verify_and_update_password, plain_password, hashed_password)
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+
+hasher = PasswordHasher()
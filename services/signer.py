@@ -0,0 +1,238 @@
+"""Sign a day's batch of unsigned certs for an issuer.
+
+Usage: python -m services.signer ISSUER_ID [--date YYYYMMDD] [--force]
+"""
+# Standard library imports
+import argparse
+import asyncio
+import datetime
+import hashlib
+import json
+import uuid
+from typing import List
+
+# Third party imports
+import pytz
+
+# Package imports
+from core.config import SIGNING_CONCURRENCY, ANCHOR_BACKEND, CERT_STORAGE_FORMAT
+from services.canonical import cert_hasher
+from services.cert import batch_prefix, signed_cert_path, today
+from services.packs import PackUpload, PackWriter, read_index, iter_pack, list_packs
+from services.merkle import MerkleTree
+from services.storage import storage as default_storage
+from services.uploader import Uploader
+from services.jobs import JobStore, runner
+from models.jobs import JobInDB
+
+
+# Certs held in memory at once while hashing or signing.
+WINDOW = 1024
+
+
+class SigningError(Exception):
+
+    def __init__(self, message: str, failed: dict):
+        super().__init__(message)
+        self.failed = failed
+
+
+def cert_id_from_key(key: str):
+    return key.rsplit("/", 1)[-1][:-len(".json")]
+
+
+class LocalAnchor:
+    """Stand-in for a blockchain transaction, for development and tests.
+
+    The "transaction id" is derived from the root so re-running is stable.
+    """
+
+    async def anchor(self, merkle_root: bytes):
+        return [{
+            "sourceId": hashlib.sha256(b"anchor:" + merkle_root).hexdigest(),
+            "type": "BTCOpReturn",
+            "chain": "mockchain"
+        }]
+
+
+def get_anchor(name: str = ANCHOR_BACKEND):
+    anchors = {
+        "local": LocalAnchor
+    }
+    return anchors[name]()
+
+
+def signature(tree: MerkleTree, index: int, anchors: List[dict]):
+    return {
+        "type": ["MerkleProof2017", "Extension"],
+        "merkleRoot": tree.root.hex(),
+        "targetHash": tree.levels[0][index].hex(),
+        "proof": tree.proof(index),
+        "anchors": anchors
+    }
+
+
+class BatchSigner:
+    """Merkle-sign every unsigned cert under batch/{date}/{issuer_id}/unsigned/.
+
+    Certs are read twice, once to hash and once to sign, WINDOW at a time,
+    so memory holds their ids and hashes rather than the certs themselves.
+    Unsigned certs may be loose objects, packs, or both. Signed certs are
+    written through the uploader as one object each or, when packed, into
+    a single signed pack streamed up as a multipart upload. A merkle.json
+    manifest marks the batch as signed.
+    """
+
+    def __init__(
+        self,
+        storage=None,
+        anchor=None,
+        hasher=None,
+        uploader=None,
+        concurrency: int = SIGNING_CONCURRENCY,
+        packed: bool = CERT_STORAGE_FORMAT == "packed",
+        on_progress=None
+    ):
+        self.packed = packed
+        self.storage = storage or default_storage
+        self.uploader = uploader or Uploader(self.storage)
+        self.anchor = anchor or get_anchor()
+        self.hasher = hasher or cert_hasher
+        self.concurrency = concurrency
+        self.on_progress = on_progress
+
+    async def sign(self, issuer_id: str, date: str, force: bool = False):
+        prefix = batch_prefix(date, issuer_id)
+        manifest_key = f"{prefix}merkle.json"
+        if not force and await self.storage.exists(manifest_key):
+            return json.loads(await self.storage.get(manifest_key))
+
+        cert_ids = []
+        hashes = []
+        async for window in self.windows(prefix):
+            cert_ids.extend(cert_id for cert_id, _ in window)
+            hashes.extend(await self.hasher.hash_many([json.loads(body) for _, body in window]))
+        if not cert_ids:
+            return None
+        tree = MerkleTree(hashes)
+        anchors = await self.anchor.anchor(tree.root)
+
+        pack = None
+        if self.packed:
+            # Versioned, so readers holding the previous index keep reading
+            # the previous data while a forced re-sign replaces it.
+            writer = PackWriter(f"{prefix}signed", version=uuid.uuid4().hex[:12])
+            pack = PackUpload(self.uploader, writer, public=True)
+        try:
+            failed = await self.write_signed(prefix, cert_ids, tree, anchors, pack)
+            if failed:
+                # No manifest, so signing the batch again retries every cert.
+                raise SigningError(f"{len(failed)} of {len(cert_ids)} signed certs failed to upload", failed)
+            if pack is not None:
+                await pack.finish()
+        except Exception:
+            if pack is not None:
+                await pack.abort()
+            raise
+
+        manifest = {
+            "merkleRoot": tree.root.hex(),
+            "anchors": anchors,
+            "count": len(cert_ids),
+            "format": "packed" if pack is not None else "objects",
+            "signedOn": datetime.datetime.now(tz=pytz.utc).isoformat()
+        }
+        await self.uploader.upload(manifest_key, json.dumps(manifest).encode())
+        return manifest
+
+    async def write_signed(self, prefix: str, cert_ids: List[str], tree: MerkleTree, anchors: List[dict], pack):
+        """Sign each cert and write it out, returning the failed uploads."""
+        failed = {}
+        index = 0
+        async for window in self.windows(prefix):
+            objects = []
+            for cert_id, body in window:
+                # Leaves are matched to certs by position, so both passes
+                # have to see the same certs in the same order.
+                if index >= len(cert_ids) or cert_ids[index] != cert_id:
+                    raise SigningError("The batch changed while it was being signed", {})
+                cert = json.loads(body)
+                cert["signature"] = signature(tree, index, anchors)
+                objects.append((cert_id, json.dumps(cert).encode()))
+                index += 1
+            if pack is not None:
+                for cert_id, signed in objects:
+                    await pack.add(cert_id, signed)
+            else:
+                report = await self.uploader.upload_many(
+                    [(signed_cert_path(cert_id), signed) for cert_id, signed in objects],
+                    public=True
+                )
+                failed.update(report.failed)
+            if self.on_progress:
+                await self.on_progress(index, len(cert_ids))
+        return failed
+
+    async def unsigned_certs(self, prefix: str):
+        """Yield (cert id, body) for every unsigned cert in the batch.
+
+        Loose per-cert objects come first, read SIGNING_CONCURRENCY at a
+        time, then each pack in one sequential read.
+        """
+        keys = [key async for key in self.storage.list(f"{prefix}unsigned/")]
+        for start in range(0, len(keys), WINDOW):
+            window = keys[start:start + WINDOW]
+            bodies = await self.gather(self.storage.get, window)
+            for key, body in zip(window, bodies):
+                yield cert_id_from_key(key), body
+        for index_key in await list_packs(self.storage, f"{prefix}packs/"):
+            index = await read_index(self.storage, index_key)
+            async for cert in iter_pack(self.storage, index):
+                yield cert
+
+    async def windows(self, prefix: str):
+        window = []
+        async for cert in self.unsigned_certs(prefix):
+            window.append(cert)
+            if len(window) >= WINDOW:
+                yield window
+                window = []
+        if window:
+            yield window
+
+    async def gather(self, func, items):
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def bounded(item):
+            async with semaphore:
+                return await func(item)
+
+        return await asyncio.gather(*map(bounded, items))
+
+
+async def run_signing_job(job: JobInDB, store: JobStore):
+    async def progress(signed: int, total: int):
+        job.total = total
+        # processed is the signing count; issued stays for issuance jobs.
+        job.processed = signed
+        await store.save(job)
+
+    signer = BatchSigner(on_progress=progress)
+    await signer.sign(job.params["issuer_id"], job.params["date"], force=job.params.get("force", False))
+
+
+runner.register("sign_batch", run_signing_job)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("issuer_id")
+    parser.add_argument("--date", default=today(), help="batch date as YYYYMMDD (default: today, UTC)")
+    parser.add_argument("--force", action="store_true", help="re-sign a batch that already has a manifest")
+    args = parser.parse_args()
+
+    manifest = asyncio.get_event_loop().run_until_complete(
+        BatchSigner().sign(args.issuer_id, args.date, force=args.force)
+    )
+    cert_hasher.shutdown()
+    print(json.dumps(manifest, indent=2) if manifest else "Nothing to sign")
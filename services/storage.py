@@ -0,0 +1,281 @@
+# Standard library imports
+import asyncio
+import functools
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+# Third party imports
+import boto3
+from botocore.config import Config as BotoConfig
+from botocore.exceptions import ClientError, ConnectionError as BotoConnectionError
+
+# Package imports
+from core.config import STORAGE_BACKEND, CERT_BUCKET, LOCAL_STORAGE_PATH, STORAGE_MAX_CONCURRENCY
+from core.metrics import CallMetrics
+from core.tracing import record
+
+
+# Both backends block, so their calls run on a bounded pool of threads. As
+# with DynamoDB, the S3 connection pool is sized to the thread pool.
+executor = ThreadPoolExecutor(
+    max_workers=STORAGE_MAX_CONCURRENCY,
+    thread_name_prefix="storage"
+)
+
+
+async def run_in_executor(func, *args, **kwargs):
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
+
+
+calls = CallMetrics("storage", "Cert storage", ("backend", "operation"))
+
+
+async def measured(backend: str, operation: str, key: str, awaitable):
+    """Await a storage call, recording it in the metrics and the request's trace."""
+    started = time.perf_counter()
+    try:
+        return await calls.measure((backend, operation), awaitable)
+    finally:
+        record("storage", backend, operation, key, started)
+
+
+async def call(backend: str, operation: str, key: str, func, *args, **kwargs):
+    return await measured(backend, operation, key, run_in_executor(func, *args, **kwargs))
+
+
+RETRYABLE_CODES = ("SlowDown", "RequestTimeout", "InternalError", "ServiceUnavailable", "Throttling")
+
+
+def is_retryable(error: Exception):
+    if isinstance(error, BotoConnectionError):
+        return True
+    if not isinstance(error, ClientError):
+        return False
+    status = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0)
+    return error.response.get("Error", {}).get("Code") in RETRYABLE_CODES or status >= 500
+
+
+class S3Storage:
+
+    def __init__(self, bucket_name: str = CERT_BUCKET):
+        self.bucket_name = bucket_name
+        # Write retries are left to the caller (see services.uploader), which
+        # backs off without holding a thread. Reads keep botocore's own
+        # retries, since their callers don't retry.
+        self.client = boto3.client("s3", config=BotoConfig(
+            max_pool_connections=STORAGE_MAX_CONCURRENCY,
+            retries={"max_attempts": 0}
+        ))
+        self.read_client = boto3.client("s3", config=BotoConfig(
+            max_pool_connections=STORAGE_MAX_CONCURRENCY
+        ))
+
+    async def list(self, prefix: str):
+        """Yield every key under prefix, one listing page at a time."""
+        pages = iter(self.read_client.get_paginator("list_objects_v2").paginate(
+            Bucket=self.bucket_name,
+            Prefix=prefix
+        ))
+        while True:
+            page = await call("s3", "list", prefix, next, pages, None)
+            if page is None:
+                return
+            for item in page.get("Contents", []):
+                yield item["Key"]
+
+    async def get(self, key: str):
+        def get_object():
+            return self.read_client.get_object(Bucket=self.bucket_name, Key=key)["Body"].read()
+        return await call("s3", "get", key, get_object)
+
+    async def get_range(self, key: str, start: int, length: int):
+        def get_object():
+            return self.read_client.get_object(
+                Bucket=self.bucket_name,
+                Key=key,
+                Range=f"bytes={start}-{start + length - 1}"
+            )["Body"].read()
+        return await call("s3", "get_range", f"{key}[{start}:{start + length}]", get_object)
+
+    async def exists(self, key: str):
+        # A missing object is an answer, not a failed call.
+        def head_object():
+            try:
+                self.read_client.head_object(Bucket=self.bucket_name, Key=key)
+            except ClientError as error:
+                if error.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+                    return False
+                raise
+            return True
+        return await call("s3", "exists", key, head_object)
+
+    async def put(self, key: str, body: bytes, public: bool = False):
+        extra = {"ACL": "public-read"} if public else {}
+        await call(
+            "s3",
+            "put",
+            key,
+            self.client.put_object,
+            Bucket=self.bucket_name,
+            Key=key,
+            Body=body,
+            ContentType="application/json",
+            **extra
+        )
+
+    async def start_upload(self, key: str, public: bool = False):
+        """Begin a multipart upload to key, returning its upload id."""
+        extra = {"ACL": "public-read"} if public else {}
+        result = await call(
+            "s3",
+            "start_upload",
+            key,
+            self.client.create_multipart_upload,
+            Bucket=self.bucket_name,
+            Key=key,
+            ContentType="application/json",
+            **extra
+        )
+        return result["UploadId"]
+
+    async def put_part(self, key: str, upload_id: str, number: int, body: bytes):
+        """Upload part `number` (from 1) and return its ETag.
+
+        Every part but the last must be at least 5 MiB.
+        """
+        result = await call(
+            "s3",
+            "put_part",
+            f"{key}#{number}",
+            self.client.upload_part,
+            Bucket=self.bucket_name,
+            Key=key,
+            UploadId=upload_id,
+            PartNumber=number,
+            Body=body
+        )
+        return result["ETag"]
+
+    async def complete_upload(self, key: str, upload_id: str, etags: List[str]):
+        await call(
+            "s3",
+            "complete_upload",
+            key,
+            self.client.complete_multipart_upload,
+            Bucket=self.bucket_name,
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={"Parts": [{"ETag": etag, "PartNumber": number} for number, etag in enumerate(etags, 1)]}
+        )
+
+    async def abort_upload(self, key: str, upload_id: str):
+        await call(
+            "s3",
+            "abort_upload",
+            key,
+            self.client.abort_multipart_upload,
+            Bucket=self.bucket_name,
+            Key=key,
+            UploadId=upload_id
+        )
+
+
+class LocalStorage:
+    """Keeps objects as files under a directory, mirroring the S3 key layout."""
+
+    def __init__(self, root: str = LOCAL_STORAGE_PATH):
+        self.root = root
+
+    def path(self, key: str):
+        return os.path.join(self.root, *key.split("/"))
+
+    async def list(self, prefix: str):
+        def walk():
+            keys = []
+            for parent, _, files in os.walk(os.path.dirname(self.path(prefix))):
+                for name in files:
+                    key = os.path.relpath(os.path.join(parent, name), self.root).replace(os.sep, "/")
+                    if key.startswith(prefix) and not key.endswith(".part"):
+                        keys.append(key)
+            return sorted(keys)
+        for key in await call("local", "list", prefix, walk):
+            yield key
+
+    async def get(self, key: str):
+        def read():
+            with open(self.path(key), "rb") as stored:
+                return stored.read()
+        return await call("local", "get", key, read)
+
+    async def get_range(self, key: str, start: int, length: int):
+        def read():
+            with open(self.path(key), "rb") as stored:
+                stored.seek(start)
+                return stored.read(length)
+        return await call("local", "get_range", f"{key}[{start}:{start + length}]", read)
+
+    async def exists(self, key: str):
+        return os.path.exists(self.path(key))
+
+    async def put(self, key: str, body: bytes, public: bool = False):
+        def write():
+            path = self.path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename so readers never see a partial object.
+            with open(path + ".part", "wb") as stored:
+                stored.write(body)
+            os.replace(path + ".part", path)
+        await call("local", "put", key, write)
+
+    # Multipart uploads keep each part in its own .part file until the
+    # upload is completed.
+    def part_path(self, key: str, upload_id: str, number: int):
+        return f"{self.path(key)}.{upload_id}.{number}.part"
+
+    async def start_upload(self, key: str, public: bool = False):
+        return uuid.uuid4().hex
+
+    async def put_part(self, key: str, upload_id: str, number: int, body: bytes):
+        def write():
+            path = self.part_path(key, upload_id, number)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as stored:
+                stored.write(body)
+        await call("local", "put_part", f"{key}#{number}", write)
+        return str(number)
+
+    async def complete_upload(self, key: str, upload_id: str, etags: List[str]):
+        def write():
+            path = self.path(key)
+            with open(path + ".part", "wb") as stored:
+                for number in range(1, len(etags) + 1):
+                    with open(self.part_path(key, upload_id, number), "rb") as part:
+                        stored.write(part.read())
+            os.replace(path + ".part", path)
+            for number in range(1, len(etags) + 1):
+                os.remove(self.part_path(key, upload_id, number))
+        await call("local", "complete_upload", key, write)
+
+    async def abort_upload(self, key: str, upload_id: str):
+        def remove():
+            prefix = f"{os.path.basename(self.path(key))}.{upload_id}."
+            directory = os.path.dirname(self.path(key))
+            for name in os.listdir(directory) if os.path.isdir(directory) else ():
+                if name.startswith(prefix) and name.endswith(".part"):
+                    os.remove(os.path.join(directory, name))
+        await call("local", "abort_upload", key, remove)
+
+
+def get_storage(name: str = STORAGE_BACKEND):
+    backends = {
+        "s3": S3Storage,
+        "local": LocalStorage
+    }
+    return backends[name]()
+
+
+storage = get_storage()
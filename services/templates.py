@@ -0,0 +1,34 @@
+# Third party imports
+from jinja2 import Environment, FileSystemLoader
+
+# Package imports
+from core.config import API_URL
+
+
+def static_url(name: str, path: str):
+    # Stand-in for starlette's url_for so templates render outside of a request.
+    # Emails need absolute links anyway.
+    return f"{API_URL}/{name}/{path.lstrip('/')}"
+
+
+env = Environment(loader=FileSystemLoader("templates"), autoescape=True)
+env.globals["url_for"] = static_url
+
+# Compiled once at import; every render reuses it.
+invite_template = env.get_template("invite.html")
+
+
+def invite_context(issuer_id: str, nonce: str):
+    return {
+        "issuer_url": f"{API_URL}/issuers/{issuer_id}/profile",
+        "nonce": nonce
+    }
+
+
+def render_invite(issuer_id: str, nonce: str):
+    return invite_template.render(invite_context(issuer_id, nonce))
+
+
+def render_invite_template():
+    """Render the invite with SES's own {{placeholders}} left in place."""
+    return invite_template.render(issuer_url="{{issuer_url}}", nonce="{{nonce}}")
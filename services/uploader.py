@@ -0,0 +1,79 @@
+# Standard library imports
+import asyncio
+import logging
+from typing import Dict, List, NamedTuple, Tuple
+
+# Package imports
+from core.config import STORAGE_MAX_CONCURRENCY, UPLOAD_MAX_RETRIES
+from core.retry import with_backoff
+from services.storage import storage as default_storage, is_retryable
+
+
+logger = logging.getLogger(__name__)
+
+
+class UploadReport(NamedTuple):
+    uploaded: int
+    failed: Dict[str, str]
+
+
+class Uploader:
+    """Puts objects through the storage backend with bounded concurrency.
+
+    Throttling (SlowDown), 5xx responses and dropped connections are retried
+    with jittered exponential backoff. The semaphore rather than the thread
+    pool is what waits, so a backing-off upload doesn't hold a thread.
+    """
+
+    def __init__(
+        self,
+        storage=None,
+        concurrency: int = STORAGE_MAX_CONCURRENCY,
+        max_retries: int = UPLOAD_MAX_RETRIES
+    ):
+        self.storage = storage or default_storage
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.semaphore = None
+
+    def get_semaphore(self):
+        # Created lazily so it binds to the running loop.
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.concurrency)
+        return self.semaphore
+
+    async def upload(self, key: str, body: bytes, public: bool = False):
+        return await self.retry(self.storage.put, key, body, public=public)
+
+    async def retry(self, operation, *args, **kwargs):
+        """Await a storage write, such as one part of a multipart upload, with retries."""
+        async def attempt():
+            async with self.get_semaphore():
+                return await operation(*args, **kwargs)
+        return await with_backoff(attempt, is_retryable, self.max_retries)
+
+    async def upload_many(self, objects: List[Tuple[str, bytes]], public: bool = False, on_progress=None):
+        """Upload every (key, body) pair and report which ones failed.
+
+        on_progress, if given, is awaited with (done, total) after each upload.
+        """
+        total = len(objects)
+        done = 0
+        failed = {}
+
+        async def upload_one(key, body):
+            nonlocal done
+            try:
+                await self.upload(key, body, public)
+            except Exception as error:
+                logger.warning("Upload of %s failed: %s", key, error)
+                failed[key] = str(error) or error.__class__.__name__
+            done += 1
+            if on_progress:
+                await on_progress(done, total)
+
+        await asyncio.gather(*(upload_one(key, body) for key, body in objects))
+        return UploadReport(uploaded=total - len(failed), failed=failed)
+
+
+uploader = Uploader()